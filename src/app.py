@@ -1,12 +1,21 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
+import json
 from os import getenv
+import queue
 import time
-from typing import Literal
 
 from flask_cors import CORS
 
 from dotenv import load_dotenv
-from flask import Flask, current_app, jsonify, make_response, request, g as app_ctx
+from flask import (
+    Flask,
+    Response,
+    current_app,
+    jsonify,
+    make_response,
+    request,
+    g as app_ctx,
+)
 from flask_jwt_extended import (
     JWTManager,
     create_access_token,
@@ -16,6 +25,7 @@ from flask_jwt_extended import (
 from flask_restful import Api, Resource
 from sheet import Sheet
 import logging
+import metrics
 
 load_dotenv()
 
@@ -36,6 +46,7 @@ jwt = JWTManager(app)
 def logging_before():
     # Store the start time for the request
     app_ctx.start_time = time.perf_counter()
+    metrics.startRequest()
 
 
 @app.after_request
@@ -43,10 +54,22 @@ def logging_after(response):
     # Get total time in milliseconds
     total_time = time.perf_counter() - app_ctx.start_time
     time_in_ms = int(total_time * 1000)
+    upstream_calls = metrics.requestCalls()
     # Log the time taken for the endpoint
     current_app.logger.info(
-        "%s ms %s %s %s", time_in_ms, request.method, request.path, dict(request.args)
+        "%s ms %s %s %s upstream=%s",
+        time_in_ms,
+        request.method,
+        request.path,
+        dict(request.args),
+        upstream_calls,
     )
+    # label by route, not path, so /scores/<team_name> is one series
+    endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+    metrics.http_requests.inc(request.method, endpoint, response.status_code)
+    metrics.http_latency.observe(total_time, request.method, endpoint)
+    metrics.request_upstream_calls.observe(upstream_calls, request.method, endpoint)
+    metrics.registry.dump()
     return response
 
 
@@ -110,6 +133,38 @@ class CreateTeam(Resource):
         return make_response(jsonify(resp), int(resp["status"]))
 
 
+class CreateTeams(Resource):
+    """
+    Serves the "/create_teams" endpoint with method(s): [POST]
+
+    Registers many teams at once. All new teams are written to the Google Sheet backend
+    in a single request, so use this instead of looping over "/create_team".
+
+    URL Parameters (repeat both once per team, in the same order):
+        - team_name: str
+            - The name of a team you want to create.
+
+        - captain_name: str
+            - The captain of that team.
+
+    Response:
+        - 200 -> [{message, token, team_name, status}] one entry per team, where status is
+            200 (created), 304 (already exists) or 403 (bad name)
+
+        - 403 -> Mismatched number of team and captain names
+    """
+
+    @jwt_required()
+    def post(self):
+        args = request.args
+        team_names = args.getlist("team_name")
+        captain_names = args.getlist("captain_name")
+        if len(team_names) != len(captain_names):
+            return {"message": "need one captain_name per team_name"}, 403
+        resp = sheet.createTeams(list(zip(team_names, captain_names)))
+        return resp, 200
+
+
 class CreateEvent(Resource):
     """
     Serves the "/create_event" endpoint with method(s): [POST]
@@ -275,17 +330,175 @@ class GetScoreboard(Resource):
 
     Sets the current score for a team for a specific event.
 
+    The body is serialized (and gzipped) once per scoreboard snapshot. Responses carry an
+    `ETag` and `Last-Modified`, so send `If-None-Match`/`If-Modified-Since` when polling.
+
+    URL Parameters:
+        - since: int (optional)
+            - A scoreboard version you already have; only what changed after it is returned.
+              Start with since=0 to get the whole scoreboard and its version.
+
     Response:
         - scoreboard -> Just look at it, it's a mess, but it's a scoreboard.
             - Here's an example of the output v.s the actual sheet (https://prnt.sc/6EJa_TqCoO8f)
 
+        - With `since` -> {full: false, version, teams: [`team`], events: [`event`], changes: [[team, event, score]]}
+            - Teams and events added after `since` (their scores are 0 unless listed in
+              changes) and the cells that changed. Keep `version` for the next request.
+
+        - With `since`, when the changes aren't known -> {full: true, version, fetched_at, teams, events, scores}
+            - The whole scoreboard, as the "scoreboard" event of "/stream".
+
+        - 304 -> Scoreboard hasn't changed since your last request
+
+        - 403 -> Bad `since`
+
         - Else -> Something Went Wrong
     """
 
     def get(self):
-        scoreboard = sheet.getScoreboard()
-        assert type(scoreboard) is not Literal[False]
-        return scoreboard.to_json(orient="records")
+        if "since" in request.args:
+            try:
+                since = int(request.args["since"])
+            except ValueError:
+                return {"message": "bad argument since"}, 403
+            if since < 0:
+                return {"message": "bad argument since"}, 403
+            return sheet.getScoreboardChanges(since), 200
+
+        scoreboard = sheet.getScoreboardBody()
+        last_modified = datetime.fromtimestamp(int(scoreboard.last_modified), timezone.utc)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(scoreboard.etag)
+        else:
+            not_modified = (
+                request.if_modified_since is not None
+                and request.if_modified_since >= last_modified
+            )
+
+        if not_modified:
+            res = make_response("", 304)
+        elif request.accept_encodings["gzip"]:
+            res = make_response(scoreboard.gzip_body, 200)
+            res.headers["Content-Encoding"] = "gzip"
+        else:
+            res = make_response(scoreboard.body, 200)
+        res.set_etag(scoreboard.etag)
+        res.last_modified = last_modified
+        res.vary.add("Accept-Encoding")
+        res.mimetype = "application/json"
+        return res
+
+
+class Ready(Resource):
+    """
+    Serves the "/ready" endpoint with method(s): [GET]
+
+    Readiness probe for the reverse proxy. A worker answers requests as soon as it
+    starts, but only serves them from memory once it has opened its worksheets and
+    warmed its caches in the background.
+
+    Response:
+        - 200 -> {ready: true}
+
+        - 503 -> {ready: false}, still warming up
+    """
+
+    def get(self):
+        if sheet.isReady():
+            return {"ready": True}, 200
+        return {"ready": False}, 503
+
+
+class GetLeaderboard(Resource):
+    """
+    Serves the "/leaderboard" endpoint with method(s): [GET]
+
+    Returns the teams ranked by total score, without sending the whole scoreboard.
+
+    URL Parameters:
+        - top: int (optional)
+            - How many teams to return, from first place down. Defaults to 10.
+
+        - team_name: str (optional)
+            - Also return this team's rank and total, wherever it places.
+
+    Response:
+        - 200 -> {version, leaderboard: [{rank, team, total}], team: {rank, team, total} | null}
+            - Teams with the same total share a rank. `team` is only there with `team_name`.
+
+        - 403 -> Bad `top`
+    """
+
+    kDEFAULT_TOP = 10
+
+    def get(self):
+        try:
+            top = int(request.args.get("top", GetLeaderboard.kDEFAULT_TOP))
+        except ValueError:
+            return {"message": "bad argument top"}, 403
+        if top < 1:
+            return {"message": "bad argument top"}, 403
+        return sheet.getLeaderboard(top, request.args.get("team_name")), 200
+
+
+class StreamScores(Resource):
+    """
+    Serves the "/stream" endpoint with method(s): [GET]
+
+    Server-Sent Events stream of the scoreboard, use it with `new EventSource(url)`
+    instead of polling "/scoreboard" and "/get_graph".
+
+    Events:
+        - scoreboard -> {version, fetched_at, teams: [`team`], events: [`event`], scores: [[`int`]]}
+            - scores[i][j] is the score of teams[j] in events[i]. Sent on connect, every
+              30 seconds, and when a refetch or a new team or event changes the layout.
+
+        - score -> {type, version, time, team, event, score, total}
+            - Sent as each score changes. Skip ones with a version at or below the last
+              scoreboard's.
+
+    The server closes the stream every few minutes; EventSource reconnects by itself.
+
+    Response:
+        - 503 -> Too many streams open on this worker, poll "/scoreboard" or retry
+          after Retry-After seconds
+    """
+
+    kHEARTBEAT = 15  # seconds of silence before a keepalive comment
+    kMAX_DURATION = 300  # seconds before the stream is closed so the worker thread frees up
+    kRETRY_AFTER = 30  # seconds a client turned away should wait before reconnecting
+
+    def get(self):
+        subscriber = sheet.subscribeScores()
+        if subscriber is None:
+            return (
+                {"message": "too many streams open, try again later"},
+                503,
+                {"Retry-After": str(StreamScores.kRETRY_AFTER)},
+            )
+
+        def stream():
+            deadline = time.time() + StreamScores.kMAX_DURATION
+            try:
+                yield "retry: 2000\n\n"
+                while time.time() < deadline:
+                    try:
+                        message = subscriber.get(timeout=StreamScores.kHEARTBEAT)
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+                        continue
+                    if message is None:
+                        return  # dropped for falling behind
+                    name, data = message
+                    yield f"event: {name}\nid: {data['version']}\ndata: {json.dumps(data)}\n\n"
+            finally:
+                sheet.unsubscribeScores(subscriber)
+
+        res = Response(stream(), mimetype="text/event-stream")
+        res.headers["Cache-Control"] = "no-cache"
+        res.headers["X-Accel-Buffering"] = "no"
+        return res
 
 
 class GetTeamFromToken(Resource):
@@ -321,15 +534,26 @@ class GetGraphData(Resource):
 
     Return some graph data. Only checks ('adjust_score') method for plotting.
 
+    URL Parameters:
+        - since: int (optional)
+            - The `cursor` from a previous response, only points added after it are returned.
+
     Response:
         - 200 -> Some graph data
-            - {xs: {`team_name0`: [`times`], }, ys: {`team_name0`: [`scores`]}, teams: [`teams`]}
+            - {xs: {`team_name0`: [`times`], }, ys: {`team_name0`: [`scores`]}, teams: [`teams`], cursor: `int`}
+
+        - 403 -> Bad `since`
 
         - Else -> Something Went Wrong
     """
 
     def get(self):
-        resp = sheet.getGraph()
+        args = request.args
+        try:
+            since = int(args.get("since", 0))
+        except ValueError:
+            return {"message": "bad argument since"}, 403
+        resp = sheet.getGraph(since)
         return resp, 200
 
 
@@ -342,6 +566,30 @@ class GetInputIndex(Resource):
 
 
 class GetJudgement(Resource):
+    """
+    Serves the "/get_judgement" endpoint with method(s): [GET]
+
+    Judges a team's output for a problem. With `async=true` the submission is queued and
+    the response carries a job id to poll "/judgement_result" with instead of the verdict.
+
+    URL Parameters:
+        - problem: str
+        - team_name: str
+        - output: str
+        - async: bool (optional)
+
+    Response:
+        - 200 -> {judgement: "True" | "False"}
+
+        - 202 -> {job: `job_id`, status: "queued"} (async)
+
+        - 403 -> Bad input index
+
+        - 404 -> No such problem
+
+        - 503 -> Judging queue is full, try again (async)
+    """
+
     def get(self):
         args = request.args
         problem = args["problem"]
@@ -350,11 +598,113 @@ class GetJudgement(Resource):
         input_idx = sheet.getRandomInputIndexForTeam(100, team_name)
         if input_idx not in range(0, 100):
             return {"judgement": "False", "message": "bad input index"}, 403
+        if not sheet.hasProblem(problem):
+            return {"judgement": "False", "message": "no such problem"}, 404
         output = args["output"].strip()
+        if args.get("async", "false").lower() in ("1", "true"):
+            job_id = sheet.submitJudgement(problem, input_idx, output, team_name)
+            if job_id is None:
+                return {"message": "judging queue is full, try again"}, 503
+            return {"job": job_id, "status": "queued"}, 202
         resp = sheet.getJudgement(problem, input_idx, output, team_name)
+        if resp is None:
+            return {"judgement": "False", "message": "no such problem"}, 404
         return {"judgement": str(resp)}, 200
 
 
+class GetJudgementResult(Resource):
+    """
+    Serves the "/judgement_result" endpoint with method(s): [GET]
+
+    Polls a judgement queued with "/get_judgement?async=true".
+
+    URL Parameters:
+        - job: str
+            - The job id "/get_judgement" returned.
+
+        - wait: float (optional)
+            - Seconds to wait for the verdict before answering (long-poll), at most 30.
+
+    Response:
+        - 200 -> {job, status: "queued" | "running" | "done" | "error", judgement (when done)}
+
+        - 403 -> Bad `wait`
+
+        - 404 -> No such job (or it finished too long ago), or no such problem
+    """
+
+    kMAX_WAIT = 30.0
+
+    def get(self):
+        args = request.args
+        job_id = args["job"]
+        try:
+            wait = min(max(float(args.get("wait", 0)), 0.0), GetJudgementResult.kMAX_WAIT)
+        except ValueError:
+            return {"message": "bad argument wait"}, 403
+        state = sheet.getJudgementResult(job_id, wait)
+        if state is None:
+            return {"job": job_id, "message": "no such job"}, 404
+        resp = {"job": job_id, "status": state["status"]}
+        if state["status"] == "done":
+            if state["result"] is None:
+                return {**resp, "message": "no such problem"}, 404
+            resp["judgement"] = str(state["result"])
+        return resp, 200
+
+
+class GetWriteQueue(Resource):
+    """
+    Serves the "/write_queue" endpoint with method(s): [GET]
+
+    Returns how many rows are waiting to be appended to the sheet, in total and per worksheet.
+
+    Response:
+        - 200 -> {queued: `int`, buffered: {`worksheet`: `int`}, total: `int`}
+    """
+
+    def get(self):
+        return sheet.getWriteQueueDepth(), 200
+
+
+class Metrics(Resource):
+    """
+    Serves the "/metrics" endpoint with method(s): [GET]
+
+    Prometheus metrics summed over every worker: Google Sheets calls and latency by
+    worksheet and operation, scoreboard cache hits, and per-endpoint request counts,
+    latency and Sheets calls per request.
+
+    Response:
+        - 200 -> Prometheus text exposition format
+    """
+
+    def get(self):
+        res = make_response(metrics.registry.render(), 200)
+        res.mimetype = "text/plain"
+        res.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+        return res
+
+
+class RefreshAnswers(Resource):
+    """
+    Serves the "/refresh_answers" endpoint with method(s): [POST]
+
+    Re-downloads the problem answer keys (p1..p5). Answers are otherwise cached
+    and only refetched every few minutes, so use this after editing a problem sheet.
+
+    Response:
+        - 200 -> Answers Refreshed
+
+        - Else -> Something Went Wrong
+    """
+
+    @jwt_required()
+    def post(self):
+        resp = sheet.refreshAnswers()
+        return resp
+
+
 class GetPastSubmissions(Resource):
     def get(self):
         args = request.args
@@ -400,6 +750,25 @@ class GetToken(Resource):
         return {"token": resp}, 200
 
 
+class RefreshTokens(Resource):
+    """
+    Serves the "/refresh_tokens" endpoint with method(s): [POST]
+
+    Re-downloads the tokens sheet. Tokens are otherwise kept in memory and only
+    reloaded when a lookup misses, so use this after editing the sheet by hand.
+
+    Response:
+        - 200 -> Tokens Refreshed
+
+        - Else -> Something Went Wrong
+    """
+
+    @jwt_required()
+    def post(self):
+        resp = sheet.refreshTokens()
+        return resp
+
+
 class CheckFlag(Resource):
     def get(self):
         args = request.args
@@ -418,6 +787,25 @@ class CheckFlag(Resource):
         return {"message": "correct"}, 200
 
 
+class RefreshFlags(Resource):
+    """
+    Serves the "/refresh_flags" endpoint with method(s): [POST]
+
+    Drops the cached CTF flags so the next flag check refetches the ctf sheet.
+    Flags are otherwise only refetched every few minutes.
+
+    Response:
+        - 200 -> Flags Refreshed
+
+        - Else -> Something Went Wrong
+    """
+
+    @jwt_required()
+    def post(self):
+        resp = sheet.refreshFlags()
+        return resp
+
+
 class CheckSolvedFlags(Resource):
     def get(self):
         args = request.args
@@ -431,7 +819,9 @@ class CheckSolvedFlags(Resource):
 api.add_resource(Home, "/")
 api.add_resource(Login, "/login")
 api.add_resource(Docs, "/docs")
+api.add_resource(Ready, "/ready")
 api.add_resource(CreateTeam, "/create_team")
+api.add_resource(CreateTeams, "/create_teams")
 api.add_resource(CreateEvent, "/create_event")
 api.add_resource(GetScores, "/scores/<team_name>")
 api.add_resource(GetScore, "/scores/<team_name>/<event_name>")
@@ -439,16 +829,24 @@ api.add_resource(SetScore, "/set_score")
 api.add_resource(AdjustScore, "/adjust_score")
 # api.add_resource(ChangeTeamName, "/change_team_name")
 api.add_resource(GetScoreboard, "/scoreboard")
+api.add_resource(GetLeaderboard, "/leaderboard")
+api.add_resource(StreamScores, "/stream")
 api.add_resource(GetTeamFromToken, "/token_lookup")
 api.add_resource(GetGraphData, "/get_graph")
 api.add_resource(GetInputIndex, "/get_index")
 api.add_resource(GetJudgement, "/get_judgement")
+api.add_resource(GetJudgementResult, "/judgement_result")
+api.add_resource(RefreshAnswers, "/refresh_answers")
+api.add_resource(GetWriteQueue, "/write_queue")
+api.add_resource(Metrics, "/metrics")
 api.add_resource(GetPastSubmissions, "/get_submissions")
 api.add_resource(JoinTeam, "/join_team")
 api.add_resource(LeaveTeam, "/leave_team")
 api.add_resource(GetToken, "/get_token")
+api.add_resource(RefreshTokens, "/refresh_tokens")
 api.add_resource(CheckFlag, "/check_flag")
 api.add_resource(CheckSolvedFlags, "/check_solved_flags")
+api.add_resource(RefreshFlags, "/refresh_flags")
 
 
 if __name__ == "__main__":
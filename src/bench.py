@@ -0,0 +1,259 @@
+"""
+Per-endpoint benchmark against the in-process Sheets emulator.
+
+Drives every resource in app.py and reports wall time plus the number of
+upstream (Sheets) calls each endpoint makes. Run from src/:
+
+    python3 bench.py                          # print the table
+    python3 bench.py --latency 0.2            # pretend every Sheets call takes 200ms
+    python3 bench.py --save bench_baseline.json
+    python3 bench.py --check bench_baseline.json   # exit 1 if an endpoint got chattier
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, NamedTuple
+
+kSCRATCH = tempfile.mkdtemp(prefix="acmmm-bench-")
+# must be set before app/sheet read them
+os.environ["STORAGE"] = "emulator"
+os.environ["SCOREBOARD_SNAPSHOT"] = os.path.join(kSCRATCH, "scoreboard")
+os.environ["LOG_JOURNAL"] = os.path.join(kSCRATCH, "journal.jsonl")
+os.environ["METRICS_DIR"] = os.path.join(kSCRATCH, "metrics")
+os.environ["JOBS_DIR"] = os.path.join(kSCRATCH, "jobs")
+os.environ["SCORE_EVENTS"] = os.path.join(kSCRATCH, "events")
+os.environ["SOLVES_LEDGER"] = os.path.join(kSCRATCH, "solves")
+os.environ["CACHE_SNAPSHOT"] = os.path.join(kSCRATCH, "cache.bin")
+os.environ["ROOT_USERNAME"] = "bench"
+os.environ["ROOT_PASSWORD"] = "bench"
+os.environ.setdefault("JWT_SECRET_KEY", "bench")
+os.environ.setdefault("SECRET_HASH_APPEND", "bench")
+os.environ.setdefault("CTF_BASE_SCORE", "100")
+os.environ.setdefault("CTF_USE_COEFF", "True")
+os.environ.setdefault(
+    "POINTS",
+    json.dumps({f"{p}{part}": 100 * p for p in range(1, 6) for part in "ab"}),
+)
+
+
+class Endpoint(NamedTuple):
+    name: str
+    method: str
+    path: Callable[[int], str]  # iteration -> path
+    params: Callable[[int], dict]  # iteration -> query string
+    admin: bool = False
+    stream: bool = False  # read the first events, then hang up
+
+
+class Startup(NamedTuple):
+    import_ms: float  # until app is imported and can take requests
+    ready_ms: float  # until the background warm-up has caught up
+    calls: int
+
+
+class Result(NamedTuple):
+    name: str
+    requests: int
+    errors: int
+    mean_ms: float
+    max_ms: float
+    calls: int
+    operations: dict[str, int]
+
+    @property
+    def calls_per_request(self) -> float:
+        return self.calls / self.requests
+
+
+def endpoints(sheet) -> list[Endpoint]:
+    from emulator import answerFor, flagFor, teamName, tokenFor
+
+    def team(i: int) -> str:
+        return teamName(i % 20)
+
+    def judgement(i: int) -> dict:
+        problem_number, part = i % 5 + 1, "ab"[i % 2]
+        input_idx = sheet.getRandomInputIndexForTeam(100, team(i))
+        output = answerFor(problem_number, part, input_idx) if i % 3 else "wrong"
+        return {"problem": f"{problem_number}{part}", "team_name": team(i), "output": output}
+
+    def queued(i: int) -> dict:
+        params = judgement(i)
+        input_idx = sheet.getRandomInputIndexForTeam(100, params["team_name"])
+        job_id = sheet.submitJudgement(
+            params["problem"], input_idx, params["output"], params["team_name"]
+        )
+        return {"job": job_id, "wait": 10}
+
+    def flag(i: int) -> dict:
+        flag = flagFor("web", i % 5) if i % 2 else "flag{nope}"
+        return {"category": "web", "problem_idx": i % 5, "flag": flag, "team_name": team(i)}
+
+    def const(path: str) -> Callable[[int], str]:
+        return lambda i: path
+
+    def none(i: int) -> dict:
+        return {}
+
+    return [
+        Endpoint("/", "GET", const("/"), none),
+        Endpoint("/scoreboard", "GET", const("/scoreboard"), none),
+        Endpoint("/scoreboard?since", "GET", const("/scoreboard"), lambda i: {"since": sheet._snapshot.read().seq - i % 3}),
+        Endpoint("/leaderboard", "GET", const("/leaderboard"), lambda i: {"top": 5, "team_name": team(i)}),
+        Endpoint("/stream", "GET", const("/stream"), none, stream=True),
+        Endpoint("/scores/<team>", "GET", lambda i: f"/scores/{team(i)}", none),
+        Endpoint("/scores/<team>/<event>", "GET", lambda i: f"/scores/{team(i)}/woc{i % 5}", none),
+        Endpoint("/token_lookup", "GET", const("/token_lookup"), lambda i: {"token": tokenFor(i % 20)}),
+        Endpoint("/get_token", "GET", const("/get_token"), lambda i: {"team_name": team(i)}),
+        Endpoint("/get_graph", "GET", const("/get_graph"), none),
+        Endpoint("/get_index", "GET", const("/get_index"), lambda i: {"team_name": team(i)}),
+        Endpoint("/get_judgement", "GET", const("/get_judgement"), judgement),
+        Endpoint("/get_judgement?async", "GET", const("/get_judgement"), lambda i: {**judgement(i), "async": "true"}),
+        Endpoint("/judgement_result", "GET", const("/judgement_result"), queued),
+        Endpoint("/get_submissions", "GET", const("/get_submissions"), lambda i: {"team_name": team(i), "problem": "1a"}),
+        Endpoint("/check_flag", "GET", const("/check_flag"), flag),
+        Endpoint("/check_solved_flags", "GET", const("/check_solved_flags"), lambda i: {"category": "web", "team_name": team(i)}),
+        Endpoint("/join_team", "GET", const("/join_team"), lambda i: {"token": tokenFor(i % 20), "member_name": f"member{i}"}),
+        Endpoint("/leave_team", "GET", const("/leave_team"), lambda i: {"team_name": team(i), "member_name": f"member{i}"}),
+        Endpoint("/create_team", "GET", const("/create_team"), lambda i: {"team_name": teamName(1000 + i), "captain_name": f"captain{i}"}),
+        Endpoint("/create_teams", "POST", const("/create_teams"), lambda i: {"team_name": [teamName(2000 + 2 * i), teamName(2001 + 2 * i)], "captain_name": ["capone", "captwo"]}, admin=True),
+        Endpoint("/create_event", "POST", const("/create_event"), lambda i: {"event_name": f"bench{i}"}, admin=True),
+        Endpoint("/set_score", "POST", const("/set_score"), lambda i: {"team_name": team(i), "event_name": "hackathon", "score": i}, admin=True),
+        Endpoint("/adjust_score", "POST", const("/adjust_score"), lambda i: {"team_name": team(i), "event_name": "hackathon", "delta": 1}, admin=True),
+        Endpoint("/write_queue", "GET", const("/write_queue"), none),
+        Endpoint("/metrics", "GET", const("/metrics"), none),
+        Endpoint("/refresh_answers", "POST", const("/refresh_answers"), none, admin=True),
+        Endpoint("/refresh_tokens", "POST", const("/refresh_tokens"), none, admin=True),
+        Endpoint("/refresh_flags", "POST", const("/refresh_flags"), none, admin=True),
+        Endpoint("/docs", "GET", const("/docs"), none),
+        Endpoint("/ready", "GET", const("/ready"), none),
+    ]
+
+
+def settle(sheet):
+    """Wait for background judging, writes and scoreboard refreshes so their calls count for this endpoint"""
+    while sheet._judging.getQueueDepth():
+        time.sleep(0.01)
+    sheet._writer.flush()
+    sheet._logger.flush()
+    with sheet._refresh_lock:
+        pass
+
+
+def run(repeat: int) -> tuple[Startup, list[Result]]:
+    start = time.perf_counter()
+    import app as app_module
+
+    imported = time.perf_counter()
+    sheet = app_module.sheet
+    sheet.waitCaughtUp()
+    spreadsheet = sheet._client.sheet
+    startup = Startup(
+        1000 * (imported - start),
+        1000 * (time.perf_counter() - start),
+        sum(spreadsheet.getCalls().values()),
+    )
+    client = app_module.app.test_client()
+    login = client.post("/login", query_string={"username": "bench", "password": "bench"})
+    auth = {"Authorization": f"Bearer {login.get_json()['access_token']}"}
+    settle(sheet)
+
+    def send(endpoint: Endpoint, i: int) -> int:
+        response = client.open(
+            endpoint.path(i),
+            method=endpoint.method,
+            query_string=endpoint.params(i),
+            headers=auth if endpoint.admin else {},
+            buffered=not endpoint.stream,
+        )
+        if endpoint.stream:
+            chunks = iter(response.response)
+            next(chunks)  # retry interval
+            next(chunks)  # the full scoreboard
+            response.close()
+        return response.status_code
+
+    results = []
+    for endpoint in endpoints(sheet):
+        # one request first, untimed and uncounted: one-off costs like opening a
+        # worksheet would otherwise be spread over however many requests follow
+        send(endpoint, 0)
+        settle(sheet)
+        spreadsheet.resetCalls()
+        errors = 0
+        timings = []
+        for i in range(1, repeat + 1):
+            start = time.perf_counter()
+            status = send(endpoint, i)
+            timings.append(time.perf_counter() - start)
+            errors += status >= 500
+        settle(sheet)
+        calls = spreadsheet.getCalls()
+        results.append(
+            Result(
+                endpoint.name,
+                repeat,
+                errors,
+                1000 * sum(timings) / len(timings),
+                1000 * max(timings),
+                sum(calls.values()),
+                {f"{ws}.{op}": n for (ws, op), n in calls.most_common()},
+            )
+        )
+    return startup, results
+
+
+def report(startup: Startup, results: list[Result]):
+    print(
+        f"startup: imported in {startup.import_ms:.0f} ms, ready in {startup.ready_ms:.0f} ms, "
+        f"{startup.calls} upstream calls\n"
+    )
+    print(f"{'endpoint':<24}{'reqs':>6}{'errs':>6}{'mean ms':>10}{'max ms':>10}{'calls/req':>11}  top calls")
+    for r in results:
+        top = ", ".join(f"{op}={n}" for op, n in list(r.operations.items())[:3])
+        print(
+            f"{r.name:<24}{r.requests:>6}{r.errors:>6}{r.mean_ms:>10.1f}{r.max_ms:>10.1f}"
+            f"{r.calls_per_request:>11.2f}  {top}"
+        )
+
+
+def check(baseline_path: str, results: list[Result], tolerance: float) -> bool:
+    """False if any endpoint makes more upstream calls per request than the baseline allows"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["calls_per_request"]
+    ok = True
+    for r in results:
+        allowed = baseline.get(r.name)
+        if allowed is None:
+            print(f"NEW       {r.name}: {r.calls_per_request:.2f} calls/req (not in baseline)")
+        elif r.calls_per_request > allowed + tolerance:
+            print(f"REGRESSED {r.name}: {r.calls_per_request:.2f} calls/req, baseline {allowed:.2f}")
+            ok = False
+        if r.errors:
+            print(f"ERRORS    {r.name}: {r.errors} of {r.requests} requests failed")
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="requests per endpoint")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every Sheets call")
+    parser.add_argument("--save", metavar="PATH", help="write calls/request per endpoint as a baseline")
+    parser.add_argument("--check", metavar="PATH", help="compare calls/request against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="extra calls/request allowed by --check")
+    args = parser.parse_args()
+    os.environ["EMULATOR_LATENCY"] = str(args.latency)
+
+    startup, results = run(args.repeat)
+    report(startup, results)
+    if args.save:
+        with open(args.save, "w") as f:
+            baseline = {r.name: round(r.calls_per_request, 2) for r in results}
+            json.dump({"repeat": args.repeat, "calls_per_request": baseline}, f, indent=2)
+            f.write("\n")
+    if args.check and not check(args.check, results, args.tolerance):
+        sys.exit(1)
@@ -1,30 +1,142 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 import os
+import threading
+from typing import Any, Callable
 
 from dotenv import load_dotenv
-import pygsheets as ps
+
+from emulator import EmulatedSpreadsheet
+from pool import PooledSpreadsheet, SheetsPool
+from scheduler import ScheduledSpreadsheet, Scheduler
+from storage import (
+    InstrumentedSpreadsheet,
+    MirroredSpreadsheet,
+    Spreadsheet,
+    SqliteSpreadsheet,
+    Worksheet,
+    growGrid,
+)
 
 load_dotenv()
 
 
+def openSpreadsheet(creds: str, url_env_path: str) -> Spreadsheet:
+    """
+    Picks the storage backend from the STORAGE env var:
+    "sheets" (default) talks to Google Sheets directly, "sqlite" runs off a local
+    database at SQLITE_PATH, "mirror" runs off the local database and publishes
+    every write to Google Sheets in the background, "emulator" runs off a seeded
+    contest with EMULATOR_LATENCY seconds added to every call, kept in memory or
+    at EMULATOR_PATH if workers need to share it.
+
+    Google Sheets calls are paced to SHEETS_READS_PER_MINUTE/SHEETS_WRITES_PER_MINUTE
+    and spread over SHEETS_CONNECTIONS authorized clients, so request threads
+    don't take turns on one HTTP connection.
+    """
+    backend = os.getenv("STORAGE", "sheets")
+    if backend == "emulator":
+        return EmulatedSpreadsheet(
+            float(os.getenv("EMULATOR_LATENCY", 0)), os.getenv("EMULATOR_PATH", ":memory:")
+        )
+    if backend == "sqlite":
+        return SqliteSpreadsheet(os.getenv("SQLITE_PATH", "contest.db"))
+    remote = ScheduledSpreadsheet(
+        PooledSpreadsheet(
+            SheetsPool(
+                creds,
+                os.getenv(url_env_path),
+                int(os.getenv("SHEETS_CONNECTIONS", 4)),
+            )
+        ),
+        Scheduler(
+            float(os.getenv("SHEETS_READS_PER_MINUTE", 60)),
+            float(os.getenv("SHEETS_WRITES_PER_MINUTE", 60)),
+        ),
+    )
+    if backend == "mirror":
+        local = SqliteSpreadsheet(os.getenv("SQLITE_PATH", "contest.db"))
+        return MirroredSpreadsheet(local, remote)
+    if backend != "sheets":
+        raise ValueError(f"Unknown STORAGE backend {backend!r}")
+    return remote
+
+
+class LazyWorksheet:
+    """
+    Stands in for a worksheet that is only opened when first used. Opening is
+    thread-safe and happens once, after that every call goes straight through.
+    """
+
+    def __init__(self, open: Callable[[], Worksheet]):
+        self._open = open
+        self._worksheet: Worksheet | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Worksheet:
+        if self._worksheet is None:
+            with self._lock:
+                if self._worksheet is None:
+                    self._worksheet = self._open()
+        return self._worksheet
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+    def growGrid(self, rows: int = 0, cols: int = 0):
+        growGrid(self.get(), rows, cols)
+
+
 class Client:
+    """
+    The spreadsheet and its worksheets, opened in the background so constructing
+    a Client (and so a Sheet) doesn't wait on Google. Whatever needs one first
+    waits for it; `openEager` opens the everyday worksheets all at once.
+    """
+
+    kEAGER = ("scoreboard", "log", "tokens", "submissions", "teams")
+    # problems and ctf are only opened on the first judgement/flag check
+
     def __init__(self, creds="creds.json", url_env_path="SHEET_URL"):
-        self.client = ps.authorize(service_file=creds)
-        self.sheet: ps.Spreadsheet = self.client.open_by_url(os.getenv(url_env_path))
-        self.sheets: dict[str, ps.Worksheet | list[ps.Worksheet]] = {
-            "scoreboard": self.sheet.sheet1,
-            "log": self.sheet.worksheet_by_title("log"),
-            "tokens": self.sheet.worksheet_by_title("tokens"),
-            "problems": [
-                self.sheet.worksheet_by_title("p" + str(p)) for p in range(1, 6)
-            ],
-            "submissions": self.sheet.worksheet_by_title("submissions"),
-            "teams": self.sheet.worksheet_by_title("teams"),
-            "ctf": self.sheet.worksheet_by_title("ctf"),
-        }
-        self.scoreboard: ps.Worksheet | list[ps.Worksheet] = self.sheets["scoreboard"]
-        self.tokens: ps.Worksheet | list[ps.Worksheet] = self.sheets["tokens"]
-        self.log: ps.Worksheet | list[ps.Worksheet] = self.sheets["log"]
-        self.problems: ps.Worksheet | list[ps.Worksheet] = self.sheets["problems"]
-        self.submissions: ps.Worksheet | list[ps.Worksheet] = self.sheets["submissions"]
-        self.teams: ps.Worksheet | list[ps.Worksheet] = self.sheets["teams"]
-        self.ctf: ps.Worksheet | list[ps.Worksheet] = self.sheets["ctf"]
+        self._creds = creds
+        self._url_env_path = url_env_path
+        self._opening_lock = threading.Lock()
+        self._opening: Future[Spreadsheet] = self._startOpening()
+        self.scoreboard = LazyWorksheet(lambda: self.sheet.sheet1)
+        self.log = self._worksheet("log")
+        self.tokens = self._worksheet("tokens")
+        self.problems = [self._worksheet(f"p{p}") for p in range(1, 6)]
+        self.submissions = self._worksheet("submissions")
+        self.teams = self._worksheet("teams")
+        self.ctf = self._worksheet("ctf")
+
+    def _startOpening(self) -> Future[Spreadsheet]:
+        opener = ThreadPoolExecutor(1, thread_name_prefix="open")
+        # every call through here is counted and timed, see metrics.py
+        opening = opener.submit(
+            lambda: InstrumentedSpreadsheet(
+                openSpreadsheet(self._creds, self._url_env_path)
+            )
+        )
+        opener.shutdown(wait=False)
+        return opening
+
+    @property
+    def sheet(self) -> Spreadsheet:
+        opening = self._opening
+        try:
+            return opening.result()
+        except Exception:
+            # don't keep handing out the failure, whoever asks next tries again
+            with self._opening_lock:
+                if self._opening is opening:
+                    self._opening = self._startOpening()
+            raise
+
+    def _worksheet(self, title: str) -> LazyWorksheet:
+        return LazyWorksheet(lambda: self.sheet.worksheet_by_title(title))
+
+    def openEager(self):
+        """Open the kEAGER worksheets concurrently rather than one by one on first use"""
+        worksheets = [getattr(self, name) for name in Client.kEAGER]
+        with ThreadPoolExecutor(len(worksheets), thread_name_prefix="open") as pool:
+            list(pool.map(LazyWorksheet.get, worksheets))
@@ -1,7 +1,11 @@
 import logging
 import re
-from pygsheets import Worksheet
+import threading
+import time
+
+from storage import Worksheet
 from gettime import gettime
+from submissions import Submissions
 
 
 # TODO: check prior solve of CTF chall before awarding points
@@ -14,10 +18,60 @@ class CTF:
         "crypto": 4,
         "linux": 5,
     }  # WARNING: use same lookup table for hasPriorSolve-equiv
+    kFLAGS_DELAY = 300  # how often to refetch the flags
 
-    def __init__(self, ctf: Worksheet, submissions: Worksheet):
+    def __init__(self, ctf: Worksheet, submissions: Submissions):
         self.ctf: Worksheet = ctf
-        self.submissions: Worksheet = submissions
+        self.submissions: Submissions = submissions
+        self._flags: dict[str, list[str]] = {}
+        self._flags_fetch_time = 0.0
+        self._load_lock = threading.Lock()
+
+    def loadFlags(self, stale_before: float | None = None):
+        """
+        Download the ctf worksheet into a category -> flags table. With
+        `stale_before`, skip it if another thread has loaded them since then.
+        """
+        with self._load_lock:
+            if stale_before is not None and self._flags_fetch_time > stale_before:
+                return
+            self._loadFlags()
+
+    def _loadFlags(self):
+        values = self.ctf.get_all_values(
+            include_tailing_empty=False, include_tailing_empty_rows=False
+        )
+        flags = {}
+        for category, category_index in CTF.category_to_index.items():
+            col = [
+                row[category_index] if category_index < len(row) else ""
+                for row in values[1:]
+            ]
+            while len(col) and col[-1] == "":
+                col.pop()
+            flags[category] = col
+        self._flags = flags
+        self._flags_fetch_time = time.time()
+
+    def dumpState(self) -> dict | None:
+        """What loadState needs to pick up where this left off, None if never loaded"""
+        if not self._flags_fetch_time:
+            return None
+        return {"fetched_at": self._flags_fetch_time, "flags": self._flags}
+
+    def loadState(self, state: dict):
+        self._flags = state["flags"]
+        self._flags_fetch_time = state["fetched_at"]
+
+    def invalidateFlags(self):
+        """Force the next flag check to refetch the ctf worksheet"""
+        self._flags_fetch_time = 0.0
+
+    def _getFlags(self, category: str) -> list[str]:
+        fetch_time = self._flags_fetch_time
+        if time.time() - fetch_time >= CTF.kFLAGS_DELAY:
+            self.loadFlags(stale_before=fetch_time)
+        return self._flags.get(category, [])
 
     def isFlagCorrect(
         self, category: str, problem_idx: int, flag: str, team_name: str
@@ -30,33 +84,24 @@ class CTF:
             )
             return False  # bad flag
 
-        problems = self.ctf.get_col(category_index + 1, include_tailing_empty=False)[1:]
-        print(problems, problem_idx)
+        problems = self._getFlags(category)
         if problem_idx > len(problems) - 1:
             logging.info(
-                f"Bad problem index for isFlagCorrect {category=}, {category_index=}, {problem_idx=}, {problems=}"
+                f"Bad problem index for isFlagCorrect {category=}, {category_index=}, {problem_idx=}, {len(problems)=}"
             )
             return False  # bad problem index
         problem = f"{category}-{problem_idx}"
         actual_flag = problems[problem_idx]
         result = flag == actual_flag
         row = [gettime(), team_name, problem, str(result), str(0), flag]
-        self.submissions.append_table(row, overwrite=True)  # type: ignore
+        self.submissions.append(row)
         return result
 
     def getSolvedFlags(self, team_name: str, category: str):
-        # iterate through submissions
         solved_idxs = []
-        records = self.submissions.get_all_records()
-        for record in records:
-            team = record["team-name"]
-            problem = record["problem"]
-            result = record["result"]
+        for problem in self.submissions.getSolved(team_name):
             if category not in problem or "-" not in problem:
                 continue  # not the right problem! (ctf category)
-            num = int(problem[problem.index("-") + 1 :])
-
-            if team == team_name and result == "TRUE":
-                solved_idxs.append(num)
+            solved_idxs.append(int(problem[problem.index("-") + 1 :]))
 
-        return solved_idxs
+        return sorted(solved_idxs)
@@ -0,0 +1,186 @@
+from collections import Counter
+import threading
+import time
+from typing import Any
+
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+from pygsheets.utils import format_addr
+
+from storage import BatchRequest, SqliteSpreadsheet, SqliteWorksheet
+
+
+class EmulatedCell:
+    def __init__(self, worksheet: "EmulatedWorksheet", addr):
+        self._worksheet = worksheet
+        self._cell = worksheet._worksheet.cell(addr)
+
+    @property
+    def value(self) -> str:
+        return self._cell.value
+
+    def set_value(self, value):
+        self._worksheet._emulator._call(self._worksheet.title, "cell.set_value")
+        self._cell.set_value(value)
+
+    def set_text_format(self, attribute, value):
+        self._worksheet._emulator._call(self._worksheet.title, "cell.set_text_format")
+
+
+class EmulatedWorksheet:
+    """A SqliteWorksheet where every method call is an upstream call: counted and delayed"""
+
+    # cached metadata in pygsheets, reading them costs no request
+    kFREE = ("title", "id", "growGrid")
+    # calls after which pygsheets knows the worksheet's new grid size
+    kRESIZE = ("refresh", "append_table", "insert_rows", "insert_cols")
+
+    def __init__(self, worksheet: SqliteWorksheet, emulator: "EmulatedSpreadsheet"):
+        self._worksheet = worksheet
+        self._emulator = emulator
+        # the grid size as of opening, like pygsheets: rows appended through
+        # another worksheet object (or worker) only show up after a refresh
+        self._grid = (worksheet.rows, worksheet.cols)
+
+    @property
+    def rows(self) -> int:
+        return self._grid[0]
+
+    @property
+    def cols(self) -> int:
+        return self._grid[1]
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._worksheet, name)
+        if name in EmulatedWorksheet.kFREE or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self._emulator._call(self._worksheet.title, name)
+            result = attr(*args, **kwargs)
+            if name in EmulatedWorksheet.kRESIZE:
+                self._grid = (self._worksheet.rows, self._worksheet.cols)
+            return result
+
+        return call
+
+    def growGrid(self, rows: int = 0, cols: int = 0):
+        self._grid = (self._grid[0] + rows, self._grid[1] + cols)
+
+    def get_values(self, start, end, *args, **kwargs) -> list[list]:
+        self._emulator._call(self._worksheet.title, "get_values")
+        # like Sheets, refuse ranges past the grid (the real one, not our cached size)
+        last_row = (format_addr(end, "tuple") if type(end) is str else end)[0]
+        if last_row is not None and last_row > self._worksheet.rows:
+            raise HttpError(
+                Response({"status": 400}),
+                f"Range exceeds grid limits. Max rows: {self._worksheet.rows}".encode(),
+            )
+        return self._worksheet.get_values(start, end, *args, **kwargs)
+
+    def cell(self, addr) -> EmulatedCell:
+        return EmulatedCell(self, addr)
+
+
+class EmulatedSpreadsheet:
+    """
+    In-process stand-in for the Google Sheet, for benchmarks and local runs.
+
+    Data lives in an in-memory SqliteSpreadsheet seeded with a small contest.
+    Each worksheet call sleeps `latency` seconds (like a Sheets round trip)
+    and is counted per (worksheet, operation), see `getCalls`.
+    """
+
+    def __init__(self, latency: float = 0.0, path: str = ":memory:", teams: int = 20):
+        self.latency = latency
+        self._local = SqliteSpreadsheet(path)
+        self._calls: Counter[tuple[str, str]] = Counter()
+        self._calls_lock = threading.Lock()
+        if self._local.sheet1.rows == 0:
+            seedContest(self._local, teams)
+
+    def _call(self, worksheet: str, operation: str):
+        with self._calls_lock:
+            self._calls[(worksheet, operation)] += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def getCalls(self) -> Counter[tuple[str, str]]:
+        """Upstream calls made so far, keyed by (worksheet, operation)"""
+        with self._calls_lock:
+            return Counter(self._calls)
+
+    def resetCalls(self):
+        with self._calls_lock:
+            self._calls.clear()
+
+    def worksheet_by_title(self, title: str) -> EmulatedWorksheet:
+        self._call(title, "open")
+        return EmulatedWorksheet(self._local.worksheet_by_title(title), self)
+
+    @property
+    def sheet1(self) -> EmulatedWorksheet:
+        self._call("Sheet1", "open")
+        return EmulatedWorksheet(self._local.sheet1, self)
+
+    def custom_request(self, request: BatchRequest | list[BatchRequest], fields=None, **kwargs):
+        self._call("*", "custom_request")
+        return self._local.custom_request(request, fields, **kwargs)
+
+
+kEVENTS = ["woc0", "woc1", "woc2", "woc3", "woc4", "ctf", "hackathon"]
+kCTF_CATEGORIES = ["web", "rev", "forensics", "networking", "crypto", "linux"]
+
+
+def answerFor(problem_number: int, part: str, input_idx: int) -> str:
+    """The expected output seedContest puts in p<problem_number>"""
+    return f"{problem_number}{part}{input_idx * 7 + 3}"
+
+
+def flagFor(category: str, problem_idx: int) -> str:
+    """The flag seedContest puts in the ctf worksheet"""
+    return f"flag{{{category}_{problem_idx}}}"
+
+
+def tokenFor(team_idx: int) -> str:
+    return f"token{team_idx}"
+
+
+def teamName(team_idx: int) -> str:
+    return "team" + "".join(chr(ord("a") + int(d)) for d in str(team_idx))
+
+
+def seedContest(spreadsheet: SqliteSpreadsheet, teams: int = 20, inputs: int = 100):
+    """Fill an empty spreadsheet with the worksheets Client opens, laid out like the real sheet"""
+    team_names = [teamName(t) for t in range(teams)]
+    with spreadsheet.transaction():
+        spreadsheet.worksheet_by_title("Sheet1").update_values(
+            (1, 1), [["-", *team_names], *[[e] + [0] * teams for e in kEVENTS]]
+        )
+        spreadsheet.worksheet_by_title("log").update_values(
+            (1, 1),
+            [["time", "action", "team", "event", "delta", "score", "total", "detail"]],
+        )
+        spreadsheet.worksheet_by_title("tokens").update_values(
+            (1, 1),
+            [["Team Name", "Token"], *[[n, tokenFor(t)] for t, n in enumerate(team_names)]],
+        )
+        for p in range(1, 6):
+            spreadsheet.worksheet_by_title(f"p{p}").update_values(
+                (1, 1),
+                [["a", "b"], *[[answerFor(p, "a", i), answerFor(p, "b", i)] for i in range(inputs)]],
+            )
+        spreadsheet.worksheet_by_title("submissions").update_values(
+            (1, 1), [["time", "team-name", "problem", "result", "input-idx", "output"]]
+        )
+        spreadsheet.worksheet_by_title("teams").update_values(
+            (1, 1),
+            [
+                ["team_name", "captain", *[str(i) for i in range(40)]],
+                *[[n, f"captain{t}"] for t, n in enumerate(team_names)],
+            ],
+        )
+        spreadsheet.worksheet_by_title("ctf").update_values(
+            (1, 1),
+            [kCTF_CATEGORIES, *[[flagFor(c, i) for c in kCTF_CATEGORIES] for i in range(5)]],
+        )
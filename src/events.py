@@ -0,0 +1,330 @@
+from bisect import bisect_right
+from hashlib import sha1
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from typing import Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _defaultPath() -> str:
+    shm = "/dev/shm"
+    directory = shm if os.path.isdir(shm) else tempfile.gettempdir()
+    sheet_hash = sha1(str(os.getenv("SHEET_URL")).encode()).hexdigest()[:8]
+    return os.path.join(directory, f"acmmm-events-{sheet_hash}")
+
+
+def _unseen(records: list[dict], version: int, replaced: bool) -> list[dict]:
+    """
+    `records` read after the one with `version`, without the ones already read.
+    A `replaced` feed hands some back again: they come first, in ascending
+    versions up to `version` (a version going back down is a snapshot reset).
+    """
+    if not replaced:
+        return records
+    previous = 0
+    for idx, record in enumerate(records):
+        if not previous < record["version"] <= version:
+            return records[idx:]
+        previous = record["version"]
+    return []
+
+
+class ScoreEvents:
+    """
+    Append-only feed of scoreboard changes shared by every worker on the machine,
+    one JSON object per line. Appended under the snapshot lock, so lines are
+    in the same order as the changes they describe, one per scoreboard version:
+
+        - {"type": "score", version, time, team, event, score, total}
+            - One score set or adjusted.
+
+        - {"type": "sync", version, time, teams, events, changes, reset}
+            - Teams and events added, and [team, event, score] cells changed, by a
+              refetch or by createTeams/createEvent. `reset` means the layout changed
+              some other way (e.g. a rename) and only a full scoreboard will do.
+
+    Past kMAX_BYTES the appender replaces the file with its last kKEEP_BYTES.
+    Readers hold (inode, offset) cursors, so one still reading the old file
+    starts over at the top of the new one and skips the versions it has seen.
+    """
+
+    kMAX_BYTES = 16 << 20
+    kKEEP_BYTES = 2 << 20
+
+    def __init__(self, path: str | None = None):
+        self.path = path or os.getenv("SCORE_EVENTS") or _defaultPath()
+        self._lock = threading.Lock()  # the fd, swapped when the feed is replaced
+        self._fd = self._open()
+
+    def _open(self) -> int:
+        return os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _current(self) -> tuple[int, int]:
+        """(inode, fd) of the feed at `path`, reopened if it's been replaced, call under _lock"""
+        inode = os.fstat(self._fd).st_ino
+        try:
+            if os.stat(self.path).st_ino == inode:
+                return inode, self._fd
+        except FileNotFoundError:
+            pass  # mid-replace, or cleaned up; _open creates it again
+        os.close(self._fd)
+        self._fd = self._open()
+        return os.fstat(self._fd).st_ino, self._fd
+
+    def append(self, record: dict):
+        """Add `record` to the feed, call while holding the snapshot lock"""
+        with self._lock:
+            _, fd = self._current()
+            os.write(fd, (json.dumps(record) + "\n").encode())
+            if os.fstat(fd).st_size > ScoreEvents.kMAX_BYTES:
+                self._rotate(fd)
+
+    def _rotate(self, fd: int):
+        """Replace the feed with its last kKEEP_BYTES of whole lines"""
+        size = os.fstat(fd).st_size
+        data = os.pread(fd, ScoreEvents.kKEEP_BYTES, size - ScoreEvents.kKEEP_BYTES)
+        data = data[data.find(b"\n") + 1 :]
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+        try:
+            with os.fdopen(tmp_fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except:
+            os.unlink(tmp_path)
+            raise
+        logging.info(f"SCORE EVENTS: feed past {size} bytes, kept the last {len(data)}")
+
+    def end(self) -> tuple[int, int]:
+        """A cursor at the end of the feed, for reading only what's appended from now on"""
+        with self._lock:
+            inode, fd = self._current()
+            return inode, os.fstat(fd).st_size
+
+    def readFrom(self, cursor: tuple[int, int]) -> tuple[list[dict], tuple[int, int]]:
+        """
+        Returns the records appended at or after `cursor`, and a cursor to where
+        they end. If the feed was replaced since, that's every record of the new
+        one, including some the caller has seen already.
+        """
+        with self._lock:
+            inode, fd = self._current()
+            offset = cursor[1] if cursor[0] == inode else 0
+            end = os.fstat(fd).st_size
+            if end <= offset:
+                return [], (inode, offset)
+            data = os.pread(fd, end - offset, offset)
+        complete = data.rfind(b"\n") + 1  # a writer may be mid-line
+        records = [json.loads(line) for line in data[:complete].splitlines() if line]
+        return records, (inode, offset + complete)
+
+    def readTail(self, max_bytes: int) -> tuple[list[dict], tuple[int, int]]:
+        """Like `readFrom`, for the whole records in the last `max_bytes` of the feed"""
+        inode, size = self.end()
+        start = max(size - max_bytes, 0)
+        if start > 0:
+            # skip the line we landed in the middle of
+            with self._lock:
+                data = os.pread(self._fd, max_bytes, start - 1)
+            newline = data.find(b"\n")
+            if newline < 0:
+                return [], (inode, start - 1 + len(data))
+            start += newline
+        return self.readFrom((inode, start))
+
+
+class Broadcaster:
+    """
+    Fans score changes out to this process's stream subscribers.
+
+    One thread per process tails the shared ScoreEvents feed, so it doesn't
+    matter which worker applied a change. Subscribers also get the full
+    scoreboard when they join, every kSNAPSHOT_INTERVAL seconds, and whenever
+    a refetch or a new team or event changes more than one score.
+    """
+
+    kPOLL_INTERVAL = 0.25  # seconds between looks at the feed
+    kSNAPSHOT_INTERVAL = 30  # seconds between full scoreboards
+    kMAX_BACKLOG = 256  # messages a slow subscriber may fall behind before it's dropped
+    # each subscriber holds a request thread for as long as it's connected
+    kMAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", 8))
+
+    def __init__(
+        self,
+        events: ScoreEvents,
+        scoreboard: Callable[[], dict],
+    ):
+        self._events = events
+        self._scoreboard = scoreboard  # the full scoreboard message
+        self._subscribers: set[queue.Queue] = set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def subscribe(self) -> queue.Queue | None:
+        """
+        A queue of (event name, data) messages, starting with the full scoreboard.
+        None if there are kMAX_SUBSCRIBERS already.
+        """
+        if self.getSubscriberCount() >= Broadcaster.kMAX_SUBSCRIBERS:
+            return None
+        subscriber: queue.Queue = queue.Queue(maxsize=Broadcaster.kMAX_BACKLOG)
+        # before the scoreboard, so no change made after it goes unsent
+        cursor = self._events.end()
+        subscriber.put(("scoreboard", self._scoreboard()))
+        with self._lock:
+            if len(self._subscribers) >= Broadcaster.kMAX_SUBSCRIBERS:
+                return None
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, args=(cursor,), name="broadcaster", daemon=True
+                )
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def getSubscriberCount(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _send(self, name: str, data: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((name, data))
+            except queue.Full:
+                # can't keep up, drop it; EventSource reconnects and starts over
+                self.unsubscribe(subscriber)
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait(None)  # ends the stream
+
+    def _run(self, cursor: tuple[int, int]):
+        version = 0  # of the last record read
+        last_snapshot = time.time()
+        while True:
+            time.sleep(Broadcaster.kPOLL_INTERVAL)
+            if not self.getSubscriberCount():
+                cursor = self._events.end()  # nobody to tell
+                continue
+            try:
+                records, next_cursor = self._events.readFrom(cursor)
+                # the feed was replaced, there may be changes we never saw
+                changed = next_cursor[0] != cursor[0]
+                records = _unseen(records, version, changed)
+                cursor = next_cursor
+                for record in records:
+                    version = record["version"]
+                    if record["type"] == "score":
+                        self._send("score", record)
+                    elif record["reset"] or any(
+                        record[key] for key in ("teams", "events", "changes")
+                    ):
+                        changed = True
+                now = time.time()
+                if changed or now - last_snapshot >= Broadcaster.kSNAPSHOT_INTERVAL:
+                    last_snapshot = now
+                    self._send("scoreboard", self._scoreboard())
+            except Exception:
+                logging.exception("BROADCASTER: couldn't read score changes")
+
+
+class ScoreHistory:
+    """
+    This process's copy of the most recent ScoreEvents records, enough to tell a
+    client that has scoreboard version v just what changed since then.
+
+    Catches up with the shared feed on every lookup, so changes made on any
+    worker are included. Starts out with the last kTAIL_BYTES of the feed.
+    """
+
+    kMAX_RECORDS = 10_000  # versions kept, clients further behind get everything
+    kTAIL_BYTES = 1 << 20
+
+    def __init__(self, events: ScoreEvents):
+        self._events = events
+        self._records: list[dict] = []
+        records, self._offset = events.readTail(ScoreHistory.kTAIL_BYTES)
+        self._add(records)
+        self._lock = threading.Lock()
+
+    def _add(self, records: list[dict]):
+        for record in records:
+            if len(self._records) and record["version"] <= self._records[-1]["version"]:
+                self._records = []  # the snapshot was reset, versions start over
+            self._records.append(record)
+
+    def _catchUp(self):
+        cursor = self._offset
+        records, self._offset = self._events.readFrom(cursor)
+        if len(self._records):
+            replaced = self._offset[0] != cursor[0]
+            records = _unseen(records, self._records[-1]["version"], replaced)
+        self._add(records)
+        if len(self._records) > 2 * ScoreHistory.kMAX_RECORDS:
+            del self._records[: -ScoreHistory.kMAX_RECORDS]
+
+    def records(self, version: int, current: int) -> list[dict] | None:
+        """
+        The records after scoreboard version `version`, oldest first, or None if
+        the history doesn't have every one of them. `current` is the shared
+        snapshot's version.
+        """
+        with self._lock:
+            self._catchUp()
+            latest = self._records[-1]["version"] if len(self._records) else current
+            if version >= latest:
+                # up to date (or a change is still being written, it comes next time)
+                return [] if version <= current else None  # else not a version we've had
+            start = bisect_right(self._records, version, key=lambda r: r["version"])
+            newer = self._records[start:]
+        expected = version + 1
+        for record in newer:
+            if record["version"] != expected:
+                return None  # too far back, or a gap in the feed
+            expected += 1
+        return newer if len(newer) else None  # changes from before this feed
+
+    def since(self, version: int, current: int) -> dict | None:
+        """
+        {version, teams, events, changes} for everything after `version`, where
+        teams and events were added and changes are the [team, event, score] cells
+        that changed, or None if the history can't say and the client needs the
+        whole scoreboard. `current` is the shared snapshot's version.
+        """
+        records = self.records(version, current)
+        if records is None:
+            return None
+        teams: list[str] = []
+        events: list[str] = []
+        changes: dict[tuple[str, str], int] = {}
+        for record in records:
+            if record["type"] == "score":
+                changes[(record["team"], record["event"])] = record["score"]
+                continue
+            if record["reset"]:
+                return None
+            teams.extend(record["teams"])
+            events.extend(record["events"])
+            for team, event, score in record["changes"]:
+                changes[(team, event)] = score
+        return {
+            "version": records[-1]["version"] if len(records) else version,
+            "teams": teams,
+            "events": events,
+            "changes": [[team, event, score] for (team, event), score in changes.items()],
+        }
@@ -1,49 +1,113 @@
-from datetime import datetime
 from collections import defaultdict
+import threading
+import time
 
-from pandas import DataFrame
+from storage import Worksheet
+
+from scheduler import Priority, priority
+from tail import readNewRows
 
 
 class Graph:
-    def __init__(self, data):
-        self.data = data
+    """
+    Per-team score series built from the `log` worksheet.
+
+    Only log rows appended since the last read are downloaded. Every plotted
+    point gets a sequence number, so clients can pass the `cursor` of their
+    last response to fetch just the points added since.
+    """
+
+    kGRAPH_DELAY = 5  # how often to look for new log rows
+    kLOG_WIDTH = 8  # time, action, team, event, delta, score, total, detail
+
+    def __init__(self, log: Worksheet):
+        self._log = log
+        self._next_row = 2  # row 1 is the header
+        self._last_fetch_time = 0.0
+        self._points: list[tuple[str, str, int | None]] = []  # (time, team, total)
+        self._update_lock = threading.Lock()  # one read of the log at a time
 
     def _cleanArg(self, arg: str):
         """strips before equal sign"""
         return arg[arg.index("=") + 1 :]
 
-    def parse(self) -> dict:
-        assert type(self.data) is DataFrame, "Graph data is of wrong type"
-        self.data = self.data.to_dict()
-        # print(self.data)
-        # for (k, v) in self.data.items():
-        #     print(k, v, '\n')
-        # keys = self.data.keys()
-        times, actions = list(self.data["A"].values()), list(self.data["B"].values())
-        # print(f"{times=}, {actions=}")
-        assert len(times) == len(
-            actions
-        ), "mismatched lengths for times, actions. can't construct graph"
-        args = [self.data[k] for k in "CDEFGH"]
-        for arg in args:
-            print(arg, "\n")
+    def _toInt(self, value) -> int | None:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _parseRow(self, row: list) -> tuple[str, int | None] | None:
+        """
+        Returns (team, total) for an adjustScore row of the log sheet, else None.
+
+        Rows are laid out as: time, action, team, event, delta, score, total, detail.
+        Rows written before the structured logger hold `arg=value` strings instead:
+        time, action, event_name, team_name, score_delta, old_score, new_score, total_score.
+        """
+        row = list(row) + [""] * (Graph.kLOG_WIDTH - len(row))
+        if "adjustScore" not in str(row[1]):
+            return None
+        if "=" not in str(row[2]):
+            team, score, total = row[2], row[5], row[6]
+        else:
+            team = self._cleanArg(row[3])
+            score = self._cleanArg(row[6]) if "=" in str(row[6]) else ""
+            total = self._cleanArg(row[7]) if "=" in str(row[7]) else ""
+        total = self._toInt(total)
+        return str(team), total if total is not None else self._toInt(score)
 
+    def update(self, force: bool = False):
+        """Ingest log rows appended since the last read"""
+        if not force and time.time() - self._last_fetch_time < Graph.kGRAPH_DELAY:
+            return
+        # a graph a few seconds old will do, don't queue up behind another read
+        if not self._update_lock.acquire(blocking=force):
+            return
+        try:
+            if force or time.time() - self._last_fetch_time >= Graph.kGRAPH_DELAY:
+                self._update()
+        finally:
+            self._update_lock.release()
+
+    def _update(self):
+        self._last_fetch_time = time.time()
+        with priority(Priority.LOW):
+            rows, self._next_row = readNewRows(
+                self._log, self._next_row, Graph.kLOG_WIDTH
+            )
+        for row in rows:
+            parsed = self._parseRow(row)
+            if parsed is None:
+                continue
+            team, total = parsed
+            self._points.append((row[0], team, total))
+
+    def dumpState(self) -> dict | None:
+        """What loadState needs to pick up where this left off, None if never read"""
+        if not self._last_fetch_time:
+            return None
+        return {
+            "fetched_at": self._last_fetch_time,
+            "next_row": self._next_row,
+            "points": list(self._points),
+        }
+
+    def loadState(self, state: dict):
+        self._points = [tuple(point) for point in state["points"]]
+        self._next_row = state["next_row"]
+        self._last_fetch_time = state["fetched_at"]
+
+    def parse(self, since: int = 0) -> dict:
+        """Returns the points with a sequence number >= `since`"""
+        self.update()
         xs = defaultdict(lambda: list())
         ys = defaultdict(lambda: list())
         teams = []
-        for idx, (_time, action) in enumerate(zip(times, actions)):
-            if "adjustScore" not in action:
-                continue
-            # time = datetime.strptime(_time, "%Y-%m-%d %H:%M:%S") # to datetime obj
-            team = self._cleanArg(args[1][idx])
-            score_delta = self._cleanArg(args[4][idx])
-            total_score = None
-            if len(args) >= 6 and args[5][idx] != "":
-                # use total_score
-                total_score = self._cleanArg(args[5][idx])
-
-            # need total sum
+        since = max(since, 0)
+        points = self._points[since:]
+        for _time, team, total in points:
             xs[team].append(_time)
-            ys[team].append(total_score if total_score else score_delta)
+            ys[team].append(total)
             teams.append(team)
-        return {"xs": xs, "ys": ys, "teams": teams}
+        return {"xs": xs, "ys": ys, "teams": teams, "cursor": since + len(points)}
@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _defaultDir() -> str:
+    shm = "/dev/shm"
+    directory = shm if os.path.isdir(shm) else tempfile.gettempdir()
+    sheet_hash = sha1(str(os.getenv("SHEET_URL")).encode()).hexdigest()[:8]
+    return os.path.join(directory, f"acmmm-jobs-{sheet_hash}")
+
+
+class Jobs:
+    """
+    Runs jobs on a thread pool and keeps their results where any worker can read them.
+
+    Each job's state is a small json file, `<directory>/<job id>.json`, so a client
+    can poll whichever worker it lands on: {"status": "queued" | "running" | "done" |
+    "error", "result": ...}. Results are kept for kJOB_TTL seconds.
+    """
+
+    kWORKERS = int(os.getenv("JUDGE_WORKERS", 4))  # jobs running at once, per process
+    kMAX_PENDING = 1_000  # jobs queued per process before submit refuses more
+    kJOB_TTL = 600  # seconds a finished job's result stays around
+    kPOLL_INTERVAL = 0.05  # seconds between checks while waiting on another worker's job
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory or os.getenv("JOBS_DIR") or _defaultDir()
+        os.makedirs(self.directory, exist_ok=True)
+        self._pool = ThreadPoolExecutor(Jobs.kWORKERS, thread_name_prefix="judge")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._last_cleanup = 0.0
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, job_id: str, state: dict):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path(job_id))
+
+    def _read(self, job_id: str) -> dict | None:
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _run(self, job_id: str, fn: Callable, args: tuple):
+        self._write(job_id, {"status": "running"})
+        try:
+            state = {"status": "done", "result": fn(*args)}
+        except Exception as error:
+            logging.exception(f"JOBS: job {job_id} failed")
+            state = {"status": "error", "message": str(error)}
+        self._write(job_id, state)
+        with self._finished:
+            self._pending -= 1
+            self._finished.notify_all()
+
+    def _cleanup(self):
+        """Forget jobs older than kJOB_TTL, at most once a minute"""
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            try:
+                if now - os.path.getmtime(path) > Jobs.kJOB_TTL:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass  # another worker got to it first
+
+    def submit(self, fn: Callable, *args) -> str | None:
+        """Queue `fn(*args)`, returns the job id or None if the queue is full"""
+        self._cleanup()
+        with self._lock:
+            if self._pending >= Jobs.kMAX_PENDING:
+                return None
+            self._pending += 1
+        job_id = uuid.uuid4().hex
+        self._write(job_id, {"status": "queued"})
+        self._pool.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def get(self, job_id: str, wait: float = 0.0) -> dict | None:
+        """
+        Returns the job's state, waiting up to `wait` seconds for it to finish.
+        None if there's no such job (or it finished more than kJOB_TTL ago).
+        """
+        if len(job_id) != 32 or not all(c in "0123456789abcdef" for c in job_id):
+            return None  # not one of ours, and keeps the path inside our directory
+        deadline = time.time() + wait
+        while True:
+            state = self._read(job_id)
+            if state is None or state["status"] in ("done", "error"):
+                return state
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return state
+            with self._finished:
+                # woken early when one of our own jobs finishes
+                self._finished.wait(min(remaining, Jobs.kPOLL_INTERVAL))
+
+    def getQueueDepth(self) -> int:
+        with self._lock:
+            return self._pending
@@ -1,57 +1,146 @@
+import logging
 import re
+import threading
+import time
+
 import pygsheets as ps
 
 from gettime import gettime
+from solves import SharedSolves
+from submissions import Submissions
 
 
 class Judge:
-    def __init__(self, problems, submissions):
+    kANSWERS_DELAY = 600  # how often to refetch the answer keys
+
+    def __init__(self, problems, submissions: Submissions, solves: SharedSolves):
         self.problems = problems
         self.submissions = submissions
+        # solves this machine's workers awarded, which the sheet may not show yet
+        self.solves = solves
+        # (problem_number, part) -> expected output for each input index
+        self._answers: dict[tuple[int, str], tuple[str, ...]] = {}
+        self._answers_fetch_time = 0.0
+        self._miss_fetch_time = 0.0  # last reload for an answer we didn't have
+        self._load_lock = threading.Lock()
+
+    def loadAnswers(self, stale_before: float | None = None):
+        """
+        Download every problem worksheet into the in-memory answer table. With
+        `stale_before`, skip it if another thread has loaded them since then.
+        """
+        with self._load_lock:
+            if stale_before is not None and self._answers_fetch_time > stale_before:
+                return
+            self._loadAnswers()
+
+    def _loadAnswers(self):
+        answers = {}
+        for problem_number, problem_sheet in enumerate(self.problems, start=1):
+            values = problem_sheet.get_all_values(
+                include_tailing_empty=False, include_tailing_empty_rows=False
+            )
+            width = max((len(row) for row in values), default=0)
+            for cidx in range(width):
+                col = [row[cidx] if cidx < len(row) else "" for row in values[1:]]
+                while len(col) and col[-1] == "":
+                    col.pop()
+                answers[(problem_number, chr(ord("a") + cidx))] = tuple(col)
+        self._answers = answers
+        self._answers_fetch_time = time.time()
+
+    def dumpState(self) -> dict | None:
+        """What loadState needs to pick up where this left off, None if never loaded"""
+        if not self._answers_fetch_time:
+            return None
+        return {
+            "fetched_at": self._answers_fetch_time,
+            "answers": [[n, part, list(outputs)] for (n, part), outputs in self._answers.items()],
+        }
+
+    def loadState(self, state: dict):
+        self._answers = {(n, part): tuple(outputs) for n, part, outputs in state["answers"]}
+        self._answers_fetch_time = state["fetched_at"]
+
+    def _getAnswer(
+        self, problem_number: int, problem_part: str, input_idx: int
+    ) -> str | None:
+        """The expected output, None if the answer keys don't have one"""
+        fetch_time = self._answers_fetch_time
+        if time.time() - fetch_time >= Judge.kANSWERS_DELAY:
+            self.loadAnswers(stale_before=fetch_time)
+            fetch_time = self._answers_fetch_time
+        outputs = self._answers.get((problem_number, problem_part), ())
+        if not 0 <= input_idx < len(outputs):
+            # maybe the sheet changed under us, but don't let requests for made up
+            # problems download every answer key each time
+            if time.time() - self._miss_fetch_time < Judge.kANSWERS_DELAY:
+                return None
+            self._miss_fetch_time = time.time()
+            self.loadAnswers(stale_before=fetch_time)
+            outputs = self._answers.get((problem_number, problem_part), ())
+            if not 0 <= input_idx < len(outputs):
+                return None
+        return outputs[input_idx]
+
+    @staticmethod
+    def _parseProblem(problem: str) -> tuple[int, str] | None:
+        """(number, part) of a problem of form "1a" or "1b" or "4a", None if it isn't one"""
+        numbers = re.findall(r"\d+", problem)
+        parts = re.findall(r"[a-z]{1}", problem)
+        if not len(numbers) or not len(parts):
+            return None
+        return int(numbers[0]), parts[0]
+
+    def hasProblem(self, problem: str) -> bool:
+        parsed = self._parseProblem(problem)
+        return parsed is not None and self._getAnswer(*parsed, 0) is not None
 
     def getJudgement(
         self, problem: str, input_idx: int, output: str, team_name: str
-    ) -> bool:
+    ) -> bool | None:
+        """Whether `output` is right, None (and nothing recorded) if there's no such problem or input"""
         team_name = re.sub(r"[^a-zA-Z]", "", team_name).lower()
-        # problem is of form "1a" or "1b" or "4a"
-        problem_number = int(re.findall(r"\d+", problem)[0])
-        problem_part = re.findall(r"[a-z]{1}", problem)[0]
-        relevant_sheet = self.problems[problem_number - 1]
-
-        cidx = ord(problem_part) - ord("a") + 1
-        relevant_col = relevant_sheet.get_col(cidx, include_tailing_empty=False)
-        correct_output = relevant_col[input_idx + 1]
+        parsed = self._parseProblem(problem)
+        if parsed is None:
+            return None
+        correct_output = self._getAnswer(*parsed, input_idx)
+        if correct_output is None:
+            return None
         result = correct_output == output
         output = re.sub(r"[^a-zA-Z{}_0-9]", "", output)
         row = [gettime(), team_name, problem, str(result), str(input_idx), output]
-        self.submissions.append_table(row, overwrite=True)  # type: ignore
+        self.submissions.append(row)
         return result
 
     def hasPriorSolve(self, team_name: str, problem: str) -> bool:
         team_name = re.sub(r"[^a-zA-Z]", "", team_name).lower()
-        print(f"CHECKING PRIOR SOLVE {team_name=}, {problem=}")
-        # print(self.getPastSubmissions(team_name, problem))
-        records = self.submissions.get_all_records()
-        for record in records:
-            if (
-                record.get("team-name", None) == team_name
-                and record.get("problem", None) == problem
-                and record.get("result", None) == "TRUE"
-            ):
-                print("hit: ", record)
-                return True
-
-        return False
+        logging.debug(f"CHECKING PRIOR SOLVE {team_name=}, {problem=}")
+        claimed = self.solves.claimed(team_name, problem)
+        if claimed is not None:
+            # a released claim's correct answer is in submissions, but got no points
+            return claimed
+        return self.submissions.hasSolved(team_name, problem)
+
+    def claimSolve(self, team_name: str, problem: str) -> bool:
+        """
+        Record a correct answer as the team's solve of `problem`. Returns False if
+        another request (on any worker) already claimed it, and its points with it.
+        """
+        team_name = re.sub(r"[^a-zA-Z]", "", team_name).lower()
+        return self.solves.claim(team_name, problem)
+
+    def releaseSolve(self, team_name: str, problem: str):
+        """Undo claimSolve when the points couldn't be awarded"""
+        team_name = re.sub(r"[^a-zA-Z]", "", team_name).lower()
+        self.solves.release(team_name, problem)
 
     def getPastSubmissions(self, team_name: str, problem: str):
-        res = self.submissions.get_as_df().to_dict()
         out = {"time": {}, "result": {}, "problem": {}}
-        count = 0
-        for i in range(len(res["time"])):
-            print(res["team-name"][i], team_name, problem)
-            if res["team-name"][i] == team_name and res["problem"][i] == problem:
-                out["time"][count] = res["time"][i]
-                out["result"][count] = res["result"][i]
-                out["problem"][count] = res["problem"][i]
-                count += 1
+        for count, record in enumerate(
+            self.submissions.getRecords(team_name, problem)
+        ):
+            out["time"][count] = record["time"]
+            out["result"][count] = record["result"]
+            out["problem"][count] = record["problem"]
         return out
@@ -0,0 +1,89 @@
+from bisect import bisect_left, insort
+import threading
+
+from events import ScoreHistory
+from snapshot import ScoreboardSnapshot
+
+
+class Leaderboard:
+    """
+    Team totals and ranking, kept in step with the shared scoreboard.
+
+    The ranking is a list of (-total, team) kept sorted, so a score change moves
+    one entry (found by bisection) instead of re-sorting, and totals come from the
+    "total" of each score change rather than re-summing the column. Only a refetch
+    that changed scores, or a layout reset, re-sums the whole matrix.
+    """
+
+    def __init__(self, history: ScoreHistory):
+        self._history = history
+        self._version = 0  # scoreboard version the ranking reflects
+        self._totals: dict[str, int] = {}
+        self._ranking: list[tuple[int, str]] = []
+        self._lock = threading.Lock()
+
+    def _rebuild(self, snapshot: ScoreboardSnapshot):
+        totals: dict[str, int] = {}
+        for team, total in zip(snapshot.teams, snapshot.scores.sum(axis=0).tolist()):
+            totals.setdefault(team, int(total))  # lookups use a name's first column
+        self._totals = totals
+        self._ranking = sorted((-total, team) for team, total in totals.items())
+        self._version = snapshot.seq
+
+    def _setTotal(self, team: str, total: int):
+        old = self._totals.get(team)
+        if old is not None:
+            del self._ranking[bisect_left(self._ranking, (-old, team))]
+        self._totals[team] = total
+        insort(self._ranking, (-total, team))
+
+    def _apply(self, records: list[dict]) -> bool:
+        """Apply ScoreEvents records in order, False if it takes a rebuild instead"""
+        for record in records:
+            if record["type"] == "score":
+                if record["team"] not in self._totals:
+                    return False
+                self._setTotal(record["team"], record["total"])
+            elif record["reset"] or len(record["changes"]):
+                return False
+            else:
+                for team in record["teams"]:
+                    if team not in self._totals:
+                        self._setTotal(team, 0)
+            self._version = record["version"]
+        return True
+
+    def sync(self, snapshot: ScoreboardSnapshot):
+        """Catch up with `snapshot`, from the change history when it covers the gap"""
+        with self._lock:
+            if self._version == snapshot.seq:
+                return
+            records = self._history.records(self._version, snapshot.seq)
+            if records is None or not self._apply(records):
+                self._rebuild(snapshot)
+
+    def getVersion(self) -> int:
+        return self._version
+
+    def getTotal(self, team: str) -> int | None:
+        return self._totals.get(team)
+
+    def getRank(self, team: str) -> int | None:
+        """1 + the number of teams with a higher total, so ties share a rank"""
+        with self._lock:
+            total = self._totals.get(team)
+            if total is None:
+                return None
+            return bisect_left(self._ranking, (-total, "")) + 1
+
+    def getTop(self, n: int) -> list[dict]:
+        """The first `n` teams as [{rank, team, total}]"""
+        with self._lock:
+            top = self._ranking[:n]
+        leaders = []
+        first = 0  # index of the first team with this total
+        for idx, (negative_total, team) in enumerate(top):
+            if idx and negative_total != top[idx - 1][0]:
+                first = idx
+            leaders.append({"rank": first + 1, "team": team, "total": -negative_total})
+        return leaders
@@ -1,39 +1,175 @@
-from datetime import datetime
-from typing import Literal
-import inspect
-
-import pytz
+import atexit
+import fcntl
+import json
+import logging
+import os
+from os import getenv
+import tempfile
+import threading
+import time
+from typing import TypedDict
 
 from client import Client
 from gettime import gettime
+from snapshot import SharedLock
+
+
+class LogRecord(TypedDict):
+    time: str
+    action: str
+    team: str
+    event: str
+    delta: int | None  # change applied to the score
+    score: int | None  # score for (team, event) afterwards
+    total: int | None  # team total afterwards
+    detail: str
 
 
 class Logger:
+    """
+    Records every scoreboard mutation.
+
+    Each record is appended to a local journal (one JSON object per line) shared
+    by every worker, and a background thread exports the journal to the `log`
+    worksheet in batches, saving how far it got next to it (`<journal>.offset`).
+    One worker at a time (whoever holds the lock file) exports. A crash or a
+    Sheets outage loses nothing: the export picks up from the saved offset, at
+    worst appending the batch it was in the middle of twice. Once all of it is
+    exported and it's past kTRUNCATE_BYTES, the journal is emptied; workers
+    hold `<journal>.truncate` shared while appending, so no line is lost to it.
+    Sheet rows are laid out as: time, action, team, event, delta, score, total, detail.
+    """
+
+    kJOURNAL_PATH = getenv("LOG_JOURNAL", "journal.jsonl")
+    kEXPORT_INTERVAL = 0.5  # seconds between exports
+    kEXPORT_BYTES = 1 << 18  # most of the journal appended to the sheet at once
+    kMAX_BACKOFF = 60  # seconds between exports while they keep failing
+    kTRUNCATE_BYTES = 1 << 20  # size past which an exported journal is emptied
+    kCLOSE_TIMEOUT = 10  # seconds a worker on its way out spends exporting
+
     def __init__(self, client: Client):
         self._client = client
         self._scoreboard = self._client.scoreboard
         self._log = self._client.log
+        self._journal_lock = threading.Lock()
+        self._journal_path = Logger.kJOURNAL_PATH
+        self._journal = open(self._journal_path, "a", buffering=1)
+        self._offset_path = self._journal_path + ".offset"
+        self._export_lock = SharedLock(self._journal_path + ".lock")
+        self._truncate_fd = os.open(
+            self._journal_path + ".truncate", os.O_RDWR | os.O_CREAT, 0o644
+        )
+        with self._export_lock:
+            if not os.path.exists(self._offset_path):
+                # the journal so far went to the sheet through the Writer
+                self._saveOffset(os.path.getsize(self._journal_path))
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-export", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _loadOffset(self) -> int:
+        with open(self._offset_path) as f:
+            return int(f.read())
 
-    def log(self, **kwargs):
-        current_frame = inspect.currentframe()
-        assert current_frame is not None
+    def _saveOffset(self, offset: int):
+        directory = os.path.dirname(self._offset_path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self._offset_path)
 
-        previous_frame = current_frame.f_back
-        assert previous_frame is not None
+    def _truncate(self, offset: int):
+        """Empty the journal if it's all exported (up to `offset`), call while exporting"""
+        if offset < Logger.kTRUNCATE_BYTES:
+            return
+        with self._journal_lock:  # our threads, the flock is for other workers
+            fcntl.flock(self._truncate_fd, fcntl.LOCK_EX)
+            try:
+                if os.path.getsize(self._journal_path) != offset:
+                    return  # appended to since, next time
+                # offset first: a crash in between exports the journal again
+                # rather than skipping what's appended after the truncate
+                self._saveOffset(0)
+                os.truncate(self._journal_path, 0)
+            finally:
+                fcntl.flock(self._truncate_fd, fcntl.LOCK_UN)
 
-        args, _, _, values = inspect.getargvalues(previous_frame)
-        time = gettime()
-        row = [time, previous_frame.f_code.co_name]
+    def _export(self, blocking: bool, timeout: float | None = None) -> bool:
+        """
+        Append the journal past the saved offset to the sheet, unless another worker
+        is. Returns False if it didn't get to (not `blocking`, or past `timeout`).
+        """
+        if not self._export_lock.acquire(blocking, timeout):
+            return False
+        try:
+            while True:
+                offset = self._loadOffset()
+                with open(self._journal_path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read(Logger.kEXPORT_BYTES)
+                complete = data.rfind(b"\n") + 1  # a worker may be mid-line
+                if not complete:
+                    self._truncate(offset)
+                    return True
+                records = [json.loads(line) for line in data[:complete].splitlines() if line]
+                rows = [["" if v is None else v for v in record.values()] for record in records]
+                self._log.append_table(rows, overwrite=True)  # type: ignore
+                self._saveOffset(offset + complete)
+        finally:
+            self._export_lock.release()
 
-        for arg in args:
-            if arg == "self":
-                continue
-            row.append(f"{arg}={values[arg]}")
+    def _run(self):
+        wait = Logger.kEXPORT_INTERVAL
+        while not self._stopping.wait(wait):
+            try:
+                self._export(blocking=False)
+                wait = Logger.kEXPORT_INTERVAL
+            except Exception:
+                logging.exception(f"LOGGER: couldn't export the journal, retrying in {wait}s")
+                wait = min(wait * 2, Logger.kMAX_BACKOFF)
 
-        for k, v in kwargs.items():  # any additional args
-            row.append(f"{k}={v}")
+    def flush(self, timeout: float | None = None) -> bool:
+        """Export everything journaled so far, False if another worker kept at it past `timeout`"""
+        return self._export(blocking=True, timeout=timeout)
 
-        self._log.append_table(row, overwrite=True)  # type: ignore
+    def close(self, timeout: float = kCLOSE_TIMEOUT):
+        """Stop the background thread, exporting what's left if Sheets lets us within `timeout`"""
+        if self._stopping.is_set():
+            return
+        deadline = time.time() + timeout
+        self._stopping.set()
+        self._thread.join(timeout)
+        try:
+            if not self.flush(max(0.0, deadline - time.time())):
+                logging.warning("LOGGER: another worker is exporting, it exports the rest")
+        except Exception:
+            logging.exception("LOGGER: couldn't export the journal, it's exported on the next start")
 
-    def getLog(self):
-        return self._log.get_as_df()  # type: ignore
+    def log(
+        self,
+        action: str,
+        team: str = "",
+        event: str = "",
+        delta: int | None = None,
+        score: int | None = None,
+        total: int | None = None,
+        detail: str = "",
+    ):
+        record: LogRecord = {
+            "time": gettime(),
+            "action": action,
+            "team": team,
+            "event": event,
+            "delta": delta,
+            "score": score,
+            "total": total,
+            "detail": detail,
+        }
+        line = json.dumps(record) + "\n"
+        with self._journal_lock:
+            fcntl.flock(self._truncate_fd, fcntl.LOCK_SH)
+            try:
+                self._journal.write(line)
+            finally:
+                fcntl.flock(self._truncate_fd, fcntl.LOCK_UN)
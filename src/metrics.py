@@ -0,0 +1,293 @@
+from bisect import bisect_left
+from collections import defaultdict
+from hashlib import sha1
+import json
+import os
+import tempfile
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+kSEP = "\x1f"  # joins label values into one key for the json dumps
+
+
+def _defaultDir() -> str:
+    shm = "/dev/shm"
+    directory = shm if os.path.isdir(shm) else tempfile.gettempdir()
+    sheet_hash = sha1(str(os.getenv("SHEET_URL")).encode()).hexdigest()[:8]
+    return os.path.join(directory, f"acmmm-metrics-{sheet_hash}")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if len(pairs) else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[tuple(str(v) for v in label_values)] += amount
+
+    def _state(self) -> dict:
+        with self._lock:
+            return {kSEP.join(k): v for k, v in self._values.items()}
+
+    @staticmethod
+    def _merge(total: dict, state: dict):
+        for key, value in state.items():
+            total[key] = total.get(key, 0) + value
+
+    def _render(self, state: dict) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key in sorted(state):
+            values = tuple(key.split(kSEP)) if len(self.labels) else ()
+            lines.append(f"{self.name}{_labels(self.labels, values)} {state[key]:g}")
+        return lines
+
+
+class Gauge:
+    """A value set by each worker, reported summed over the workers"""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[tuple(str(v) for v in label_values)] = value
+
+    def _state(self) -> dict:
+        with self._lock:
+            return {kSEP.join(k): v for k, v in self._values.items()}
+
+    @staticmethod
+    def _merge(total: dict, state: dict):
+        for key, value in state.items():
+            total[key] = total.get(key, 0) + value
+
+    def _render(self, state: dict) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key in sorted(state):
+            values = tuple(key.split(kSEP)) if len(self.labels) else ()
+            lines.append(f"{self.name}{_labels(self.labels, values)} {state[key]:g}")
+        return lines
+
+
+class Histogram:
+    kBUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = kBUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket (+Inf last), sum]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts, _ = self._values[key]
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key][1] += value
+
+    def _state(self) -> dict:
+        with self._lock:
+            return {kSEP.join(k): [list(c), s] for k, (c, s) in self._values.items()}
+
+    @staticmethod
+    def _merge(total: dict, state: dict):
+        for key, (counts, value_sum) in state.items():
+            if key not in total:
+                total[key] = [[0] * len(counts), 0.0]
+            total[key][0] = [a + b for a, b in zip(total[key][0], counts)]
+            total[key][1] += value_sum
+
+    def _render(self, state: dict) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key in sorted(state):
+            values = tuple(key.split(kSEP)) if len(self.labels) else ()
+            counts, value_sum = state[key]
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _labels(self.labels, values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {value_sum:g}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics for every worker on the machine.
+
+    Each worker keeps its own counters and periodically dumps them to
+    `<directory>/<pid>.json`; `render` adds up every worker's file, so
+    whichever worker serves /metrics reports for all of them.
+    """
+
+    kDUMP_INTERVAL = 1.0  # seconds between dumps of this worker's metrics
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory or os.getenv("METRICS_DIR") or _defaultDir()
+        os.makedirs(self.directory, exist_ok=True)
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self._last_dump = 0.0
+        self._dump_lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics[name] = metric
+        return metric
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Gauge:
+        metric = Gauge(name, help, labels)
+        self._metrics[name] = metric
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = Histogram.kBUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics[name] = metric
+        return metric
+
+    def dump(self, force: bool = False):
+        """Write this worker's metrics for the others to read, at most every kDUMP_INTERVAL"""
+        if not force and time.time() - self._last_dump < Registry.kDUMP_INTERVAL:
+            return
+        if not self._dump_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_dump = time.time()
+            state = {name: metric._state() for name, metric in self._metrics.items()}
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, os.path.join(self.directory, f"{os.getpid()}.json"))
+        finally:
+            self._dump_lock.release()
+
+    def render(self) -> str:
+        """Prometheus text format, summed over every worker"""
+        self.dump(force=True)
+        totals: dict[str, dict] = {name: {} for name in self._metrics}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue  # mid-replace or garbage, skip this worker for now
+            for name, metric in self._metrics.items():
+                metric._merge(totals[name], state.get(name, {}))
+
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.extend(metric._render(totals[name]))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+upstream_calls = registry.counter(
+    "sheets_calls_total",
+    "Calls to the storage backend (Google Sheets)",
+    ("worksheet", "operation", "outcome"),
+)
+upstream_latency = registry.histogram(
+    "sheets_call_seconds",
+    "Latency of calls to the storage backend",
+    ("worksheet", "operation"),
+)
+quota_wait = registry.histogram(
+    "sheets_quota_wait_seconds",
+    "Time Google Sheets calls waited for read/write quota",
+    ("kind", "priority"),
+)
+throttled = registry.counter(
+    "sheets_throttled_total",
+    "Google Sheets calls rejected with 429 (then retried with backoff)",
+    ("kind", "priority"),
+)
+scoreboard_cache = registry.counter(
+    "scoreboard_cache_total",
+    "Scoreboard lookups by how they were served: hit (fresh), stale (served "
+    "while refetching) or miss (waited for a fetch)",
+    ("result",),
+)
+scoreboard_body_cache = registry.counter(
+    "scoreboard_body_cache_total",
+    "Serialized /scoreboard bodies reused (hit) or rebuilt (miss)",
+    ("result",),
+)
+mirror_backlog = registry.gauge(
+    "mirror_backlog",
+    "Writes made to the local database not yet replayed on Google Sheets (STORAGE=mirror)",
+)
+http_requests = registry.counter(
+    "http_requests_total", "Requests served", ("method", "endpoint", "status")
+)
+http_latency = registry.histogram(
+    "http_request_seconds", "Time to serve a request", ("method", "endpoint")
+)
+request_upstream_calls = registry.histogram(
+    "http_request_sheets_calls",
+    "Storage backend calls made while serving one request",
+    ("method", "endpoint"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50),
+)
+
+_request = threading.local()
+
+
+def startRequest():
+    """Start counting upstream calls for the request on this thread"""
+    _request.calls = 0
+
+
+def requestCalls() -> int:
+    """Upstream calls made by this thread since `startRequest`"""
+    return getattr(_request, "calls", 0)
+
+
+def recordCall(worksheet: str, operation: str, seconds: float, ok: bool):
+    upstream_calls.inc(worksheet, operation, "ok" if ok else "error")
+    upstream_latency.observe(seconds, worksheet, operation)
+    if hasattr(_request, "calls"):
+        _request.calls += 1
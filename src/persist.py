@@ -0,0 +1,86 @@
+import fcntl
+from hashlib import sha1
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _defaultPath() -> str:
+    # on disk next to contest.db and the journal, /dev/shm doesn't survive a reboot
+    sheet_hash = sha1(str(os.getenv("SHEET_URL")).encode()).hexdigest()[:8]
+    return f"cache-{sheet_hash}.bin"
+
+
+class CacheFile:
+    """
+    The in-memory caches saved to local disk, so a restarted worker can serve
+    from them right away and only has to catch up with the sheet.
+
+    The file is kMAGIC followed by zlib-compressed JSON of {section: state},
+    one section per cache, as returned by its `dumpState`. Sheet rows are kept
+    as plain lists under one header rather than as per-row dicts. Saves merge
+    into the existing file under flock and replace it atomically.
+    """
+
+    kMAGIC = b"ACMC2\n"
+    kMAX_AGE = 24 * 60 * 60  # seconds, an older file is ignored
+
+    def __init__(self, path: str | None = None):
+        self.path = path or os.getenv("CACHE_SNAPSHOT") or _defaultPath()
+        self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        # flock only excludes other processes, threads of this one share the fd
+        self._thread_lock = threading.Lock()
+
+    def load(self) -> dict[str, dict]:
+        """The saved sections, empty if there's no usable file"""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+        if not data.startswith(CacheFile.kMAGIC):
+            return {}
+        try:
+            state = json.loads(zlib.decompress(data[len(CacheFile.kMAGIC) :]))
+        except (zlib.error, ValueError):
+            logging.warning(f"CACHE: {self.path} is corrupt, ignoring it")
+            return {}
+        if time.time() - state["saved_at"] > CacheFile.kMAX_AGE:
+            return {}
+        return state["sections"]
+
+    def getAge(self) -> float:
+        """Seconds since the file was last saved, by any worker"""
+        try:
+            return time.time() - os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return float("inf")
+
+    def save(self, sections: dict[str, dict | None]):
+        """Write `sections`, keeping the saved state of those that are None (not loaded here)"""
+        with self._thread_lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                merged = self.load()
+                merged.update({k: v for k, v in sections.items() if v is not None})
+                state = {"saved_at": time.time(), "sections": merged}
+                data = zlib.compress(json.dumps(state, separators=(",", ":")).encode())
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(CacheFile.kMAGIC + data)
+                    os.chmod(tmp_path, 0o644)
+                    os.replace(tmp_path, self.path)
+                except:
+                    os.unlink(tmp_path)
+                    raise
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
@@ -0,0 +1,130 @@
+from contextlib import contextmanager
+import copy
+import queue
+from typing import Any, Iterator
+
+import pygsheets as ps
+
+from storage import growGrid
+
+
+class SheetsPool:
+    """
+    Several authorized pygsheets clients on one spreadsheet, each with its own
+    HTTP connection, kept alive between calls by httplib2.
+
+    httplib2 connections aren't thread-safe, so rather than every request thread
+    sharing one client each call borrows a client for its duration. Calls from
+    parallel requests then overlap instead of queueing on (or garbling) a
+    single connection.
+    """
+
+    def __init__(self, creds: str, url: str, size: int):
+        # check=False: the scheduler handles 429s instead of pygsheets' 100s sleep
+        first = ps.authorize(service_file=creds, check=False).open_by_url(url)
+        self.members: list[ps.Spreadsheet] = [first]
+        for _ in range(size - 1):
+            client = ps.authorize(service_file=creds, check=False)
+            # same metadata, no need to fetch it again
+            self.members.append(
+                client.spreadsheet_cls(client, copy.deepcopy(first._jsonsheet))
+            )
+        self._idle: queue.Queue[ps.Spreadsheet] = queue.Queue()
+        for member in self.members:
+            self._idle.put(member)
+
+    @contextmanager
+    def lease(self) -> Iterator[ps.Spreadsheet]:
+        """Borrow a client's copy of the spreadsheet, waiting for one to be free"""
+        spreadsheet = self._idle.get()
+        try:
+            yield spreadsheet
+        finally:
+            self._idle.put(spreadsheet)
+
+
+class PooledCell:
+    def __init__(self, worksheet: "PooledWorksheet", cell: ps.Cell):
+        self._worksheet = worksheet
+        self._cell = cell
+
+    @property
+    def value(self) -> str:
+        return self._cell.value
+
+    def set_value(self, value):
+        with self._worksheet._pool.lease() as spreadsheet:
+            self._cell.link(self._worksheet._on(spreadsheet))
+            self._cell.set_value(value)
+
+    def set_text_format(self, attribute, value):
+        with self._worksheet._pool.lease() as spreadsheet:
+            self._cell.link(self._worksheet._on(spreadsheet))
+            self._cell.set_text_format(attribute, value)
+
+
+class PooledWorksheet:
+    """One worksheet, called through whichever pooled client is free"""
+
+    kFREE = ("title", "id", "rows", "cols")  # cached, no request behind them
+
+    def __init__(self, pool: SheetsPool, worksheet_id: int):
+        self._pool = pool
+        self._id = worksheet_id
+
+    def _on(self, spreadsheet: ps.Spreadsheet) -> ps.Worksheet:
+        return spreadsheet.worksheet("id", self._id)
+
+    def _syncGrid(self, worksheet: ps.Worksheet):
+        """Every client's copy of the worksheet has its own grid size, keep them equal"""
+        grid = worksheet.jsonSheet["properties"]["gridProperties"]
+        for spreadsheet in self._pool.members:
+            other = self._on(spreadsheet)
+            if other is not worksheet:
+                other.jsonSheet["properties"]["gridProperties"].update(
+                    rowCount=grid["rowCount"], columnCount=grid["columnCount"]
+                )
+
+    def __getattr__(self, name: str) -> Any:
+        if name in PooledWorksheet.kFREE:
+            return getattr(self._on(self._pool.members[0]), name)
+
+        def call(*args, **kwargs):
+            with self._pool.lease() as spreadsheet:
+                worksheet = self._on(spreadsheet)
+                result = getattr(worksheet, name)(*args, **kwargs)
+                self._syncGrid(worksheet)
+                return result
+
+        return call
+
+    def growGrid(self, rows: int = 0, cols: int = 0):
+        for spreadsheet in self._pool.members:
+            growGrid(self._on(spreadsheet), rows, cols)
+
+    def cell(self, addr) -> PooledCell:
+        with self._pool.lease() as spreadsheet:
+            return PooledCell(self, self._on(spreadsheet).cell(addr))
+
+
+class PooledSpreadsheet:
+    """Google Sheets spreadsheet whose calls are spread over a SheetsPool"""
+
+    def __init__(self, pool: SheetsPool):
+        self._pool = pool
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool.members[0], name)
+
+    def worksheet_by_title(self, title: str) -> PooledWorksheet:
+        with self._pool.lease() as spreadsheet:
+            return PooledWorksheet(self._pool, spreadsheet.worksheet_by_title(title).id)
+
+    @property
+    def sheet1(self) -> PooledWorksheet:
+        with self._pool.lease() as spreadsheet:
+            return PooledWorksheet(self._pool, spreadsheet.sheet1.id)
+
+    def custom_request(self, request, fields=None, **kwargs):
+        with self._pool.lease() as spreadsheet:
+            return spreadsheet.custom_request(request, fields, **kwargs)
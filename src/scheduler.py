@@ -0,0 +1,267 @@
+from contextlib import contextmanager
+from enum import IntEnum
+import fcntl
+from functools import wraps
+from hashlib import sha1
+import logging
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+from googleapiclient.errors import HttpError
+
+import metrics
+from storage import Spreadsheet, Worksheet, growGrid
+
+load_dotenv()
+
+
+class Priority(IntEnum):
+    HIGH = 0  # admin writes and score updates
+    NORMAL = 1  # judging, flag checks, sign-ups
+    LOW = 2  # dashboards: scoreboard refreshes, graph
+
+
+class QuotaExhausted(Exception):
+    """A Sheets call couldn't get quota before its priority's deadline"""
+
+
+_context = threading.local()
+
+
+def currentPriority() -> Priority:
+    return getattr(_context, "priority", Priority.NORMAL)
+
+
+@contextmanager
+def priority(level: Priority, override: bool = False):
+    """
+    Run the enclosed Sheets calls at `level`, or the caller's level if that's more
+    urgent. With `override` they run at `level` whatever the caller's.
+    """
+    outer = getattr(_context, "priority", None)
+    _context.priority = level if outer is None or override else min(outer, level)
+    try:
+        yield
+    finally:
+        if outer is None:
+            del _context.priority
+        else:
+            _context.priority = outer
+
+
+def prioritized(level: Priority):
+    """Decorator version of `priority`"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with priority(level):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _defaultPath() -> str:
+    shm = "/dev/shm"
+    directory = shm if os.path.isdir(shm) else tempfile.gettempdir()
+    sheet_hash = sha1(str(os.getenv("SHEET_URL")).encode()).hexdigest()[:8]
+    return os.path.join(directory, f"acmmm-quota-{sheet_hash}")
+
+
+class SharedTokenBuckets:
+    """
+    Token buckets shared by every worker on the machine, since Google counts
+    quota per service account rather than per process.
+
+    Each bucket is a (tokens, updated_at) pair of doubles in one small file,
+    read and written under flock.
+    """
+
+    kSLOT = struct.Struct("<dd")
+
+    def __init__(self, per_minute: dict[str, float], path: str | None = None):
+        self.path = path or os.getenv("SHEETS_QUOTA_FILE") or _defaultPath()
+        self._slots = {name: idx for idx, name in enumerate(per_minute)}
+        self._capacity = dict(per_minute)
+        self._rate = {name: n / 60 for name, n in per_minute.items()}  # tokens per second
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        # flock only excludes other processes, threads of this one share the fd
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, name: str):
+        offset = self._slots[name] * SharedTokenBuckets.kSLOT.size
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(self._fd, SharedTokenBuckets.kSLOT.size, offset)
+                now = time.time()
+                if len(data) < SharedTokenBuckets.kSLOT.size:
+                    tokens, updated_at = self._capacity[name], now  # first use
+                else:
+                    tokens, updated_at = SharedTokenBuckets.kSLOT.unpack(data)
+                tokens = min(
+                    self._capacity[name], tokens + (now - updated_at) * self._rate[name]
+                )
+                state = {"tokens": tokens}
+                yield state
+                os.pwrite(
+                    self._fd, SharedTokenBuckets.kSLOT.pack(state["tokens"], now), offset
+                )
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def take(self, name: str, reserve: float) -> float:
+        """
+        Take a token unless that would leave fewer than `reserve` (a fraction of the
+        bucket) for more urgent callers. Returns 0 on success, else seconds to wait.
+        """
+        floor = reserve * self._capacity[name]
+        with self._locked(name) as state:
+            if state["tokens"] - 1 >= floor:
+                state["tokens"] -= 1
+                return 0.0
+            return (floor + 1 - state["tokens"]) / self._rate[name]
+
+    def drain(self, name: str):
+        """Google said no (429), so nobody on this machine should try for a while"""
+        with self._locked(name) as state:
+            state["tokens"] = min(state["tokens"], 0.0)
+
+
+class Scheduler:
+    """
+    Every Google Sheets call goes through `call`, which waits for quota from
+    the read or write bucket and retries 429s with exponential backoff.
+
+    Priorities share the buckets but lower ones leave a reserve untouched,
+    so score updates still go through while dashboards are being throttled.
+    """
+
+    kRESERVE = {Priority.HIGH: 0.0, Priority.NORMAL: 0.2, Priority.LOW: 0.5}
+    # how long a call may wait for quota (and retries) before giving up
+    kDEADLINE = {Priority.HIGH: 120.0, Priority.NORMAL: 30.0, Priority.LOW: 10.0}
+    kMAX_BACKOFF = 32.0  # seconds
+
+    def __init__(self, reads_per_minute: float, writes_per_minute: float):
+        self._buckets = SharedTokenBuckets(
+            {"read": reads_per_minute, "write": writes_per_minute}
+        )
+
+    def call(self, kind: str, fn: Callable, *args, **kwargs):
+        level = currentPriority()
+        start = time.time()
+        deadline = start + Scheduler.kDEADLINE[level]
+        attempt = 0
+        while True:
+            wait = self._buckets.take(kind, Scheduler.kRESERVE[level])
+            if wait > 0:
+                if time.time() + wait > deadline:
+                    raise QuotaExhausted(f"no {kind} quota for {level.name} priority")
+                time.sleep(min(wait, 1.0))  # recheck, others may refill or drain it
+                continue
+            metrics.quota_wait.observe(time.time() - start, kind, level.name)
+            try:
+                return fn(*args, **kwargs)
+            except HttpError as error:
+                if error.resp.status != 429:
+                    raise
+                metrics.throttled.inc(kind, level.name)
+                self._buckets.drain(kind)
+                backoff = min(2**attempt + random.random(), Scheduler.kMAX_BACKOFF)
+                attempt += 1
+                if time.time() + backoff > deadline:
+                    raise QuotaExhausted(
+                        f"{kind} still throttled after {attempt} tries"
+                    ) from error
+                logging.warning(f"SCHEDULER: 429 on {kind}, retrying in {backoff:.1f}s")
+                time.sleep(backoff)
+                start = time.time()
+
+
+class ScheduledCell:
+    def __init__(self, worksheet: "ScheduledWorksheet", cell):
+        self._worksheet = worksheet
+        self._cell = cell
+
+    @property
+    def value(self) -> str:
+        return self._cell.value
+
+    def set_value(self, value):
+        self._worksheet._scheduler.call("write", self._cell.set_value, value)
+
+    def set_text_format(self, attribute, value):
+        self._worksheet._scheduler.call(
+            "write", self._cell.set_text_format, attribute, value
+        )
+
+
+class ScheduledWorksheet:
+    kFREE = ("title", "id", "rows", "cols")  # cached, no request behind them
+    kREADS = (
+        "get_row",
+        "get_col",
+        "get_value",
+        "get_values",
+        "get_all_values",
+        "get_all_records",
+        "get_as_df",
+        "refresh",
+    )
+
+    def __init__(self, worksheet: Worksheet, scheduler: Scheduler):
+        self._worksheet = worksheet
+        self._scheduler = scheduler
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._worksheet, name)
+        if name in ScheduledWorksheet.kFREE or not callable(attr):
+            return attr
+        kind = "read" if name in ScheduledWorksheet.kREADS else "write"
+
+        def call(*args, **kwargs):
+            return self._scheduler.call(kind, attr, *args, **kwargs)
+
+        return call
+
+    def growGrid(self, rows: int = 0, cols: int = 0):
+        growGrid(self._worksheet, rows, cols)
+
+    def cell(self, addr) -> ScheduledCell:
+        return ScheduledCell(self, self._scheduler.call("read", self._worksheet.cell, addr))
+
+
+class ScheduledSpreadsheet:
+    """Google Sheets spreadsheet whose every call goes through a Scheduler"""
+
+    def __init__(self, spreadsheet: Spreadsheet, scheduler: Scheduler):
+        self._spreadsheet = spreadsheet
+        self._scheduler = scheduler
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._spreadsheet, name)
+
+    # no quota for these: pygsheets finds worksheets in the metadata it fetched
+    # when the spreadsheet was opened, it only asks again for unknown titles
+    def worksheet_by_title(self, title: str) -> ScheduledWorksheet:
+        return ScheduledWorksheet(
+            self._spreadsheet.worksheet_by_title(title), self._scheduler
+        )
+
+    @property
+    def sheet1(self) -> ScheduledWorksheet:
+        return ScheduledWorksheet(self._spreadsheet.sheet1, self._scheduler)
+
+    def custom_request(self, request, fields=None, **kwargs):
+        return self._scheduler.call(
+            "write", self._spreadsheet.custom_request, request, fields, **kwargs
+        )
@@ -1,284 +1,920 @@
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+import gzip
 from hashlib import new
 from hashlib import sha1
 import json
 import logging
 from os import getenv
 import re
+import threading
 import time
-from typing import Literal
+from typing import Callable, Literal, NamedTuple
 
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
 import pygsheets as ps
 
 from client import Client
 from ctf import CTF
+from events import Broadcaster, ScoreEvents, ScoreHistory
 from graph import Graph
+from jobs import Jobs
 from judge import Judge
+from leaderboard import Leaderboard
 from logger import Logger
+import metrics
+from persist import CacheFile
 from sanitize import sanitize
+from scheduler import Priority, priority, prioritized
+from snapshot import ScoreboardSnapshot, SharedLock, SharedLocks, SharedSnapshot
+from solves import SharedSolves
+from storage import BatchRequest, Worksheet, growGrid
+from submissions import Submissions
+from tokens import Tokens
+from writer import Writer
 from gettime import gettime
-from ctf import CTF
 
 load_dotenv()
 kPOINTS = json.loads(getenv("POINTS"))  # type: ignore
 
 
+class ScoreboardBody(NamedTuple):
+    """The /scoreboard response for one snapshot, serialized once"""
+
+    seq: int
+    etag: str
+    last_modified: float
+    body: bytes
+    gzip_body: bytes
+
+
+def _toScore(value) -> int:
+    """A scoreboard cell as an int, 0 if it isn't a number (like the old to_numeric/fillna)"""
+    if type(value) is int:
+        return value
+    text = str(value).replace(",", "").strip()
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        number = float(text)
+    except ValueError:
+        return 0
+    return int(number) if np.isfinite(number) else 0
+
+
+def _scoreboardJson(snapshot: ScoreboardSnapshot) -> bytes:
+    """
+    The scoreboard as flask_restful made of `DataFrame.to_json(orient="records")`:
+    a JSON string holding [{"-": event, team: score, ...}, ...].
+    """
+    records = [
+        {"-": event, **dict(zip(snapshot.teams, row))}
+        for event, row in zip(snapshot.events, snapshot.scores.tolist())
+    ]
+    # pandas doesn't put spaces after separators and escapes slashes
+    inner = json.dumps(records, separators=(",", ":")).replace("/", "\\/")
+    return (json.dumps(inner) + "\n").encode()
+
+
+def _cellKey(event_name: str, team_name: str) -> str:
+    """Names a score for SharedLocks"""
+    return f"{event_name}\t{team_name}"
+
+
+def _syncRecord(
+    previous: ScoreboardSnapshot | None,
+    teams: list[str],
+    events: list[str],
+    scores: np.ndarray,
+) -> dict:
+    """The ScoreEvents "sync" fields that take `previous` to the given scoreboard"""
+    if (
+        previous is None
+        or previous.teams != teams[: len(previous.teams)]
+        or previous.events != events[: len(previous.events)]
+    ):
+        return {"teams": [], "events": [], "changes": [], "reset": True}
+    before = np.zeros_like(scores)
+    before[: len(previous.events), : len(previous.teams)] = previous.scores
+    changes = [
+        [teams[col], events[row], int(scores[row, col])]
+        for row, col in np.argwhere(scores != before)
+    ]
+    return {
+        "teams": teams[len(previous.teams) :],
+        "events": events[len(previous.events) :],
+        "changes": changes,
+        "reset": False,
+    }
+
+
 class Sheet:
-    kSCOREBOARD_DELAY = 10  # how often to refetch scoreboard data
+    # how often to refetch scoreboard data
+    kSCOREBOARD_DELAY = float(getenv("SCOREBOARD_TTL", 10))
+    # past this age callers wait for a refetch instead of getting the old snapshot
+    kSCOREBOARD_MAX_STALENESS = float(getenv("SCOREBOARD_MAX_STALENESS", 60))
+    kWARMUP_RETRY = 5  # seconds between warm-up attempts
+    kCACHE_SAVE_INTERVAL = 60  # seconds between saves of the caches to disk
 
     def __init__(self):
         self._client = Client()
+        self._writer = Writer()
         self._logger = Logger(self._client)
-        self._judge = Judge(self._client.problems, self._client.submissions)
-        self._ctf = CTF(self._client.ctf, self._client.submissions)
+        self._submission_store = Submissions(self._client.submissions, self._writer)
+        self._judge = Judge(
+            self._client.problems, self._submission_store, SharedSolves()
+        )
+        self._ctf = CTF(self._client.ctf, self._submission_store)
+        self._graph = Graph(self._client.log)
+        self._judging = Jobs()
         self._scoreboard = self._client.scoreboard
         self._tokens = self._client.tokens
+        self._token_index = Tokens(self._tokens)
+        self._adjectives = [
+            line.strip() for line in open("../assets/adjectives.txt", "r").readlines()
+        ]
+        self._nouns = [line.strip() for line in open("../assets/nouns.txt", "r").readlines()]
         self._teams = self._client.teams
-        self._submissions = self._client.submissions
-        self.last_scoreboard_fetch_time = time.time()
-        self.last_scoreboard_fetch_data: pd.DataFrame | Literal[False] = False
+        # scoreboard snapshot shared with the other workers on this machine
+        self._snapshot = SharedSnapshot()
+        self._refresh_lock = threading.Lock()  # at most one refetch in flight
+        self._scoreboard_seq = 0
+        self._scoreboard_data: pd.DataFrame | Literal[False] = False
+        self._scoreboard_body: ScoreboardBody | None = None
+        # held by one worker at a time while it adds teams/events or renames a team,
+        # so two workers can't both add a team or claim the same column. The layout
+        # they go by is the shared snapshot's, which every change is published to.
+        self._layout_lock = SharedLock(self._snapshot.path + ".layout")
+        # held by whoever is changing a score, from reading it until the sheet has the
+        # new one, so writes to a cell reach the sheet in order; see _applyScore
+        self._cell_locks = SharedLocks(self._snapshot.path + ".cells")
+        # score changes from every worker, streamed to this worker's subscribers
+        self._score_events = ScoreEvents()
+        self._score_history = ScoreHistory(self._score_events)
+        self._leaderboard = Leaderboard(self._score_history)
+        self._broadcaster = Broadcaster(self._score_events, self.getScoreboardState)
+        # caches saved by the last run, so a restart doesn't start from nothing
+        self._cache_file = CacheFile()
+        self._caches = {
+            "tokens": self._token_index,
+            "submissions": self._submission_store,
+            "answers": self._judge,
+            "flags": self._ctf,
+            "graph": self._graph,
+        }
+        # nothing above talks to Google, the warm-up does that off the import path
+        self._ready = threading.Event()  # caches filled, from disk or the sheet
+        self._caught_up = threading.Event()  # caches reconciled with the sheet
+        if self._restoreCaches():
+            self._ready.set()
+        threading.Thread(target=self._warmUp, name="warmup", daemon=True).start()
+        threading.Thread(
+            target=self._saveCachesPeriodically, name="cache-saver", daemon=True
+        ).start()
+        atexit.register(self._saveCachesAtExit)
 
-    def getScoreboard(self) -> pd.DataFrame | Literal[False]:
-        current_time = time.time()
-        if (
-            current_time - self.last_scoreboard_fetch_time < Sheet.kSCOREBOARD_DELAY
-            and type(self.last_scoreboard_fetch_data) is pd.DataFrame
-        ):
-            # cheap work
-            print("cheap")
-            return self.last_scoreboard_fetch_data
+    def _warmUp(self):
+        """
+        Open the everyday worksheets and fill (or, after a restore, catch up) the
+        caches most requests need, each step alongside the others, then report
+        ready. Retried until it works; requests that come in before then fill
+        whatever they need themselves.
+        """
+        start = time.time()
+        while True:
+            try:
+                self._client.openEager()
+                with ThreadPoolExecutor(4, thread_name_prefix="warmup") as pool:
+                    steps = [
+                        pool.submit(self._reconcileScoreboard),
+                        pool.submit(self._token_index.load),
+                        pool.submit(self._submission_store.sync, True),
+                        pool.submit(self._graph.update, True),
+                    ]
+                    for step in steps:
+                        step.result()
+                break
+            except Exception:
+                logging.exception("WARMUP: failed, trying again")
+                time.sleep(Sheet.kWARMUP_RETRY)
+        self._caught_up.set()
+        self._ready.set()
+        logging.info(f"WARMUP: caught up in {time.time() - start:.2f}s")
 
-        # expensive work
-        print("expensive")
-        self.last_scoreboard_fetch_time = current_time
-        scoreboard_data = self._scoreboard.get_as_df()
-        self.last_scoreboard_fetch_data = scoreboard_data
-        return scoreboard_data
+    def _reconcileScoreboard(self):
+        """Refetch the scoreboard unless another worker just did"""
+        with self._refresh_lock:
+            self._refreshScoreboard(blocking=True)
+        snapshot = self._snapshot.read()
+        assert snapshot is not None
+        self._leaderboard.sync(snapshot)
 
-    @sanitize
-    def _findEvent(self, event_name: str) -> ps.Cell:
-        cells = list(
-            filter(
-                lambda c: c.value == event_name,
-                self._scoreboard.get_col(
-                    1, returnas="cell", include_tailing_empty=False
-                ),
+    def isReady(self) -> bool:
+        """Whether this worker has filled its caches, from disk or from the sheet"""
+        return self._ready.is_set()
+
+    def waitReady(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def waitCaughtUp(self, timeout: float | None = None) -> bool:
+        return self._caught_up.wait(timeout)
+
+    def _dumpScoreboard(self) -> dict | None:
+        snapshot = self._snapshot.read()
+        if snapshot is None:
+            return None
+        return {
+            "fetched_at": snapshot.fetched_at,
+            "modified_at": snapshot.modified_at,
+            "teams": snapshot.teams,
+            "events": snapshot.events,
+            "scores": snapshot.scores.tolist(),
+        }
+
+    def _restoreScoreboard(self, state: dict):
+        """Publish the saved scoreboard, unless the shared one survived (e.g. only we restarted)"""
+        self._snapshot.lock()
+        try:
+            if self._snapshot.read() is not None:
+                return
+            teams, events = state["teams"], state["events"]
+            scores = np.array(state["scores"], dtype=np.int64).reshape(
+                len(events), len(teams)
             )
+            version = self._snapshot.publish(
+                teams,
+                events,
+                scores,
+                state["fetched_at"],
+                state["modified_at"],
+                restored=True,
+            )
+            self._score_events.append(
+                {
+                    "type": "sync",
+                    "version": version,
+                    "time": time.time(),
+                    **_syncRecord(None, teams, events, scores),
+                }
+            )
+        finally:
+            self._snapshot.unlock()
+
+    def _restoreCaches(self) -> bool:
+        """
+        Load what the last run saved. Returns whether that covers the scoreboard,
+        tokens and submissions, enough to serve from until the warm-up catches up.
+        """
+        start = time.time()
+        sections = self._cache_file.load()
+        for name, cache in self._caches.items():
+            if name not in sections:
+                continue
+            try:
+                cache.loadState(sections[name])
+            except Exception:
+                logging.exception(f"CACHE: couldn't restore {name}")
+        if "scoreboard" in sections:
+            self._restoreScoreboard(sections["scoreboard"])
+        if len(sections):
+            logging.info(
+                f"CACHE: restored {sorted(sections)} in {time.time() - start:.3f}s"
+            )
+        return self._snapshot.read() is not None and all(
+            name in sections for name in ("tokens", "submissions")
         )
 
-        if len(cells) == 0:
-            raise ps.CellNotFound(
-                f"Could not find event: {event_name}. Check spelling (case sensitive)."
+    def saveCaches(self):
+        """Write the caches to the cache file (see persist.py) for the next start"""
+        sections = {name: cache.dumpState() for name, cache in self._caches.items()}
+        sections["scoreboard"] = self._dumpScoreboard()
+        self._cache_file.save(sections)
+
+    def _saveCachesPeriodically(self):
+        while True:
+            time.sleep(Sheet.kCACHE_SAVE_INTERVAL)
+            if self._cache_file.getAge() < Sheet.kCACHE_SAVE_INTERVAL:
+                continue  # another worker just saved
+            try:
+                self.saveCaches()
+            except Exception:
+                logging.exception("CACHE: couldn't save")
+
+    def _saveCachesAtExit(self):
+        try:
+            self.saveCaches()
+        except Exception:
+            logging.exception("CACHE: couldn't save on the way out")
+
+    def _fetchScoreboard(self):
+        """Download the scoreboard and publish it for every worker, call while holding the snapshot lock"""
+        previous = self._snapshot.read()
+        # scores on their way to the sheet, which we'd fetch from under them
+        writing = set()
+        if previous is not None and not previous.restored:
+            writing = self._cell_locks.held(
+                _cellKey(event, team) for event in previous.events for team in previous.teams
+            )
+        fetch_time = time.time()
+        with priority(Priority.LOW):
+            values = self._scoreboard.get_all_values(
+                include_tailing_empty=False, include_tailing_empty_rows=False
             )
-        return cells[0]
+        assert len(values), "Empty scoreboard on fetch"
+        teams = [str(team) for team in values[0][1:]]
+        events = [str(row[0]) if len(row) else "" for row in values[1:]]
+        scores = np.zeros((len(events), len(teams)), dtype=np.int64)
+        for row_idx, row in enumerate(values[1:]):
+            for col_idx, value in enumerate(row[1 : len(teams) + 1]):
+                scores[row_idx, col_idx] = _toScore(value)
+        if len(writing):
+            assert previous is not None
+            event_idx = {event: idx for idx, event in reversed(list(enumerate(events)))}
+            team_idx = {team: idx for idx, team in reversed(list(enumerate(teams)))}
+            for key in writing:
+                event, team = key.split("\t")
+                if event in event_idx and team in team_idx:
+                    scores[event_idx[event], team_idx[team]] = previous.scores[
+                        previous.event_idx[event], previous.team_idx[team]
+                    ]
+        version = self._snapshot.publish(teams, events, scores, fetch_time)
+        self._score_events.append(
+            {
+                "type": "sync",
+                "version": version,
+                "time": fetch_time,
+                **_syncRecord(previous, teams, events, scores),
+            }
+        )
 
-    @sanitize
-    def _findTeam(self, team_name: str) -> ps.Cell:
-        cells = list(
-            filter(
-                lambda c: c.value == team_name,
-                self._scoreboard.get_row(
-                    1, returnas="cell", include_tailing_empty=False
-                ),
+    def _extendScoreboard(
+        self,
+        base: ScoreboardSnapshot,
+        teams: list[str] | None = None,
+        events: list[str] | None = None,
+    ):
+        """
+        Add zeroed columns for `teams` and rows for `events` to the shared snapshot,
+        once they've been added to the sheet right after `base`'s. Call while holding
+        _layout_lock, with `base` from _layoutSnapshot.
+        """
+        teams, events = teams or [], events or []
+        self._snapshot.lock()
+        try:
+            snapshot = self._snapshot.read()
+            assert snapshot is not None
+            if (len(snapshot.teams), len(snapshot.events)) != (
+                len(base.teams),
+                len(base.events),
+            ):
+                return  # refetched since we changed the sheet, so it has them
+            scores = np.zeros(
+                (len(snapshot.events) + len(events), len(snapshot.teams) + len(teams)),
+                dtype=np.int64,
             )
+            scores[: len(snapshot.events), : len(snapshot.teams)] = snapshot.scores
+            now = time.time()
+            version = self._snapshot.publish(
+                snapshot.teams + teams,
+                snapshot.events + events,
+                scores,
+                snapshot.fetched_at,
+                now,
+            )
+            self._score_events.append(
+                {
+                    "type": "sync",
+                    "version": version,
+                    "time": now,
+                    "teams": teams,
+                    "events": events,
+                    "changes": [],
+                    "reset": False,
+                }
+            )
+        finally:
+            self._snapshot.unlock()
+
+    def _age(self, snapshot: ScoreboardSnapshot | None) -> float:
+        if snapshot is None:
+            return float("inf")
+        return time.time() - snapshot.fetched_at
+
+    def _refreshScoreboard(self, blocking: bool):
+        """Refetch unless another worker is already on it, hold _refresh_lock"""
+        if not self._snapshot.lock(blocking=blocking):
+            return
+        try:
+            # whoever held the lock before us may have just refreshed
+            age = self._age(self._snapshot.read())
+            if age >= Sheet.kSCOREBOARD_DELAY:
+                logging.debug(f"SCOREBOARD: refetching, {age:.1f}s old")
+                self._fetchScoreboard()
+        finally:
+            self._snapshot.unlock()
+
+    def _refreshScoreboardInBackground(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # already refreshing
+
+        def refresh():
+            try:
+                self._refreshScoreboard(blocking=False)
+            except Exception:
+                logging.exception("Couldn't refresh scoreboard in background")
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _currentSnapshot(self) -> ScoreboardSnapshot:
+        """The shared snapshot, refetched first if it's too old to serve"""
+        snapshot = self._snapshot.read()
+        age = self._age(snapshot)
+        # until the warm-up catches up, a restored snapshot beats waiting
+        if age >= Sheet.kSCOREBOARD_MAX_STALENESS and (
+            snapshot is None or self._caught_up.is_set()
+        ):
+            # too old (or missing) to serve, wait for the refetch
+            metrics.scoreboard_cache.inc("miss")
+            with self._refresh_lock:
+                self._refreshScoreboard(blocking=True)
+            snapshot = self._snapshot.read()
+        elif age >= Sheet.kSCOREBOARD_DELAY:
+            # serve what we have, refetch for the next caller
+            metrics.scoreboard_cache.inc("stale")
+            self._refreshScoreboardInBackground()
+        else:
+            metrics.scoreboard_cache.inc("hit")
+        assert snapshot is not None
+        return snapshot
+
+    def _layoutSnapshot(self) -> ScoreboardSnapshot:
+        """
+        The shared snapshot as the base for a layout change, call while holding
+        _layout_lock: no worker can add to it until we publish ours.
+        """
+        self._snapshot.lock()
+        try:
+            return self._writableSnapshot()
+        finally:
+            self._snapshot.unlock()
+
+    def _writableSnapshot(self) -> ScoreboardSnapshot:
+        """
+        The shared snapshot as the base for a change to the sheet, call while holding
+        the snapshot lock. One restored from the cache file can be up to a day behind
+        the sheet, so it's only ever read from: refetched before anything is written.
+        """
+        snapshot = self._snapshot.read()
+        if snapshot is None or snapshot.restored:
+            self._fetchScoreboard()
+            snapshot = self._snapshot.read()
+        assert snapshot is not None
+        return snapshot
+
+    def getScoreboard(self) -> pd.DataFrame | Literal[False]:
+        """
+        The scoreboard as a DataFrame ("-" column of events, then one per team).
+        Built on demand, everything in here works off the snapshot's matrix.
+        """
+        snapshot = self._currentSnapshot()
+        if (
+            snapshot.seq != self._scoreboard_seq
+            or type(self._scoreboard_data) is not pd.DataFrame
+        ):
+            df = pd.DataFrame(snapshot.scores.copy(), columns=snapshot.teams)
+            df.insert(0, "-", snapshot.events)
+            self._scoreboard_data = df
+            self._scoreboard_seq = snapshot.seq
+        return self._scoreboard_data
+
+    def getScoreboardBody(self) -> ScoreboardBody:
+        """
+        Returns the serialized scoreboard, redone only when the snapshot changes.
+        The body matches what flask_restful made of `to_json(orient="records")`.
+        """
+        snapshot = self._currentSnapshot()
+        cached = self._scoreboard_body
+        if cached is not None and cached.seq == snapshot.seq:
+            metrics.scoreboard_body_cache.inc("hit")
+            return cached
+        metrics.scoreboard_body_cache.inc("miss")
+
+        body = _scoreboardJson(snapshot)
+        self._scoreboard_body = ScoreboardBody(
+            seq=snapshot.seq,
+            etag=sha1(body).hexdigest(),
+            last_modified=snapshot.modified_at,
+            body=body,
+            gzip_body=gzip.compress(body),
         )
-        if len(cells) == 0:
+        return self._scoreboard_body
+
+    def getScoreboardState(self) -> dict:
+        """
+        The whole scoreboard as {version, fetched_at, teams, events, scores}, where
+        scores[i][j] is events[i] for teams[j]. `version` goes up with every change.
+        """
+        snapshot = self._currentSnapshot()
+        return {
+            "version": snapshot.seq,
+            "fetched_at": snapshot.fetched_at,
+            "teams": snapshot.teams,
+            "events": snapshot.events,
+            "scores": snapshot.scores.tolist(),
+        }
+
+    def getScoreboardChanges(self, since: int) -> dict:
+        """
+        What changed after scoreboard version `since`, as {full: False, version,
+        teams, events, changes} (see ScoreHistory.since), or the whole scoreboard
+        as getScoreboardState plus full: True when the changes aren't known.
+        """
+        snapshot = self._currentSnapshot()
+        changes = self._score_history.since(since, snapshot.seq)
+        if changes is None:
+            return {"full": True, **self.getScoreboardState()}
+        return {"full": False, **changes}
+
+    def subscribeScores(self):
+        """
+        Queue of ("scoreboard" | "score", data) messages, None when dropped. Returns
+        None instead of a queue if this worker has all the subscribers it can take.
+        """
+        return self._broadcaster.subscribe()
+
+    def unsubscribeScores(self, subscriber):
+        self._broadcaster.unsubscribe(subscriber)
+
+    @sanitize
+    def _findTeam(self, snapshot: ScoreboardSnapshot, team_name: str) -> int:
+        """Returns the scoreboard column of `team_name`"""
+        idx = snapshot.team_idx.get(team_name, None)
+        if idx is None:
             raise ps.CellNotFound(
                 f"Could not find team: {team_name}. Check spelling (case sensitive)."
             )
-        return cells[0]
+        return idx + 2  # first team is in column B
 
+    @prioritized(Priority.HIGH)
     @sanitize
     def changeTeamName(self, old_team_name: str, new_team_name: str):
-        old_team_cell: ps.Cell = self._findTeam(old_team_name)
-        old_team_cell.set_value(new_team_name)
-        old_team_cell.link(self._scoreboard, update=True)
-        self._logger.log()
+        with self._layout_lock:
+            col = self._findTeam(self._layoutSnapshot(), old_team_name)
+            self._scoreboard.update_value((1, col), new_team_name)
+            # renames are rare, just refetch so every worker sees it
+            self._snapshot.lock()
+            try:
+                self._fetchScoreboard()
+            finally:
+                self._snapshot.unlock()
+        self._logger.log("changeTeamName", team=new_team_name, detail=old_team_name)
         return f'Successfully changed team: "{old_team_name}" to "{new_team_name}"', 200
 
-    def _getNumberOfTeams(self) -> int:
-        header_row = self._scoreboard.get_row(1, include_tailing_empty=False)
-        return len(header_row) - 1
-
-    def _getNumberOfEvents(self) -> int:
-        leading_col = self._scoreboard.get_col(1, include_tailing_empty=False)
-        return len(leading_col) - 1
-
     @sanitize
     def createTeam(self, team_name: str, member_name: str):
-        team_name = re.sub(r"[^a-zA-Z]", "", team_name).lower()
-        if (
-            len(team_name) <= 1
-            or len(team_name) > 32
-            or len(member_name) <= 1
-            or len(member_name) > 32
-        ):
+        return self.createTeams([(team_name, member_name)])[0]
+
+    @sanitize
+    def _sanitizeNames(self, *names: str) -> tuple[str, ...]:
+        """
+        `names` as letters only, lowercase. @sanitize drops the ones containing "<"
+        but leaves "woc" names as they are, which would never match a score lookup.
+        """
+        return tuple(re.sub(r"[^a-zA-Z]", "", name).lower() for name in names)
+
+    @prioritized(Priority.HIGH)
+    def createTeams(self, teams: list[tuple[str, str]]) -> list[dict]:
+        """
+        Register every (team_name, member_name) pair in `teams`. All the new teams
+        are written to the scoreboard, tokens and teams sheets in a single request.
+        """
+        with self._layout_lock:
+            return self._createTeams(teams)
+
+    def _createTeams(self, teams: list[tuple[str, str]]) -> list[dict]:
+        snapshot = self._layoutSnapshot()
+        if any(not self._token_index.hasTeam(team) for team in snapshot.team_idx):
+            # another worker added teams, so it has tokens we don't know about
+            self._token_index.load()
+        results = []
+        new_teams: list[tuple[str, str, str]] = []  # (team_name, member_name, token)
+        taken_tokens: set[str] = set()
+        for team_name, member_name in teams:
+            names = self._sanitizeNames(team_name, member_name)
+            # sanitize drops arguments it won't take at all
+            team_name, member_name = names if len(names) == 2 else ("", "")
+            if (
+                len(team_name) <= 1
+                or len(team_name) > 32
+                or len(member_name) <= 1
+                or len(member_name) > 32
+            ):
+                results.append(
+                    {
+                        "message": "Invalid team name length. Length must be greater than 1 and less than 33",
+                        "token": "",
+                        "team_name": team_name,
+                        "status": 403,
+                    }
+                )
+                continue
+            if team_name in snapshot.team_idx or any(
+                team_name == new_team[0] for new_team in new_teams
+            ):
+                results.append(
+                    {
+                        "message": f'Team: "{team_name}" already exists!',
+                        "token": "",
+                        "team_name": team_name,
+                        "status": 304,
+                    }
+                )
+                continue
+            token = self._generateToken(team_name, taken_tokens)
+            taken_tokens.add(token)
+            new_teams.append((team_name, member_name, token))
+            results.append(
+                {
+                    "message": f"Team {team_name} created successfully",
+                    "token": token,
+                    "team_name": team_name,
+                    "status": 200,
+                }
+            )
+
+        if len(new_teams):
+            self._insertTeams(snapshot, new_teams)
+        return results
+
+    def _insertTeams(
+        self, snapshot: ScoreboardSnapshot, new_teams: list[tuple[str, str, str]]
+    ):
+        """
+        Add scoreboard columns plus tokens/teams rows for `new_teams` in one batch
+        update, call while holding _layout_lock with `snapshot` from _layoutSnapshot
+        """
+        idx = len(snapshot.teams) + 1  # right after the last team
+        number = len(new_teams)
+
+        def insert(worksheet: Worksheet, dimension: str) -> BatchRequest:
             return {
-                "message": "Invalid team name length. Length must be greater than 1 and less than 33",
-                "token": "",
-                "team_name": team_name,
-                "status": 403,
+                "insertDimension": {
+                    "inheritFromBefore": False,
+                    "range": {
+                        "sheetId": worksheet.id,
+                        "dimension": dimension,
+                        "startIndex": idx,
+                        "endIndex": idx + number,
+                    },
+                }
             }
-        try:
-            self._findTeam(team_name)
-        except:
-            idx = self._getNumberOfTeams() + 1
-            zero_pad = [0 for _ in range(self._getNumberOfEvents())]
-            token = self._generateToken(team_name)
-            self._scoreboard.insert_cols(idx, values=[team_name, *zero_pad])
-            self._tokens.insert_rows(idx, values=[team_name, token])
-            self._teams.insert_rows(idx, values=[team_name, member_name])
-            self._logger.log(token=token)
+
+        def update(worksheet: Worksheet, row: int, col: int, values: list[list]) -> BatchRequest:
+            rows = [
+                {
+                    "values": [
+                        {"userEnteredValue": {"numberValue": v}}
+                        if type(v) is int
+                        else {"userEnteredValue": {"stringValue": v}}
+                        for v in row_values
+                    ]
+                }
+                for row_values in values
+            ]
             return {
-                "message": f"Team {team_name} created successfully",
-                "token": token,
-                "team_name": team_name,
-                "status": 200,
+                "updateCells": {
+                    "start": {"sheetId": worksheet.id, "rowIndex": row, "columnIndex": col},
+                    "rows": rows,
+                    "fields": "userEnteredValue",
+                }
             }
-        return {
-            "message": f'Team: "{team_name}" already exists!',
-            "token": "",
-            "team_name": team_name,
-            "status": 304,
-        }
 
+        team_names = [team_name for team_name, _, _ in new_teams]
+        zero_pad = [[0] * number for _ in snapshot.events]
+        requests = [
+            insert(self._scoreboard, "COLUMNS"),
+            update(self._scoreboard, 0, idx, [team_names, *zero_pad]),
+            insert(self._tokens, "ROWS"),
+            update(self._tokens, idx, 0, [[team, token] for team, _, token in new_teams]),
+            insert(self._teams, "ROWS"),
+            update(self._teams, idx, 0, [[team, member] for team, member, _ in new_teams]),
+        ]
+        self._client.sheet.custom_request(requests, fields="replies")
+        growGrid(self._scoreboard, cols=number)
+        growGrid(self._tokens, rows=number)
+        growGrid(self._teams, rows=number)
+
+        # every worker goes by the shared snapshot, so they all see the new columns
+        self._extendScoreboard(snapshot, teams=team_names)
+        for team_name, _, token in new_teams:
+            self._token_index.add(team_name, token)
+            self._logger.log("createTeam", team=team_name, detail=token)
+
+    @prioritized(Priority.HIGH)
     @sanitize
     def createEvent(self, event_name: str):
-        idx = self._getNumberOfEvents() + 1
-        zero_pad = [0 for _ in range(self._getNumberOfTeams())]
-        self._scoreboard.insert_rows(idx, values=[event_name, *zero_pad])
-        self._logger.log()
+        with self._layout_lock:
+            snapshot = self._layoutSnapshot()
+            idx = len(snapshot.events) + 1  # right after the last event
+            zero_pad = [0 for _ in snapshot.teams]
+            self._scoreboard.insert_rows(idx, values=[event_name, *zero_pad])
+            self._extendScoreboard(snapshot, events=[event_name])
+        self._logger.log("createEvent", event=event_name)
         return f'Event: "{event_name}" created', 200
 
     @sanitize
-    def _getEventTeamCell(
-        self, event_name: str, team_name: str
-    ) -> tuple[int, int] | None:
-        try:
-            team_cell = self._findTeam(team_name)
-            event_cell = self._findEvent(event_name)
-        except:
-            print(
-                "Couldn't find team or event in _getEventTeamCell",
-                event_name,
-                team_name,
-            )
-        else:
-            # !! probably breaks when over 26 teams due to 'AA' label
-            # return team_cell.label[0] + event_cell.label[1:]
-            return (event_cell.row, team_cell.col)
-
-        return None
-
-    @sanitize
-    def getScores(self, team_name: str) -> tuple[dict[int, int], dict[str, int]]:
-        sb = self.getScoreboard()
-        assert type(sb) is pd.DataFrame
-
-        events = dict(sb["-"])
-        event_to_idx = {k: v for (v, k) in events.items()}
-        return sb[team_name], event_to_idx
+    def getScores(self, team_name: str) -> tuple[list[int], dict[str, int]]:
+        """The team's score in every event, and the event -> index lookup for them"""
+        snapshot = self._currentSnapshot()
+        col = snapshot.team_idx[team_name]
+        return snapshot.scores[:, col].tolist(), snapshot.event_idx
 
     @sanitize
     def getTotal(self, team_name: str) -> int:
-        row = self.getScores(team_name)
-        return sum(row[0])
+        self._leaderboard.sync(self._currentSnapshot())
+        total = self._leaderboard.getTotal(team_name)
+        if total is None:
+            raise KeyError(team_name)
+        return total
+
+    def getLeaderboard(self, top: int, team_name: str | None = None) -> dict:
+        """
+        {version, leaderboard: [{rank, team, total}] for the `top` teams, and
+        team: {rank, team, total} for `team_name` (None if there's no such team)}
+        """
+        snapshot = self._currentSnapshot()
+        self._leaderboard.sync(snapshot)
+        result: dict = {
+            "version": self._leaderboard.getVersion(),
+            "leaderboard": self._leaderboard.getTop(top),
+        }
+        if team_name is not None:
+            rank = self._leaderboard.getRank(team_name)
+            result["team"] = (
+                None
+                if rank is None
+                else {
+                    "rank": rank,
+                    "team": team_name,
+                    "total": self._leaderboard.getTotal(team_name),
+                }
+            )
+        return result
 
     @sanitize
     def getScore(self, team_name: str, event_name: str) -> int:
-        team_col, event_to_idx = self.getScores(team_name)
-        score_idx = event_to_idx[event_name]
-        score = team_col[score_idx]
-        return score
+        snapshot = self._currentSnapshot()
+        return int(
+            snapshot.scores[snapshot.event_idx[event_name], snapshot.team_idx[team_name]]
+        )
+
+    def _applyScore(
+        self, event_name: str, team_name: str, update: Callable[[int], int]
+    ) -> tuple[int, int]:
+        """
+        Set the (event, team) score to `update(current score)` in the shared score
+        matrix and write it to the sheet with a single cell update. Returns (new
+        score, team total).
 
+        The snapshot lock is only held to update the matrix, so concurrent updates
+        from any worker apply one after the other without waiting on each other's
+        Sheets call. The cell's lock is held from reading the score until the sheet
+        has the new one, so writes to one cell reach the sheet in the order they
+        were made, and a refetch meanwhile keeps our score rather than the sheet's.
+        """
+        with self._cell_locks.hold(_cellKey(event_name, team_name)):
+            self._snapshot.lock()
+            try:
+                snapshot = self._writableSnapshot()
+                if team_name not in snapshot.team_idx or event_name not in snapshot.event_idx:
+                    # team or event added since the last fetch
+                    self._fetchScoreboard()
+                    snapshot = self._snapshot.read()
+                assert snapshot is not None
+                if team_name not in snapshot.team_idx or event_name not in snapshot.event_idx:
+                    raise ps.CellNotFound(f"No score for {team_name=} in {event_name=}")
+                row = snapshot.event_idx[event_name]
+                col = snapshot.team_idx[team_name]
+                previous = int(snapshot.scores[row, col])
+                score = update(previous)
+                total = self._setCell(snapshot, event_name, team_name, score)
+            finally:
+                self._snapshot.unlock()
+            try:
+                self._scoreboard.update_value((row + 2, col + 2), str(score))
+            except Exception:
+                # nobody else can have changed the cell since, put it back
+                self._snapshot.lock()
+                try:
+                    snapshot = self._snapshot.read()
+                    if (
+                        snapshot is not None
+                        and event_name in snapshot.event_idx
+                        and team_name in snapshot.team_idx
+                    ):
+                        self._setCell(snapshot, event_name, team_name, previous)
+                finally:
+                    self._snapshot.unlock()
+                raise
+        return score, total
+
+    def _setCell(
+        self, snapshot: ScoreboardSnapshot, event_name: str, team_name: str, score: int
+    ) -> int:
+        """
+        Set one score of the shared matrix and tell every worker, call while holding
+        the snapshot lock. Returns the team's total.
+        """
+        col = snapshot.team_idx[team_name]
+        version = self._snapshot.setScore(snapshot.event_idx[event_name], col, score)
+        total = int(snapshot.scores[:, col].sum())
+        self._score_events.append(
+            {
+                "type": "score",
+                "version": version,
+                "time": time.time(),
+                "team": team_name,
+                "event": event_name,
+                "score": score,
+                "total": total,
+            }
+        )
+        return total
+
+    @prioritized(Priority.HIGH)
     @sanitize
     def setScore(self, event_name: str, team_name: str, score: int):
-        label = self._getEventTeamCell(event_name, team_name)
-        self._scoreboard.update_value(label, str(score))
-        self._logger.log()
+        _, total = self._applyScore(event_name, team_name, lambda _: score)
+        self._logger.log(
+            "setScore", team=team_name, event=event_name, score=score, total=total
+        )
         return "success", 200
 
+    @prioritized(Priority.HIGH)
     @sanitize
     def adjustScore(self, event_name: str, team_name: str, score_delta: int):
-        print("ADJUSTING SCORE")
+        logging.debug(f"ADJUSTING SCORE: {event_name=}, {team_name=}, {score_delta=}")
         assert type(score_delta) is int, "Score Delta must be an integer!"
-        row, col = self._getEventTeamCell(event_name, team_name)
-        logging.debug(f"ADJUSTSCORE: {row=},{col=}")
-        current_score = self.getScore(team_name, event_name)
-        self._scoreboard.update_value((row, col), str(current_score + score_delta))
+        score, total = self._applyScore(
+            event_name, team_name, lambda current: current + score_delta
+        )
         self._logger.log(
-            old_score=current_score,
-            new_score=current_score + score_delta,
-            total_score=self.getTotal(team_name) + score_delta,
+            "adjustScore",
+            team=team_name,
+            event=event_name,
+            delta=score_delta,
+            score=score,
+            total=total,
         )
         return "success", 200
 
     @sanitize
     def getTeamFromToken(self, token: str):
-        tokens_to_teams: dict[str, str] = self._getTokensToTeams()
         assert type(token) is str and len(
             token
         ), "Bad Token Type, must be non-empty str"
 
-        return tokens_to_teams.get(token, None)
-
-    def _getTokens(self):
-        """
-        Retrieve the current list of tokens so we can ensure no
-        duplicate token is made
-        """
-        tokens = self._tokens.get_col(2, include_tailing_empty=False)
-        return tokens
-
-    def _getTokensToTeams(self) -> dict[str, str]:
-        df = self._tokens.get_as_df()
-        assert type(df) is not Literal[False], "Bad dataframe on token fetch"
-
-        tt = df.to_dict()
-        token_to_teams = {
-            tt["Token"][i]: tt["Team Name"][i] for i in range(len(tt["Token"].keys()))
-        }
-        return token_to_teams
+        return self._token_index.getTeam(token)
 
     @sanitize
     def getTokenFromTeam(self, team_name: str):
-        tokens_to_teams = self._getTokensToTeams()
-        for token, team in tokens_to_teams.items():
-            if team == team_name:
-                return token
-        return ""
+        token = self._token_index.getToken(team_name)
+        return token if token is not None else ""
+
+    @prioritized(Priority.HIGH)
+    def refreshTokens(self):
+        self._token_index.load()
+        return "tokens refreshed", 200
 
     @sanitize  # HACK: probably don't need to sanitize here
-    def _generateToken(self, team_name: str):
+    def _generateToken(self, team_name: str, taken_tokens: set[str] | None = None):
         """
-        Generate a unique token based on a hash of the team name
+        Generate a unique token based on a hash of the team name,
+        `taken_tokens` are treated as used on top of the existing ones
         """
 
         team_name = team_name.replace(" ", "").lower()
+        while True:
+            name_hash = int(sha1(team_name.encode()).hexdigest(), 16)
+            adjective = self._adjectives[name_hash % len(self._adjectives)]
+            noun = self._nouns[name_hash % len(self._nouns)]
+            token = f"{adjective}{noun}".lower()
+            if not self._token_index.hasToken(token) and (
+                taken_tokens is None or token not in taken_tokens
+            ):
+                return token
+            team_name = re.sub(
+                r"[^a-zA-Z]", "", team_name + getenv("SECRET_HASH_APPEND")  # type: ignore
+            ).lower()
 
-        current_tokens = self._getTokens()
-        adjectives = open("../assets/adjectives.txt", "r").readlines()
-        nouns = open("../assets/nouns.txt", "r").readlines()
-
-        adjective_hash = sha1(team_name.encode()).hexdigest()
-        adjective_index = int(adjective_hash, 16) % len(adjectives)
-
-        noun_hash = sha1(team_name.encode()).hexdigest()
-        noun_index = int(noun_hash, 16) % len(nouns)
-
-        token = (
-            f"{adjectives[adjective_index].strip()}{nouns[noun_index].strip()}".lower()
-        )
-        if token in current_tokens:
-            return self._generateToken(team_name + getenv("SECRET_HASH_APPEND"))  # type: ignore
-
-        return token
-
-    def getGraph(self):
-        log = self._logger.getLog()
-        graph = Graph(log)
-        return graph.parse()
+    def getGraph(self, since: int = 0):
+        return self._graph.parse(since)
 
     def getRandomInputIndexForTeam(self, num_inputs: int, team_name: str) -> int:
         """hash team name and return index from [0, 99]"""
@@ -287,28 +923,23 @@ class Sheet:
 
     @sanitize
     def awardWOCBonus(self, team_name: str) -> bool:
-        solved = set()
-        pattern = r'\d[abc]'
-        records = self._submissions.get_all_records()
-        awarded_already = False
-        for record in records:
-            if (
-                    record.get('team-name') == team_name and
-                    record.get('result', '') == "TRUE" and
-                    len(re.findall(pattern, record.get('problem', '')))
-                    ):
-                solved.add(record['problem'][0])
-            if record.get('team-name') == team_name and record.get('problem', '') == 'woc-bonus':
-                awarded_already = True
-                print('awarded already')
-                return False
+        if self._submission_store.hasSubmitted(team_name, "woc-bonus"):
+            logging.debug(f"WOC BONUS: already awarded to {team_name=}")
+            return False
+
+        pattern = r"\d[abc]"
+        solved = {
+            problem[0]
+            for problem in self._submission_store.getSolved(team_name)
+            if len(re.findall(pattern, problem))
+        }
 
         # log the bonus
-        print(solved)
+        logging.debug(f"WOC BONUS: {team_name=} solved days {sorted(solved)}")
         meets_criteria = len(solved) == 5
-        if meets_criteria and not awarded_already:
+        if meets_criteria:
             row = [gettime(), team_name, 'woc-bonus', 'TRUE', str(0), 'Bonus For Completing At Least One Part For Each Day of WoC']
-            self._submissions.append_table(row, overwrite=True)  # type: ignore
+            self._submission_store.append(row)
             # award points
             # self.adjustScore('woc4', team_name, 1337)
             return True
@@ -317,9 +948,11 @@ class Sheet:
 
     def getJudgement(
         self, problem: str, input_idx: int, output: str, team_name: str
-    ) -> bool:
+    ) -> bool | None:
         has_prior_solve = self._judge.hasPriorSolve(team_name, problem)
         judgement = self._judge.getJudgement(problem, input_idx, output, team_name)
+        if judgement is None:
+            return None  # no such problem or input
         problem_number = problem[
             0
         ]  # HACK: doesn't work for double digit problems like 14c
@@ -331,11 +964,12 @@ class Sheet:
             try:
                 logging.debug(f"TRYING KPOINTS {problem}")
                 value = int(kPOINTS[problem])
-                print(f"{value=}")
             except:
                 logging.debug(f"PROBLEM DOESNT EXIST in kPOINTS {problem=}")
                 return False
-            print("ADJUSTING SCORE FOR: ", problem, team_name, output)
+            if not self._judge.claimSolve(team_name, problem):
+                logging.info(f"ALREADY AWARDED: {problem=}, {team_name=}")
+                return judgement
             logging.info(f"ADJUSTING SCORE: {problem=}, {team_name=}, {output=}")
             try:
                 result = self.awardWOCBonus(team_name)
@@ -343,11 +977,36 @@ class Sheet:
                 # self.adjustScore('woc4', team_name, 1337)
                 self.adjustScore(event_name, team_name, value + more)
                 logging.info(f'AWARDING WOC BONUS FOR {team_name=} bonus-{result=}')
-            except:
-                logging.error("COULDNT ADJUST SCORE FOR")
+            except Exception:
+                logging.exception(f"COULDNT ADJUST SCORE FOR {team_name=}, {problem=}")
+                # so resubmitting the answer can still award the points
+                self._judge.releaseSolve(team_name, problem)
                 return False  # couldn't adjust score for some reason
         return judgement
 
+    def hasProblem(self, problem: str) -> bool:
+        return self._judge.hasProblem(problem)
+
+    def submitJudgement(
+        self, problem: str, input_idx: int, output: str, team_name: str
+    ) -> str | None:
+        """Judge in the background, returns a job id for getJudgementResult (None if backed up)"""
+        return self._judging.submit(
+            self.getJudgement, problem, input_idx, output, team_name
+        )
+
+    def getJudgementResult(self, job_id: str, wait: float = 0.0) -> dict | None:
+        """The job's {status[, result | message]}, waiting up to `wait` seconds for it"""
+        return self._judging.get(job_id, wait)
+
+    def getWriteQueueDepth(self):
+        return self._writer.getQueueDepth()
+
+    @prioritized(Priority.HIGH)
+    def refreshAnswers(self):
+        self._judge.loadAnswers()
+        return "answers refreshed", 200
+
     def getPastSubmissions(self, team_name: str, problem: str):
         return self._judge.getPastSubmissions(team_name, problem)
 
@@ -356,10 +1015,9 @@ class Sheet:
         if len(member_name) < 2:
             return None
         records = self._teams.get_all_records()
-        print("records: ", records)
         to_join = self.getTeamFromToken(token)
         if to_join is None:
-            print("Team not found with token: ", token)
+            logging.info(f"JOIN TEAM: no team with {token=}")
             return None
         for ridx, record in enumerate(records):
             if record["team_name"] == to_join:
@@ -378,7 +1036,7 @@ class Sheet:
     def leaveTeam(self, team_name: str, member_name: str):
         # do tokens match?
         if len(team_name) < 1 or len(member_name) < 1:
-            print("Empty args")
+            logging.info("LEAVE TEAM: empty team or member name")
             return False
         # if self.getTeamFromToken(token) != team_name:
         #     print("Cant join team if token doesn't match!")
@@ -402,9 +1060,8 @@ class Sheet:
         self, category: str, problem_idx: int, flag: str, team_name: str
     ) -> bool:
         team_name = re.sub(r"[^a-zA-Z]", "", team_name).lower()
-        has_prior_solve = self._judge.hasPriorSolve(
-            team_name, f"{category}-{problem_idx}"
-        )
+        problem = f"{category}-{problem_idx}"
+        has_prior_solve = self._judge.hasPriorSolve(team_name, problem)
 
         result = self._ctf.isFlagCorrect(category, problem_idx, flag, team_name)
 
@@ -419,10 +1076,21 @@ class Sheet:
                 )
                 return result  # still pass judgement
             coeff = int(problem_idx + 1) if use_coeff == "True" else 1
-            self.adjustScore("ctf", team_name, int(base_score) * coeff)
+            if self._judge.claimSolve(team_name, problem):
+                try:
+                    self.adjustScore("ctf", team_name, int(base_score) * coeff)
+                except Exception:
+                    # so resubmitting the flag can still award the points
+                    self._judge.releaseSolve(team_name, problem)
+                    raise
 
         return result
 
+    @prioritized(Priority.HIGH)
+    def refreshFlags(self):
+        self._ctf.invalidateFlags()
+        return "flags refreshed", 200
+
     @sanitize
     def getSolvedFlags(self, category: str, team_name: str):
         team_name = re.sub(
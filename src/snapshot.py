@@ -0,0 +1,320 @@
+from contextlib import contextmanager
+import fcntl
+from hashlib import sha1
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Iterable, Iterator, NamedTuple
+import zlib
+
+from dotenv import load_dotenv
+import numpy as np
+
+load_dotenv()
+
+
+class ScoreboardSnapshot(NamedTuple):
+    seq: int  # bumped every time a new snapshot is published or a score changes
+    fetched_at: float  # when the scores were last downloaded from the sheet
+    modified_at: float  # when any score last changed
+    teams: list[str]
+    events: list[str]
+    scores: np.ndarray  # (events x teams) int64, a view into the shared mapping
+    team_idx: dict[str, int]  # team -> column of scores (its first, if repeated)
+    event_idx: dict[str, int]  # event -> row of scores
+    restored: bool = False  # loaded from the cache file, not yet checked against the sheet
+
+
+def _defaultPath() -> str:
+    shm = "/dev/shm"
+    directory = shm if os.path.isdir(shm) else tempfile.gettempdir()
+    # one snapshot per sheet, in case several deployments share the machine
+    sheet_hash = sha1(str(os.getenv("SHEET_URL")).encode()).hexdigest()[:8]
+    return os.path.join(directory, f"acmmm-scoreboard-{sheet_hash}")
+
+
+class SharedLock:
+    """
+    A lock held by one thread of one worker on the machine at a time: flock on
+    `path`, plus a thread lock since flock only excludes other processes (threads
+    of one process share the fd).
+    """
+
+    kPOLL_INTERVAL = 0.05  # seconds between tries while waiting with a timeout
+
+    def __init__(self, path: str):
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._thread_lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True, timeout: float | None = None) -> bool:
+        """Returns False if not `blocking` and it's taken, or still taken after `timeout` seconds"""
+        if blocking and timeout is not None:
+            deadline = time.time() + timeout
+            while not self.acquire(blocking=False):
+                if time.time() >= deadline:
+                    return False
+                time.sleep(SharedLock.kPOLL_INTERVAL)
+            return True
+        if not self._thread_lock.acquire(blocking=blocking):
+            return False
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(self._fd, flags)
+        except BlockingIOError:
+            self._thread_lock.release()
+            return False
+        return True
+
+    def release(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self) -> "SharedLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class SharedLocks:
+    """
+    One SharedLock per key, all in one file: a key's lock is a byte of `path`,
+    locked with a byte-range lock. Keys that hash to the same byte share a lock.
+
+    Like flock, open file description locks belong to the fd, so threads of one
+    process take turns on a thread lock per byte first. Where there are none
+    (outside Linux) plain fcntl locks are used, which belong to the process:
+    the fd is never closed, as closing any fd of the file would drop them all.
+    """
+
+    kSLOTS = 1 << 16
+    kSETLK = getattr(fcntl, "F_OFD_SETLK", fcntl.F_SETLK)
+    kSETLKW = getattr(fcntl, "F_OFD_SETLKW", fcntl.F_SETLKW)
+    kFLOCK = struct.Struct("@hhqqi4x")  # struct flock: type, whence, start, len, pid
+
+    def __init__(self, path: str):
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._guard = threading.Lock()  # the two dicts below
+        self._thread_locks: dict[int, threading.Lock] = {}
+        # slot -> thread of this process holding (or waiting on) its lockf
+        self._owners: dict[int, int] = {}
+
+    @staticmethod
+    def _slot(key: str) -> int:
+        return zlib.crc32(key.encode()) % SharedLocks.kSLOTS
+
+    def _lock(self, slot: int, kind: int, wait: bool = True):
+        """Lock (or unlock) byte `slot`, raises OSError if not `wait`ing and it's taken"""
+        cmd = SharedLocks.kSETLKW if wait else SharedLocks.kSETLK
+        fcntl.fcntl(self._fd, cmd, SharedLocks.kFLOCK.pack(kind, os.SEEK_SET, slot, 1, 0))
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        slot = SharedLocks._slot(key)
+        with self._guard:
+            thread_lock = self._thread_locks.setdefault(slot, threading.Lock())
+        with thread_lock:
+            with self._guard:
+                self._owners[slot] = threading.get_ident()
+            try:
+                self._lock(slot, fcntl.F_WRLCK)
+                try:
+                    yield
+                finally:
+                    self._lock(slot, fcntl.F_UNLCK)
+            finally:
+                with self._guard:
+                    del self._owners[slot]
+
+    def held(self, keys: Iterable[str]) -> set[str]:
+        """The `keys` locked by any thread of any worker, other than the calling thread"""
+        held = set()
+        me = threading.get_ident()
+        with self._guard:
+            for key in keys:
+                slot = SharedLocks._slot(key)
+                if slot in self._owners:
+                    if self._owners[slot] != me:
+                        held.add(key)
+                    continue
+                try:
+                    self._lock(slot, fcntl.F_WRLCK, wait=False)
+                except OSError:
+                    held.add(key)  # another worker's
+                    continue
+                self._lock(slot, fcntl.F_UNLCK)
+        return held
+
+
+class SharedSnapshot:
+    """
+    Scoreboard snapshot shared by every worker on the machine.
+
+    One worker at a time (whoever holds the lock file) fetches the scoreboard and
+    publishes it by atomically replacing the snapshot file. Every worker maps the
+    file read-only and reads the score matrix straight out of the mapping.
+    Score changes are written into the current file in place, under the same
+    lock, so they're seen by every worker as soon as they're made.
+
+    File layout: header | names json | padding to 8 bytes | int64 scores
+    """
+
+    kMAGIC = b"ACM3"
+    # magic, seq, fetched_at, modified_at, n_events, n_teams, names_len, restored
+    kHEADER = struct.Struct("<4sQddIII?")
+
+    def __init__(self, path: str | None = None):
+        self.path = path or os.getenv("SCOREBOARD_SNAPSHOT") or _defaultPath()
+        self._lock = SharedLock(self.path + ".lock")
+        # ((st_dev, st_ino), mapping) of the file last mapped, one attribute so threads see both at once
+        self._mapped: tuple[tuple[int, int], mmap.mmap] | None = None
+        self._snapshot: ScoreboardSnapshot | None = None
+
+    def lock(self, blocking: bool = True) -> bool:
+        """Become the only writer, returns False if someone already is"""
+        return self._lock.acquire(blocking)
+
+    def unlock(self):
+        self._lock.release()
+
+    @staticmethod
+    def _scoresOffset(names_len: int) -> int:
+        return (SharedSnapshot.kHEADER.size + names_len + 7) // 8 * 8
+
+    def _map(self) -> mmap.mmap | None:
+        """The current file's mapping, kept in a local by callers since another thread may remap"""
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            st = os.fstat(fd)
+            mapped = self._mapped
+            if mapped is not None and mapped[0] == (st.st_dev, st.st_ino):
+                return mapped[1]
+            mapping = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            self._mapped = ((st.st_dev, st.st_ino), mapping)
+            return mapping
+        finally:
+            os.close(fd)
+
+    def read(self) -> ScoreboardSnapshot | None:
+        """Returns the latest published snapshot, or None if there isn't one yet"""
+        mapping = self._map()
+        if mapping is None:
+            return None
+        magic, seq, fetched_at, modified_at, n_events, n_teams, names_len, restored = (
+            SharedSnapshot.kHEADER.unpack_from(mapping, 0)
+        )
+        if magic != SharedSnapshot.kMAGIC:
+            return None
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.seq == seq:
+            return snapshot  # seqs only grow, so the same seq is the same scoreboard
+
+        names_offset = SharedSnapshot.kHEADER.size
+        names = json.loads(mapping[names_offset : names_offset + names_len])
+        scores = np.frombuffer(
+            mapping,
+            dtype=np.int64,
+            count=n_events * n_teams,
+            offset=SharedSnapshot._scoresOffset(names_len),
+        ).reshape(n_events, n_teams)
+        team_idx: dict[str, int] = {}
+        for idx, team in enumerate(names["teams"]):
+            team_idx.setdefault(team, idx)
+        event_idx: dict[str, int] = {}
+        for idx, event in enumerate(names["events"]):
+            event_idx.setdefault(event, idx)
+        self._snapshot = ScoreboardSnapshot(
+            seq,
+            fetched_at,
+            modified_at,
+            names["teams"],
+            names["events"],
+            scores,
+            team_idx,
+            event_idx,
+            restored,
+        )
+        return self._snapshot
+
+    def publish(
+        self,
+        teams: list[str],
+        events: list[str],
+        scores: np.ndarray,
+        fetched_at: float,
+        modified_at: float | None = None,
+        restored: bool = False,
+    ) -> int:
+        """
+        Atomically replace the shared snapshot, call while holding the lock.
+        Returns the new snapshot's seq.
+        """
+        current = self.read()
+        seq = current.seq + 1 if current is not None else 1
+        names = json.dumps({"teams": teams, "events": events}).encode()
+        header = SharedSnapshot.kHEADER.pack(
+            SharedSnapshot.kMAGIC,
+            seq,
+            fetched_at,
+            fetched_at if modified_at is None else modified_at,
+            len(events),
+            len(teams),
+            len(names),
+            restored,
+        )
+        padding = b"\0" * (-(len(header) + len(names)) % 8)
+        data = np.ascontiguousarray(scores, dtype=np.int64).tobytes()
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header + names + padding + data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except:
+            os.unlink(tmp_path)
+            raise
+        return seq
+
+    def setScore(self, event_idx: int, team_idx: int, score: int) -> int:
+        """
+        Overwrite one score of the current snapshot in place, call while holding the lock.
+        Returns the snapshot's new seq.
+        """
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            with mmap.mmap(fd, 0) as mapping:
+                magic, seq, fetched_at, _, n_events, n_teams, names_len, restored = (
+                    SharedSnapshot.kHEADER.unpack_from(mapping, 0)
+                )
+                scores = np.frombuffer(
+                    mapping,
+                    dtype=np.int64,
+                    count=n_events * n_teams,
+                    offset=SharedSnapshot._scoresOffset(names_len),
+                ).reshape(n_events, n_teams)
+                scores[event_idx, team_idx] = score
+                del scores  # the mapping can't close while a view is alive
+                SharedSnapshot.kHEADER.pack_into(
+                    mapping,
+                    0,
+                    magic,
+                    seq + 1,
+                    fetched_at,
+                    time.time(),
+                    n_events,
+                    n_teams,
+                    names_len,
+                    restored,
+                )
+        finally:
+            os.close(fd)
+        return seq + 1
@@ -0,0 +1,85 @@
+from hashlib import sha1
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+from snapshot import SharedLock
+
+load_dotenv()
+
+
+def _defaultPath() -> str:
+    shm = "/dev/shm"
+    directory = shm if os.path.isdir(shm) else tempfile.gettempdir()
+    sheet_hash = sha1(str(os.getenv("SHEET_URL")).encode()).hexdigest()[:8]
+    return os.path.join(directory, f"acmmm-solves-{sheet_hash}")
+
+
+class SharedSolves:
+    """
+    Which team solved which problem, shared by every worker on the machine.
+
+    Append-only file of "team<TAB>problem" lines. A solve is checked for and
+    recorded in one step under a lock file, so when several workers judge the
+    same solve at once exactly one of them gets to award its points, however
+    far behind the submissions sheet each of them is. A "team<TAB>problem<TAB>-"
+    line takes a claim back, when the points couldn't be awarded after all.
+    """
+
+    kRELEASED = "-"
+
+    def __init__(self, path: str | None = None):
+        self.path = path or os.getenv("SOLVES_LEDGER") or _defaultPath()
+        self._lock = SharedLock(self.path + ".lock")
+        # (team, problem) -> claimed (True) or claimed then released (False)
+        self._claims: dict[tuple[str, str], bool] = {}
+        self._offset = 0  # how much of the file is in _claims
+
+    def _readNew(self, fd: int):
+        """Pull in the lines appended since the last read, call while holding the lock"""
+        end = os.fstat(fd).st_size
+        if end <= self._offset:
+            return
+        data = os.pread(fd, end - self._offset, self._offset)
+        for line in data.decode().splitlines():
+            team, problem, *released = line.split("\t")
+            self._claims[(team, problem)] = not len(released)
+        self._offset = end
+
+    def _open(self) -> int:
+        return os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def claimed(self, team_name: str, problem: str) -> bool | None:
+        """Whether `team_name` holds a claim on `problem`, None if it never made one"""
+        with self._lock:
+            fd = self._open()
+            try:
+                self._readNew(fd)
+            finally:
+                os.close(fd)
+            return self._claims.get((team_name, problem))
+
+    def claim(self, team_name: str, problem: str) -> bool:
+        """Record that `team_name` solved `problem`, False if it already had"""
+        with self._lock:
+            fd = self._open()
+            try:
+                self._readNew(fd)
+                if self._claims.get((team_name, problem)):
+                    return False
+                os.write(fd, f"{team_name}\t{problem}\n".encode())
+                self._readNew(fd)
+            finally:
+                os.close(fd)
+            return True
+
+    def release(self, team_name: str, problem: str):
+        """Take back a claim whose points weren't awarded, so the next correct answer gets them"""
+        with self._lock:
+            fd = self._open()
+            try:
+                os.write(fd, f"{team_name}\t{problem}\t{SharedSolves.kRELEASED}\n".encode())
+                self._readNew(fd)
+            finally:
+                os.close(fd)
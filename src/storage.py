@@ -0,0 +1,789 @@
+import atexit
+from contextlib import contextmanager
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Literal, Protocol, TypedDict
+
+from dotenv import load_dotenv
+import pandas as pd
+import pygsheets as ps
+from pygsheets.utils import format_addr, numericise_all
+
+import metrics
+
+load_dotenv()
+
+
+# What every backend can do of pygsheets' options: values as plain lists, rows
+# appended as rows and the batch updates createTeams sends. The SQLite backend
+# raises for anything else, typing them this narrowly has the checker say so first.
+ReturnAs = Literal["matrix"]
+AppendDimension = Literal["ROWS"]
+
+
+class BatchRequest(TypedDict, total=False):
+    """One spreadsheets.batchUpdate request, of the kinds every backend applies"""
+
+    insertDimension: dict
+    updateCells: dict
+
+
+class Worksheet(Protocol):
+    """The part of `pygsheets.Worksheet` the app uses, every storage backend provides it"""
+
+    @property
+    def title(self) -> str: ...
+
+    @property
+    def id(self) -> int: ...
+
+    @property
+    def rows(self) -> int: ...
+
+    @property
+    def cols(self) -> int: ...
+
+    def get_row(self, row: int, returnas: ReturnAs = "matrix", include_tailing_empty=True, **kwargs) -> list: ...
+
+    def get_col(self, col: int, returnas: ReturnAs = "matrix", include_tailing_empty=True, **kwargs) -> list: ...
+
+    def get_values(self, start, end, returnas: ReturnAs = "matrix", majdim="ROWS", include_tailing_empty=True, include_tailing_empty_rows=False, **kwargs) -> list[list]: ...
+
+    def get_all_values(self, returnas: ReturnAs = "matrix", majdim="ROWS", include_tailing_empty=True, include_tailing_empty_rows=True, **kwargs) -> list[list]: ...
+
+    def get_all_records(self, empty_value="", head=1, majdim="ROWS", numericise_data=True, **kwargs) -> list[dict]: ...
+
+    def get_as_df(self, has_header=True, index_column=None, start=None, end=None, numerize=True, empty_value="", **kwargs) -> pd.DataFrame: ...
+
+    def append_table(self, values, start="A1", end=None, dimension: AppendDimension = "ROWS", overwrite=False, **kwargs): ...
+
+    def update_value(self, addr, val, parse=None): ...
+
+    def update_values(self, crange=None, values=None, **kwargs): ...
+
+    def insert_rows(self, row: int, number=1, values=None, inherit=False): ...
+
+    def insert_cols(self, col: int, number=1, values=None, inherit=False): ...
+
+    def refresh(self, update_grid=False): ...
+
+    def cell(self, addr): ...
+
+
+class Spreadsheet(Protocol):
+    """The part of `pygsheets.Spreadsheet` the app uses"""
+
+    @property
+    def sheet1(self) -> Worksheet: ...
+
+    def worksheet_by_title(self, title: str) -> Worksheet: ...
+
+    def custom_request(self, request: BatchRequest | list[BatchRequest], fields, **kwargs): ...
+
+
+def growGrid(worksheet: Worksheet, rows: int = 0, cols: int = 0):
+    """
+    Keep a worksheet's idea of its grid size in step after rows/columns were
+    inserted with a raw `custom_request`, like insert_rows/insert_cols do.
+    """
+    if isinstance(worksheet, ps.Worksheet):
+        grid = worksheet.jsonSheet["properties"]["gridProperties"]
+        grid["rowCount"] += rows
+        grid["columnCount"] += cols
+    elif hasattr(worksheet, "growGrid"):
+        worksheet.growGrid(rows, cols)  # type: ignore
+
+
+class SqliteCell:
+    def __init__(self, worksheet: "SqliteWorksheet", addr):
+        self.worksheet = worksheet
+        self.row, self.col = format_addr(addr, "tuple")
+
+    @property
+    def value(self) -> str:
+        return self.worksheet.get_value((self.row, self.col))
+
+    def set_value(self, value):
+        self.worksheet.update_value((self.row, self.col), value)
+
+    def set_text_format(self, attribute, value):
+        pass  # no formatting in a local database
+
+
+class SqliteWorksheet:
+    """
+    A worksheet stored as a SQLite table, one table row per sheet row.
+
+    Column k of the sheet is column `ck` of the table and `r` is the row number.
+    Values are kept as the strings Sheets would hand back.
+    """
+
+    def __init__(self, spreadsheet: "SqliteSpreadsheet", title: str, sheet_id: int):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self._table = f'"ws_{sheet_id}"'
+
+    def __repr__(self):
+        return f"<SqliteWorksheet {self.title!r} id:{self.id}>"
+
+    def _width(self) -> int:
+        return len(self.spreadsheet._execute(f"PRAGMA table_info({self._table})").fetchall()) - 1
+
+    def _ensureWidth(self, width: int):
+        for k in range(self._width() + 1, width + 1):
+            self.spreadsheet._execute(f"ALTER TABLE {self._table} ADD COLUMN c{k} TEXT")
+
+    def _createTable(self, indexes: list[tuple[int, ...]]):
+        columns = ", ".join(
+            f"c{k} TEXT" for k in range(1, SqliteSpreadsheet.kMIN_WIDTH + 1)
+        )
+        self.spreadsheet._execute(
+            f"CREATE TABLE IF NOT EXISTS {self._table} (r INTEGER PRIMARY KEY, {columns})"
+        )
+        for index in indexes:
+            name = f'"ws_{self.id}_' + "_".join(f"c{k}" for k in index) + '"'
+            cols = ", ".join(f"c{k}" for k in index)
+            self.spreadsheet._execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON {self._table} ({cols})"
+            )
+
+    @property
+    def rows(self) -> int:
+        row = self.spreadsheet._execute(f"SELECT MAX(r) FROM {self._table}").fetchone()
+        return row[0] or 0
+
+    @property
+    def cols(self) -> int:
+        return self._width()
+
+    def refresh(self, update_grid=False):
+        pass  # nothing cached
+
+    def growGrid(self, rows: int = 0, cols: int = 0):
+        pass  # the grid is whatever the data covers
+
+    def _matrix(self, r0: int, r1: int, c0: int, c1: int) -> list[list[str]]:
+        if r1 < r0 or c1 < c0:
+            return []
+        self._ensureWidth(c1)
+        cols = ", ".join(f"c{k}" for k in range(c0, c1 + 1))
+        found = self.spreadsheet._execute(
+            f"SELECT r, {cols} FROM {self._table} WHERE r BETWEEN ? AND ? ORDER BY r",
+            (r0, r1),
+        ).fetchall()
+        by_row = {row[0]: ["" if v is None else v for v in row[1:]] for row in found}
+        last = max(by_row.keys(), default=r0 - 1)
+        return [by_row.get(r, [""] * (c1 - c0 + 1)) for r in range(r0, last + 1)]
+
+    def get_values(
+        self,
+        start,
+        end,
+        returnas: ReturnAs = "matrix",
+        majdim="ROWS",
+        include_tailing_empty=True,
+        include_tailing_empty_rows=False,
+        **kwargs,
+    ) -> list[list]:
+        if returnas != "matrix":
+            raise NotImplementedError(f"SqliteWorksheet can't return {returnas}")
+        start = format_addr(start, "tuple") if type(start) is str else start
+        end = format_addr(end, "tuple") if type(end) is str else end
+        r0, c0 = start
+        r1 = end[0] if end[0] is not None else self.rows
+        c1 = end[1] if end[1] is not None else self._width()
+        values = self._matrix(r0, r1, c0, c1)
+        max_rows, max_cols = r1 - r0 + 1, c1 - c0 + 1
+        if majdim.upper().startswith("COL"):
+            values = [list(col) for col in zip(*values)] if len(values) else []
+            max_rows, max_cols = max_cols, max_rows
+
+        # what the Sheets API hands back: no trailing empty cells or rows
+        for row in values:
+            while len(row) and row[-1] == "":
+                row.pop()
+        while len(values) and not len(values[-1]):
+            values.pop()
+
+        if include_tailing_empty_rows and max_rows - len(values) > 0:
+            values.extend([[] for _ in range(max_rows - len(values))])
+        if include_tailing_empty:
+            values = [row + [""] * (max_cols - len(row)) for row in values]
+        if values == []:
+            values = [[]]
+        return values
+
+    def get_value(self, addr) -> str:
+        row, col = format_addr(addr, "tuple") if type(addr) is str else addr
+        values = self._matrix(row, row, col, col)
+        return values[0][0] if len(values) else ""
+
+    def get_row(self, row: int, returnas: ReturnAs = "matrix", include_tailing_empty=True, **kwargs) -> list:
+        return self.get_values(
+            (row, 1),
+            (row, None),
+            returnas=returnas,
+            include_tailing_empty=include_tailing_empty,
+            include_tailing_empty_rows=True,
+        )[0]
+
+    def get_col(self, col: int, returnas: ReturnAs = "matrix", include_tailing_empty=True, **kwargs) -> list:
+        return self.get_values(
+            (1, col),
+            (None, col),
+            returnas=returnas,
+            majdim="COLUMNS",
+            include_tailing_empty=include_tailing_empty,
+            include_tailing_empty_rows=True,
+        )[0]
+
+    def get_all_values(
+        self,
+        returnas: ReturnAs = "matrix",
+        majdim="ROWS",
+        include_tailing_empty=True,
+        include_tailing_empty_rows=True,
+        **kwargs,
+    ) -> list[list]:
+        return self.get_values(
+            (1, 1),
+            (self.rows, self._width()),
+            returnas=returnas,
+            majdim=majdim,
+            include_tailing_empty=include_tailing_empty,
+            include_tailing_empty_rows=include_tailing_empty_rows,
+        )
+
+    def get_all_records(
+        self, empty_value="", head=1, majdim="ROWS", numericise_data=True, **kwargs
+    ) -> list[dict]:
+        data = self.get_all_values(
+            majdim=majdim, include_tailing_empty=False, include_tailing_empty_rows=False
+        )
+        keys = data[head - 1]
+        values = []
+        for row in data[head:]:
+            row = (row + [""] * (len(keys) - len(row)))[: len(keys)]
+            values.append(numericise_all(row, empty_value) if numericise_data else row)
+        return [dict(zip(keys, row)) for row in values]
+
+    def get_as_df(
+        self,
+        has_header=True,
+        index_column=None,
+        start=None,
+        end=None,
+        numerize=True,
+        empty_value="",
+        **kwargs,
+    ) -> pd.DataFrame:
+        values = self.get_all_values(
+            include_tailing_empty=kwargs.get("include_tailing_empty", False),
+            include_tailing_empty_rows=kwargs.get("include_tailing_empty_rows", False),
+        )
+        max_row = max(len(row) for row in values)
+        values = [row + [empty_value] * (max_row - len(row)) for row in values]
+        if numerize:
+            values = [numericise_all(row, empty_value) for row in values]
+        if has_header:
+            return pd.DataFrame(values[1:], columns=values[0])
+        return pd.DataFrame(values)
+
+    def _toText(self, value) -> str | None:
+        if value is None or value == "":
+            return None
+        if type(value) is bool:
+            return "TRUE" if value else "FALSE"  # what USER_ENTERED turns them into
+        return str(value)
+
+    def _upsert(self, row: int, col: int, values: list):
+        """Write `values` into `row` starting at `col`"""
+        if not len(values):
+            return
+        last_col = col + len(values) - 1
+        self._ensureWidth(last_col)
+        cols = [f"c{k}" for k in range(col, last_col + 1)]
+        placeholders = ", ".join("?" for _ in cols)
+        updates = ", ".join(f"{c}=excluded.{c}" for c in cols)
+        params = [row] + [self._toText(v) for v in values]
+        self.spreadsheet._execute(
+            f"INSERT INTO {self._table} (r, {', '.join(cols)}) VALUES (?, {placeholders}) "
+            f"ON CONFLICT(r) DO UPDATE SET {updates}",
+            params,
+        )
+
+    def update_value(self, addr, val, parse=None):
+        row, col = format_addr(addr, "tuple") if type(addr) is str else addr
+        with self.spreadsheet.transaction():
+            self._upsert(row, col, [val])
+
+    def update_values(self, crange=None, values=None, majordim="ROWS", **kwargs):
+        if type(crange) is str:
+            crange = format_addr(crange.split(":")[0], "tuple")
+        row, col = crange  # type: ignore
+        values = values or []
+        if majordim.upper().startswith("COL"):
+            values = [list(r) for r in zip(*values)]
+        with self.spreadsheet.transaction():
+            for offset, row_values in enumerate(values):
+                self._upsert(row + offset, col, row_values)
+
+    def update_row(self, index: int, values: list, col_offset=0):
+        if type(values[0]) is not list:
+            values = [values]
+        self.update_values((index, col_offset + 1), values)
+
+    def update_col(self, index: int, values: list, row_offset=0):
+        if type(values[0]) is not list:
+            values = [values]
+        self.update_values((row_offset + 1, index), values, majordim="COLUMNS")
+
+    def insert_rows(self, row: int, number=1, values=None, inherit=False):
+        """Insert `number` rows after `row`"""
+        with self.spreadsheet.transaction():
+            # two steps so the primary key never collides mid-update
+            self.spreadsheet._execute(
+                f"UPDATE {self._table} SET r = -(r + ?) WHERE r > ?", (number, row)
+            )
+            self.spreadsheet._execute(f"UPDATE {self._table} SET r = -r WHERE r < 0")
+            if values:
+                self.update_row(row + 1, values)
+
+    def insert_cols(self, col: int, number=1, values=None, inherit=False):
+        """Insert `number` columns after `col`"""
+        with self.spreadsheet.transaction():
+            width = self._width()
+            self._ensureWidth(max(width, col) + number)
+            shifted = [f"c{k + number}=c{k}" for k in range(col + 1, width + 1)]
+            cleared = [f"c{k}=NULL" for k in range(col + 1, col + number + 1)]
+            self.spreadsheet._execute(
+                f"UPDATE {self._table} SET {', '.join(shifted + cleared)}"
+            )
+            if values:
+                self.update_col(col + 1, values)
+
+    def append_table(self, values, start="A1", end=None, dimension: AppendDimension = "ROWS", overwrite=False, **kwargs):
+        if dimension != "ROWS":
+            raise NotImplementedError("SqliteWorksheet only appends rows")
+        if type(values[0]) is not list:
+            values = [values]
+        with self.spreadsheet.transaction():
+            next_row = self.rows + 1
+            for offset, row_values in enumerate(values):
+                self._upsert(next_row + offset, 1, row_values)
+
+    def cell(self, addr) -> SqliteCell:
+        return SqliteCell(self, addr)
+
+
+class SqliteSpreadsheet:
+    """
+    A spreadsheet kept in a local SQLite database, see SqliteWorksheet.
+
+    Safe to share between threads and between worker processes (WAL mode).
+    """
+
+    kMIN_WIDTH = 8
+    # sheet columns worth an index: team-name/problem, token, team name
+    kINDEXES: dict[str, list[tuple[int, ...]]] = {
+        "submissions": [(2, 3)],
+        "tokens": [(2,)],
+        "teams": [(1,)],
+    }
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.RLock()
+        self._depth = 0
+        if path != ":memory:":
+            self._execute("PRAGMA journal_mode=WAL")
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS worksheets "
+            "(id INTEGER PRIMARY KEY, title TEXT UNIQUE NOT NULL, position INTEGER NOT NULL)"
+        )
+        self._worksheets: dict[str, SqliteWorksheet] = {}
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """Group statements into one (re-entrant) write transaction"""
+        with self._lock:
+            if self._depth == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield
+            except:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self._conn.execute("COMMIT")
+
+    def worksheet_by_title(self, title: str, sheet_id: int | None = None) -> SqliteWorksheet:
+        """Returns the worksheet called `title`, creating it if needed"""
+        if title in self._worksheets:
+            return self._worksheets[title]
+        with self.transaction():
+            found = self._execute(
+                "SELECT id FROM worksheets WHERE title = ?", (title,)
+            ).fetchone()
+            if found is None:
+                if sheet_id is None:
+                    sheet_id = self._execute(
+                        "SELECT COALESCE(MAX(id), -1) + 1 FROM worksheets"
+                    ).fetchone()[0]
+                position = self._execute(
+                    "SELECT COUNT(*) FROM worksheets"
+                ).fetchone()[0]
+                self._execute(
+                    "INSERT INTO worksheets (id, title, position) VALUES (?, ?, ?)",
+                    (sheet_id, title, position),
+                )
+            else:
+                sheet_id = found[0]
+            worksheet = SqliteWorksheet(self, title, sheet_id)  # type: ignore
+            worksheet._createTable(SqliteSpreadsheet.kINDEXES.get(title, []))
+        self._worksheets[title] = worksheet
+        return worksheet
+
+    @property
+    def sheet1(self) -> SqliteWorksheet:
+        found = self._execute(
+            "SELECT title FROM worksheets ORDER BY position LIMIT 1"
+        ).fetchone()
+        return self.worksheet_by_title(found[0] if found is not None else "Sheet1")
+
+    def _worksheetById(self, sheet_id: int) -> SqliteWorksheet:
+        found = self._execute(
+            "SELECT title FROM worksheets WHERE id = ?", (sheet_id,)
+        ).fetchone()
+        if found is None:
+            raise ps.WorksheetNotFound(f"No worksheet with id {sheet_id}")
+        return self.worksheet_by_title(found[0])
+
+    def custom_request(self, request: BatchRequest | list[BatchRequest], fields=None, **kwargs):
+        """Apply the batch update requests the app sends (insertDimension, updateCells)"""
+        requests = request if type(request) is list else [request]
+        with self.transaction():
+            for req in requests:
+                if "insertDimension" in req:
+                    dim_range = req["insertDimension"]["range"]
+                    worksheet = self._worksheetById(dim_range["sheetId"])
+                    number = dim_range["endIndex"] - dim_range["startIndex"]
+                    if dim_range["dimension"] == "ROWS":
+                        worksheet.insert_rows(dim_range["startIndex"], number)
+                    else:
+                        worksheet.insert_cols(dim_range["startIndex"], number)
+                elif "updateCells" in req:
+                    update = req["updateCells"]
+                    worksheet = self._worksheetById(update["start"]["sheetId"])
+                    values = [
+                        [
+                            next(iter(v.get("userEnteredValue", {"stringValue": ""}).values()))
+                            for v in row.get("values", [])
+                        ]
+                        for row in update["rows"]
+                    ]
+                    worksheet.update_values(
+                        (update["start"]["rowIndex"] + 1, update["start"]["columnIndex"] + 1),
+                        values,
+                    )
+                else:
+                    raise NotImplementedError(f"Unsupported request {list(req.keys())}")
+        return {"replies": [{} for _ in requests]}
+
+    def importWorksheet(self, worksheet: SqliteWorksheet, source: Worksheet) -> bool:
+        """Copy `source` into `worksheet` if it's empty, returns whether it copied"""
+        if worksheet.rows > 0:
+            return False
+        values = source.get_all_values(
+            include_tailing_empty=False, include_tailing_empty_rows=False
+        )
+        with self.transaction():
+            if worksheet.rows > 0:  # another worker beat us to it
+                return False
+            for row, row_values in enumerate(values, start=1):
+                worksheet._upsert(row, 1, row_values)
+        return True
+
+
+class Forwarder:
+    """
+    Replays calls on a background thread, in order. A failing call is retried,
+    backing off up to kMAX_BACKOFF seconds, until it goes through: the calls
+    after it wait, so Google Sheets ends up with every write, in order.
+    What's still queued at exit gets kCLOSE_TIMEOUT seconds to be replayed.
+    """
+
+    kMAX_BACKOFF = 60  # seconds between retries of a failing call
+    kCLOSE_TIMEOUT = 10  # seconds spent replaying what's left at exit
+
+    def __init__(self):
+        self._queue: queue.Queue[tuple[Callable, tuple, dict]] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="mirror", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        self._queue.put((fn, args, kwargs))
+        metrics.mirror_backlog.set(self.qsize())
+
+    def qsize(self) -> int:
+        """Calls not replayed yet, including the one being replayed"""
+        return self._queue.unfinished_tasks
+
+    def _replay(self, fn: Callable, args: tuple, kwargs: dict):
+        attempt = 0
+        while True:
+            try:
+                fn(*args, **kwargs)
+                return
+            except Exception:
+                wait = min(2**attempt, Forwarder.kMAX_BACKOFF)
+                logging.exception(
+                    f"MIRROR: {fn.__name__} failed ({attempt=}, {self.qsize()} waiting), "
+                    f"retrying in {wait}s"
+                )
+                attempt += 1
+                time.sleep(wait)
+
+    def _run(self):
+        while True:
+            fn, args, kwargs = self._queue.get()
+            try:
+                self._replay(fn, args, kwargs)
+            finally:
+                self._queue.task_done()
+                metrics.mirror_backlog.set(self.qsize())
+
+    def close(self, timeout: float = kCLOSE_TIMEOUT) -> bool:
+        """Wait up to `timeout` seconds for everything queued to be replayed"""
+        deadline = time.time() + timeout
+        while self.qsize() and time.time() < deadline:
+            time.sleep(0.05)
+        left = self.qsize()
+        if left:
+            logging.error(
+                f"MIRROR: exiting with {left} writes not replayed, "
+                "Google Sheets is behind the local database"
+            )
+        metrics.registry.dump(force=True)
+        return not left
+
+
+class MirroredCell:
+    def __init__(self, worksheet: "MirroredWorksheet", addr):
+        self.worksheet = worksheet
+        self.addr = format_addr(addr, "tuple")
+
+    @property
+    def value(self) -> str:
+        return self.worksheet.local.get_value(self.addr)
+
+    def set_value(self, value):
+        self.worksheet.update_value(self.addr, value)
+
+    def set_text_format(self, attribute, value):
+        remote = self.worksheet.remote
+        self.worksheet._forwarder.submit(
+            lambda: remote.cell(self.addr).set_text_format(attribute, value)
+        )
+
+
+class MirroredWorksheet:
+    """
+    Reads come from the local SQLite worksheet. Writes go to it first and are
+    then replayed on the Google Sheets worksheet in the background.
+    """
+
+    kWRITES = (
+        "append_table",
+        "update_value",
+        "update_values",
+        "update_row",
+        "update_col",
+        "insert_rows",
+        "insert_cols",
+    )
+
+    def __init__(self, local: SqliteWorksheet, remote: Worksheet, forwarder: Forwarder):
+        self.local = local
+        self.remote = remote
+        self._forwarder = forwarder
+
+    def __getattr__(self, name: str) -> Any:
+        if name in MirroredWorksheet.kWRITES:
+
+            def write(*args, **kwargs):
+                result = getattr(self.local, name)(*args, **kwargs)
+                self._forwarder.submit(getattr(self.remote, name), *args, **kwargs)
+                return result
+
+            return write
+        return getattr(self.local, name)
+
+    def growGrid(self, rows: int = 0, cols: int = 0):
+        self._forwarder.submit(growGrid, self.remote, rows, cols)
+
+    def cell(self, addr) -> MirroredCell:
+        return MirroredCell(self, addr)
+
+
+class MirroredSpreadsheet:
+    """
+    Runs the contest off a local SQLite database while publishing every write to
+    Google Sheets. Each worksheet is copied from Sheets the first time it's opened
+    against an empty database.
+    """
+
+    def __init__(self, local: SqliteSpreadsheet, remote: ps.Spreadsheet):
+        self.local = local
+        self.remote = remote
+        self._forwarder = Forwarder()
+        self._local_to_remote_id: dict[int, int] = {}
+
+    def _mirror(self, remote_worksheet: ps.Worksheet) -> MirroredWorksheet:
+        local_worksheet = self.local.worksheet_by_title(
+            remote_worksheet.title, sheet_id=remote_worksheet.id
+        )
+        self.local.importWorksheet(local_worksheet, remote_worksheet)
+        self._local_to_remote_id[local_worksheet.id] = remote_worksheet.id
+        return MirroredWorksheet(local_worksheet, remote_worksheet, self._forwarder)
+
+    def worksheet_by_title(self, title: str) -> MirroredWorksheet:
+        return self._mirror(self.remote.worksheet_by_title(title))
+
+    @property
+    def sheet1(self) -> MirroredWorksheet:
+        return self._mirror(self.remote.sheet1)
+
+    def _toRemote(self, obj):
+        """Swap local sheet ids in a request for the Google Sheets ones"""
+        if type(obj) is dict:
+            return {
+                k: self._local_to_remote_id.get(v, v) if k == "sheetId" else self._toRemote(v)
+                for k, v in obj.items()
+            }
+        if type(obj) is list:
+            return [self._toRemote(v) for v in obj]
+        return obj
+
+    def custom_request(self, request: BatchRequest | list[BatchRequest], fields=None, **kwargs):
+        result = self.local.custom_request(request, fields, **kwargs)
+        self._forwarder.submit(
+            self.remote.custom_request, self._toRemote(request), fields, **kwargs
+        )
+        return result
+
+    def getMirrorQueueDepth(self) -> int:
+        return self._forwarder.qsize()
+
+
+def _timed(worksheet: str, operation: str, fn: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    ok = False
+    try:
+        result = fn(*args, **kwargs)
+        ok = True
+        return result
+    finally:
+        metrics.recordCall(worksheet, operation, time.perf_counter() - start, ok)
+
+
+class InstrumentedCell:
+    def __init__(self, worksheet: "InstrumentedWorksheet", cell):
+        self._worksheet = worksheet
+        self._cell = cell
+
+    @property
+    def value(self) -> str:
+        return self._cell.value
+
+    def set_value(self, value):
+        _timed(self._worksheet.title, "cell.set_value", self._cell.set_value, value)
+
+    def set_text_format(self, attribute, value):
+        _timed(
+            self._worksheet.title,
+            "cell.set_text_format",
+            self._cell.set_text_format,
+            attribute,
+            value,
+        )
+
+
+class InstrumentedWorksheet:
+    """Counts and times every call made on a worksheet of any backend, see metrics"""
+
+    kFREE = ("title", "id", "rows", "cols")  # cached, no request behind them
+
+    def __init__(self, worksheet: Worksheet):
+        self._worksheet = worksheet
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._worksheet, name)
+        if name in InstrumentedWorksheet.kFREE or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return _timed(self._worksheet.title, name, attr, *args, **kwargs)
+
+        return call
+
+    def growGrid(self, rows: int = 0, cols: int = 0):
+        growGrid(self._worksheet, rows, cols)
+
+    def cell(self, addr) -> InstrumentedCell:
+        return InstrumentedCell(
+            self, _timed(self._worksheet.title, "cell", self._worksheet.cell, addr)
+        )
+
+
+class InstrumentedSpreadsheet:
+    def __init__(self, spreadsheet: Spreadsheet):
+        self._spreadsheet = spreadsheet
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._spreadsheet, name)
+
+    def worksheet_by_title(self, title: str) -> InstrumentedWorksheet:
+        return InstrumentedWorksheet(
+            _timed(title, "open", self._spreadsheet.worksheet_by_title, title)
+        )
+
+    @property
+    def sheet1(self) -> InstrumentedWorksheet:
+        return InstrumentedWorksheet(
+            _timed("sheet1", "open", lambda: self._spreadsheet.sheet1)
+        )
+
+    def custom_request(self, request: BatchRequest | list[BatchRequest], fields=None, **kwargs):
+        return _timed(
+            "*", "custom_request", self._spreadsheet.custom_request, request, fields, **kwargs
+        )
+
+
+if __name__ == "__main__":
+    # copy the Google Sheet into a fresh SQLite database (SQLITE_PATH)
+    remote = ps.authorize(service_file="creds.json").open_by_url(os.getenv("SHEET_URL"))
+    local = SqliteSpreadsheet(os.getenv("SQLITE_PATH", "contest.db"))
+    for remote_worksheet in remote.worksheets():
+        local_worksheet = local.worksheet_by_title(
+            remote_worksheet.title, sheet_id=remote_worksheet.id
+        )
+        copied = local.importWorksheet(local_worksheet, remote_worksheet)
+        print(remote_worksheet.title, "copied" if copied else "already there, skipped")
@@ -0,0 +1,174 @@
+from collections import Counter, defaultdict
+import threading
+import time
+
+from storage import Worksheet
+
+from tail import readNewRows
+from writer import Writer
+
+
+class Submissions:
+    """
+    In-memory view of the `submissions` worksheet.
+
+    The sheet is downloaded once, after which only rows appended since the
+    last read are fetched. Records are indexed by (team, problem) and every
+    team keeps a set of the problems it has solved.
+
+    Thread-safe: one thread at a time fetches new rows, and callers that find a
+    fetch in flight answer from what's already cached rather than wait for it.
+    """
+
+    kSYNC_DELAY = 2  # how often to look for rows appended by other workers
+
+    def __init__(self, submissions: Worksheet, writer: Writer):
+        self.submissions = submissions
+        self._writer = writer
+        self._header: list[str] = []
+        self._loaded = False  # the whole sheet has been read once
+        self._next_row = 1  # first sheet row we haven't read yet
+        self._last_sync_time = 0.0
+        self._records: list[dict[str, str]] = []
+        self._by_team_problem: dict[tuple[str, str], list[dict[str, str]]] = (
+            defaultdict(list)
+        )
+        self._solved: dict[str, set[str]] = defaultdict(set)
+        # rows we appended ourselves that the sheet hasn't handed back yet
+        self._pending: Counter[tuple[str, str, str]] = Counter()
+        self._lock = threading.Lock()  # records and pending
+        self._sync_lock = threading.Lock()  # one fetch at a time
+
+    def _key(self, record: dict[str, str]) -> tuple[str, str, str]:
+        return (record["team-name"], record["problem"], record["result"])
+
+    def _toRecord(self, row: list) -> dict[str, str]:
+        row = [str(v) for v in row]
+        row.extend([""] * (len(self._header) - len(row)))
+        record = dict(zip(self._header, row))
+        # we write str(bool), the sheet hands back TRUE/FALSE
+        record["result"] = record.get("result", "").upper()
+        record.setdefault("team-name", "")
+        record.setdefault("problem", "")
+        return record
+
+    def _ingest(self, record: dict[str, str]):
+        self._records.append(record)
+        team, problem, result = self._key(record)
+        self._by_team_problem[(team, problem)].append(record)
+        if result == "TRUE":
+            self._solved[team].add(problem)
+
+    def _ingestRows(self, rows: list[list]):
+        with self._lock:
+            self._ingestRowsLocked(rows)
+
+    def _ingestRowsLocked(self, rows: list[list]):
+        for row in rows:
+            if not any(str(v) for v in row):
+                continue
+            record = self._toRecord(row)
+            key = self._key(record)
+            if self._pending[key] > 0:  # already recorded by append()
+                self._pending[key] -= 1
+                if self._pending[key] == 0:
+                    del self._pending[key]
+                continue
+            self._ingest(record)
+
+    def _isFresh(self) -> bool:
+        return (
+            self._loaded
+            and time.time() - self._last_sync_time < Submissions.kSYNC_DELAY
+        )
+
+    def sync(self, force: bool = False):
+        """Pull in any rows appended to the sheet since the last read"""
+        if not force and self._isFresh():
+            return
+        # only the first download (and a forced sync) is worth waiting for
+        if not self._sync_lock.acquire(blocking=force or not self._loaded):
+            return
+        try:
+            if force or not self._isFresh():
+                self._sync()
+        finally:
+            self._sync_lock.release()
+
+    def _sync(self):
+        self._last_sync_time = time.time()
+        if not len(self._header):
+            values = self.submissions.get_all_values(
+                include_tailing_empty=False, include_tailing_empty_rows=False
+            )
+            if not len(values) or not len(values[0]):
+                return
+            with self._lock:
+                self._header = [str(h) for h in values[0]]
+                self._ingestRowsLocked(values[1:])
+                self._next_row = len(values) + 1
+            self._loaded = True
+            return
+
+        rows, self._next_row = readNewRows(
+            self.submissions, self._next_row, len(self._header)
+        )
+        self._ingestRows(rows)
+
+    def dumpState(self) -> dict | None:
+        """What loadState needs to pick up where this left off, None if never synced"""
+        with self._lock:
+            if not len(self._header):
+                return None
+            header = list(self._header)
+            # only what the sheet has: our rows still on their way may never get
+            # there, and whoever loads this reads them back if they do
+            unwritten = Counter(self._pending)
+            rows = []
+            for record in reversed(self._records):
+                key = self._key(record)
+                if unwritten[key] > 0:
+                    unwritten[key] -= 1
+                    continue
+                rows.append([record.get(h, "") for h in header])
+            rows.reverse()
+            return {
+                "synced_at": self._last_sync_time,
+                "next_row": self._next_row,
+                "header": header,
+                "rows": rows,
+            }
+
+    def loadState(self, state: dict):
+        self._header = state["header"]
+        for row in state["rows"]:
+            self._ingest(self._toRecord(row))
+        self._next_row = state["next_row"]
+        self._last_sync_time = state["synced_at"]
+        self._loaded = True
+
+    def append(self, row: list[str]):
+        """Queue `row` for the sheet and record it locally right away"""
+        self.sync()
+        record = self._toRecord(row)
+        # pending before it's queued, or a sync could read it back and count it twice
+        with self._lock:
+            self._pending[self._key(record)] += 1
+            self._ingest(record)
+        self._writer.append(self.submissions, row)
+
+    def hasSolved(self, team_name: str, problem: str) -> bool:
+        self.sync()
+        return problem in self._solved.get(team_name, set())
+
+    def hasSubmitted(self, team_name: str, problem: str) -> bool:
+        self.sync()
+        return len(self._by_team_problem.get((team_name, problem), [])) > 0
+
+    def getSolved(self, team_name: str) -> set[str]:
+        self.sync()
+        return set(self._solved.get(team_name, set()))
+
+    def getRecords(self, team_name: str, problem: str) -> list[dict[str, str]]:
+        self.sync()
+        return list(self._by_team_problem.get((team_name, problem), []))
@@ -0,0 +1,38 @@
+from storage import Worksheet
+
+
+def readNewRows(
+    worksheet: Worksheet, next_row: int, width: int
+) -> tuple[list[list], int]:
+    """
+    Read the rows of `worksheet` from `next_row` onwards (first `width` columns).
+
+    Returns the rows read and the next row to read from, so callers can keep a
+    cursor and only ever download rows appended since their last read.
+    """
+    rows = []
+    refreshed = False
+    while True:
+        if next_row > worksheet.rows:
+            # read up to the grid size as we last saw it, but other workers may
+            # have appended past it since (Sheets rejects ranges past the grid)
+            if refreshed:
+                break
+            worksheet.refresh()
+            refreshed = True
+            if next_row > worksheet.rows:
+                break
+        last_row = worksheet.rows
+        values = worksheet.get_values(
+            (next_row, 1),
+            (last_row, width),
+            include_tailing_empty=False,
+            include_tailing_empty_rows=False,
+        )
+        if values == [[]] or not len(values):
+            break
+        rows.extend(values)
+        next_row += len(values)
+        if next_row <= last_row:
+            break  # reached the empty tail of the sheet
+    return rows, next_row
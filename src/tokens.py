@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+
+from scheduler import Priority, QuotaExhausted, priority
+from storage import Worksheet
+
+
+class Tokens:
+    """
+    In-memory token <-> team index of the `tokens` worksheet.
+
+    Loaded once and updated in place when we create a team. A lookup that misses
+    reloads the sheet (at most every `kMISS_DELAY` seconds, at LOW priority) in
+    case another worker created the team, and a token or team that still isn't
+    there isn't looked for again for `kMISS_TTL` seconds, so junk lookups can't
+    spend the read quota judging needs. Thread-safe: (re)loads and additions
+    happen one at a time under a lock, lookups read whichever dicts are current.
+    """
+
+    kMISS_DELAY = 2  # min seconds between reloads caused by lookup misses
+    kMISS_TTL = 10  # seconds a lookup that missed after a reload stays a miss
+    kMAX_MISSES = 10_000  # misses remembered at once
+
+    def __init__(self, tokens: Worksheet):
+        self.tokens = tokens
+        self._token_to_team: dict[str, str] = {}
+        self._team_to_token: dict[str, str] = {}
+        self._loaded = False
+        self._load_time = 0.0
+        self._lock = threading.Lock()
+        self._miss_lock = threading.Lock()  # one reload for misses at a time
+        # ("token" | "team", key) -> when a reload last failed to find it
+        self._misses: dict[tuple[str, str], float] = {}
+
+    def load(self):
+        """(Re)download the tokens worksheet"""
+        with self._lock:
+            self._load()
+
+    def _fetch(self) -> tuple[dict[str, str], dict[str, str]]:
+        """(token -> team, team -> first token) as on the sheet"""
+        values = self.tokens.get_all_values(
+            include_tailing_empty=False, include_tailing_empty_rows=False
+        )
+        token_to_team = {}
+        team_to_token = {}
+        for row in values[1:]:  # Team Name, Token
+            if len(row) < 2 or row[1] == "":
+                continue
+            team, token = str(row[0]), str(row[1])
+            token_to_team[token] = team
+            team_to_token.setdefault(team, token)
+        return token_to_team, team_to_token
+
+    def _load(self):
+        self._token_to_team, self._team_to_token = self._fetch()
+        self._loaded = True
+        self._load_time = time.time()
+
+    def dumpState(self) -> dict | None:
+        """What loadState needs to pick up where this left off, None if never loaded"""
+        if not self._loaded:
+            return None
+        return {"loaded_at": self._load_time, "tokens": list(self._token_to_team.items())}
+
+    def loadState(self, state: dict):
+        token_to_team = {}
+        team_to_token = {}
+        for token, team in state["tokens"]:
+            token_to_team[token] = team
+            team_to_token.setdefault(team, token)
+        self._token_to_team = token_to_team
+        self._team_to_token = team_to_token
+        self._loaded = True
+        self._load_time = state["loaded_at"]
+
+    def _ensureLoaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+
+    def _reloadOnMiss(self, kind: str, key: str):
+        missed_at = self._misses.get((kind, key))
+        if missed_at is not None and time.time() - missed_at < Tokens.kMISS_TTL:
+            return
+        # misses that arrive together wait for one reload instead of each doing their own
+        with self._miss_lock:
+            if time.time() - self._load_time >= Tokens.kMISS_DELAY:
+                try:
+                    with priority(Priority.LOW, override=True):
+                        token_to_team, team_to_token = self._fetch()
+                except QuotaExhausted:
+                    logging.warning(f"TOKENS: no quota to look for {kind} {key!r}")
+                    return
+                with self._lock:
+                    # outside the lock while fetching, so keep what was added meanwhile
+                    for team, token in self._team_to_token.items():
+                        team_to_token.setdefault(team, token)
+                    self._token_to_team = {**self._token_to_team, **token_to_team}
+                    self._team_to_token = team_to_token
+                    self._load_time = time.time()
+            found = self._token_to_team if kind == "token" else self._team_to_token
+            if key not in found:
+                if len(self._misses) >= Tokens.kMAX_MISSES:
+                    self._misses.clear()
+                self._misses[(kind, key)] = time.time()
+
+    def add(self, team_name: str, token: str):
+        self._ensureLoaded()
+        with self._lock:
+            self._token_to_team[token] = team_name
+            self._team_to_token.setdefault(team_name, token)
+
+    def hasTeam(self, team_name: str) -> bool:
+        self._ensureLoaded()
+        return team_name in self._team_to_token
+
+    def hasToken(self, token: str) -> bool:
+        self._ensureLoaded()
+        return token in self._token_to_team
+
+    def getTeam(self, token: str) -> str | None:
+        self._ensureLoaded()
+        if token not in self._token_to_team:
+            self._reloadOnMiss("token", token)
+        return self._token_to_team.get(token, None)
+
+    def getToken(self, team_name: str) -> str | None:
+        self._ensureLoaded()
+        if team_name not in self._team_to_token:
+            self._reloadOnMiss("team", team_name)
+        return self._team_to_token.get(team_name, None)
@@ -0,0 +1,141 @@
+from collections import defaultdict
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from storage import Worksheet
+
+
+class Writer:
+    """
+    Write-behind queue for row appends.
+
+    Rows are buffered per worksheet by a background thread and flushed with a
+    single `append_table` call every `kFLUSH_INTERVAL` seconds, or as soon as a
+    worksheet has `kFLUSH_ROWS` rows waiting. Callers never wait on Sheets
+    unless the queue is full, in which case `append` blocks until there's room.
+
+    A worksheet whose append fails keeps its rows, in order, and is retried with
+    exponential backoff until the append goes through.
+    """
+
+    kFLUSH_INTERVAL = 0.5  # seconds between flushes
+    kFLUSH_ROWS = 50  # flush a worksheet early once this many rows are waiting
+    kMAX_QUEUE = 10_000  # max rows waiting to be written
+    kMAX_BACKOFF = 60  # seconds between retries of a failing worksheet
+
+    def __init__(self):
+        # rows to append, flush() barriers, or None to wake the thread on close
+        self._queue: queue.Queue[
+            tuple[Worksheet, list] | threading.Event | None
+        ] = queue.Queue(maxsize=Writer.kMAX_QUEUE)
+        self._worksheets: dict[str, Worksheet] = {}
+        self._buffers: dict[str, list[list]] = defaultdict(list)
+        # title -> (failed appends in a row, when to try again)
+        self._failures: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()  # buffers, read by other threads for stats
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="sheet-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, worksheet: Worksheet, row: list):
+        """Queue `row` to be appended to `worksheet`"""
+        self._queue.put((worksheet, row))
+
+    def flush(self, timeout: float = 10) -> bool:
+        """Block until everything queued before this call has been written (or retried)"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def getQueueDepth(self) -> dict:
+        with self._lock:
+            buffered = {title: len(rows) for title, rows in self._buffers.items()}
+        return {
+            "queued": self._queue.qsize(),
+            "buffered": buffered,
+            "total": self._queue.qsize() + sum(buffered.values()),
+        }
+
+    def _bufferedRows(self) -> int:
+        with self._lock:
+            return sum(len(rows) for rows in self._buffers.values())
+
+    def _buffer(self, title: str, row: list) -> int:
+        """Add `row` to `title`'s buffer, returns how many rows are in it"""
+        with self._lock:
+            self._buffers[title].append(row)
+            return len(self._buffers[title])
+
+    def _flush(self, title: str):
+        attempts, retry_at = self._failures.get(title, (0, 0.0))
+        if time.time() < retry_at:
+            return
+        with self._lock:
+            rows = self._buffers[title]
+            if not len(rows):
+                return
+            self._buffers[title] = []
+        try:
+            self._worksheets[title].append_table(rows, overwrite=True)  # type: ignore
+        except Exception:
+            attempts += 1
+            wait = min(Writer.kFLUSH_INTERVAL * 2**attempts, Writer.kMAX_BACKOFF)
+            logging.exception(
+                f"WRITER: couldn't append {len(rows)} rows to {title}, retrying in {wait}s"
+            )
+            self._failures[title] = (attempts, time.time() + wait)
+            # put them back in front so ordering survives the retry
+            with self._lock:
+                self._buffers[title] = rows + self._buffers[title]
+            return
+        self._failures.pop(title, None)
+
+    def _flushAll(self):
+        with self._lock:
+            titles = list(self._buffers.keys())
+        for title in titles:
+            self._flush(title)
+
+    def _run(self):
+        deadline = time.time() + Writer.kFLUSH_INTERVAL
+        while True:
+            if self._bufferedRows() >= Writer.kMAX_QUEUE:
+                # upstream is failing, stop draining so append() pushes back
+                time.sleep(Writer.kFLUSH_INTERVAL)
+                self._flushAll()
+                continue
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                item = None
+            if isinstance(item, threading.Event):
+                self._flushAll()
+                item.set()
+            elif item is not None:
+                worksheet, row = item
+                self._worksheets[worksheet.title] = worksheet
+                if self._buffer(worksheet.title, row) >= Writer.kFLUSH_ROWS:
+                    self._flush(worksheet.title)
+            if time.time() >= deadline:
+                self._flushAll()
+                deadline = time.time() + Writer.kFLUSH_INTERVAL
+            if self._stopping.is_set() and self._queue.empty():
+                self._flushAll()
+                return
+
+    def close(self, timeout: float = 10):
+        """Stop the background thread after writing everything still queued"""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(None)  # wake the thread up
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
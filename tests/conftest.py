@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+kSRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, kSRC)
+
+# read when the modules are imported, so set before any test imports them
+os.environ.update(
+    STORAGE="emulator",
+    POINTS='{"1a": 100, "1b": 200, "2a": 100}',
+    SECRET_HASH_APPEND="test",
+    CTF_BASE_SCORE="100",
+    CTF_USE_COEFF="True",
+    METRICS_DIR=tempfile.mkdtemp(prefix="acmmm-metrics-"),
+    LOG_JOURNAL=os.path.join(tempfile.mkdtemp(prefix="acmmm-journal-"), "journal.jsonl"),
+)
+
+
+@pytest.fixture
+def contest(tmp_path, monkeypatch):
+    """
+    A seeded emulator contest at tmp_path/contest.db with every shared file of a
+    worker in tmp_path, so workers opened in this test (and processes started
+    from it) share them with each other and nothing else.
+    """
+    from emulator import EmulatedSpreadsheet
+    from logger import Logger
+
+    db = str(tmp_path / "contest.db")
+    EmulatedSpreadsheet(path=db)  # seeds it
+    journal = str(tmp_path / "journal.jsonl")
+    for name, value in {
+        "EMULATOR_PATH": db,
+        "SCOREBOARD_SNAPSHOT": str(tmp_path / "scoreboard"),
+        "SCORE_EVENTS": str(tmp_path / "events"),
+        "CACHE_SNAPSHOT": str(tmp_path / "cache.bin"),
+        "SOLVES_LEDGER": str(tmp_path / "solves"),
+        "JOBS_DIR": str(tmp_path / "jobs"),
+        "LOG_JOURNAL": journal,
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(Logger, "kJOURNAL_PATH", journal)
+    monkeypatch.chdir(kSRC)  # Sheet reads ../assets
+    return db
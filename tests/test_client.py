@@ -0,0 +1,23 @@
+import pytest
+
+import client
+
+
+def test_open_is_retried_after_a_failure(contest, monkeypatch):
+    opened = []
+    open_spreadsheet = client.openSpreadsheet
+
+    def flaky(creds, url_env_path):
+        opened.append(url_env_path)
+        if len(opened) == 1:
+            raise ConnectionError("transient")
+        return open_spreadsheet(creds, url_env_path)
+
+    monkeypatch.setattr(client, "openSpreadsheet", flaky)
+    sheets = client.Client()
+    with pytest.raises(ConnectionError):
+        sheets.log.get_row(1)
+
+    assert sheets.log.get_row(1, include_tailing_empty=False)[:2] == ["time", "action"]
+    assert sheets.sheet is sheets.sheet
+    assert len(opened) == 2
@@ -0,0 +1,92 @@
+import os
+
+from events import Broadcaster, ScoreEvents, ScoreHistory
+
+
+def _score(events: ScoreEvents, version: int, team: str = "teama"):
+    events.append(
+        {
+            "type": "score",
+            "version": version,
+            "time": 0,
+            "team": team,
+            "event": "woc0",
+            "score": version,
+            "total": version,
+        }
+    )
+
+
+def _reset(events: ScoreEvents, version: int):
+    events.append(
+        {
+            "type": "sync",
+            "version": version,
+            "time": 0,
+            "teams": [],
+            "events": [],
+            "changes": [],
+            "reset": True,
+        }
+    )
+
+
+def test_since_across_snapshot_reset(tmp_path):
+    writer = ScoreEvents(str(tmp_path / "events"))
+    history = ScoreHistory(ScoreEvents(writer.path))
+    for version in range(1, 30):
+        _score(writer, version)
+    assert history.since(20, 29)["changes"] == [["teama", "woc0", 29]]
+
+    # a fresh snapshot starts counting versions again
+    _reset(writer, 1)
+    _score(writer, 2, "teamb")
+
+    assert history.since(1, 2) == {
+        "version": 2,
+        "teams": [],
+        "events": [],
+        "changes": [["teamb", "woc0", 2]],
+    }
+    # clients from before the reset have versions the history can't place
+    assert history.since(25, 2) is None
+    assert ScoreHistory(ScoreEvents(writer.path)).since(1, 2) == history.since(1, 2)
+
+
+def test_since_across_feed_rotation(tmp_path, monkeypatch):
+    monkeypatch.setattr(ScoreEvents, "kMAX_BYTES", 4000)
+    monkeypatch.setattr(ScoreEvents, "kKEEP_BYTES", 1000)
+    writer = ScoreEvents(str(tmp_path / "events"))
+    history = ScoreHistory(ScoreEvents(writer.path))
+    for version in range(1, 30):
+        _score(writer, version)
+    assert history.since(20, 29) is not None
+
+    for version in range(30, 200):
+        _score(writer, version)
+
+    assert os.path.getsize(writer.path) <= ScoreEvents.kMAX_BYTES
+    assert history.since(195, 199)["changes"] == [["teama", "woc0", 199]]
+    assert history.since(20, 199) is None  # rotated away
+
+
+def test_broadcaster_caps_subscribers(tmp_path, monkeypatch):
+    monkeypatch.setattr(Broadcaster, "kMAX_SUBSCRIBERS", 2)
+    monkeypatch.setattr(Broadcaster, "kPOLL_INTERVAL", 0.01)
+    events = ScoreEvents(str(tmp_path / "events"))
+    broadcaster = Broadcaster(ScoreEvents(events.path), lambda: {"version": 0})
+    first, second = broadcaster.subscribe(), broadcaster.subscribe()
+    for subscriber in (first, second):
+        assert subscriber.get(timeout=1) == ("scoreboard", {"version": 0})
+    assert broadcaster.subscribe() is None
+
+    broadcaster.unsubscribe(second)
+    third = broadcaster.subscribe()
+    assert third is not None
+    assert third.get(timeout=1)[0] == "scoreboard"
+
+    _score(events, 1)
+    for subscriber in (first, third):
+        name, record = subscriber.get(timeout=5)
+        assert name == "score" and record["version"] == 1
+    assert second.empty()
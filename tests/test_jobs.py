@@ -0,0 +1,49 @@
+import threading
+import time
+
+from jobs import Jobs
+
+
+def _drained(jobs: Jobs, timeout: float = 5) -> bool:
+    """Whether every job finished, results are written just before they're counted"""
+    deadline = time.time() + timeout
+    while jobs.getQueueDepth() and time.time() < deadline:
+        time.sleep(0.01)
+    return jobs.getQueueDepth() == 0
+
+
+def test_results_are_readable_from_any_worker(tmp_path):
+    jobs = Jobs(str(tmp_path))
+    other_worker = Jobs(str(tmp_path))
+    release = threading.Event()
+
+    job_id = jobs.submit(lambda a, b: release.wait(5) and a + b, 1, 2)
+    assert other_worker.get(job_id)["status"] in ("queued", "running")
+    assert jobs.getQueueDepth() == 1
+    release.set()
+    assert other_worker.get(job_id, wait=5) == {"status": "done", "result": 3}
+    assert _drained(jobs)
+
+    def broken():
+        raise ValueError("no such input")
+
+    failed = jobs.get(jobs.submit(broken), wait=5)
+    assert failed == {"status": "error", "message": "no such input"}
+
+
+def test_refuses_jobs_past_the_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(Jobs, "kMAX_PENDING", 1)
+    jobs = Jobs(str(tmp_path))
+    release = threading.Event()
+    job_id = jobs.submit(release.wait, 5)
+    assert jobs.submit(release.wait, 5) is None
+    release.set()
+    assert jobs.get(job_id, wait=5)["status"] == "done"
+    assert _drained(jobs)
+    assert jobs.submit(release.wait, 5) is not None
+
+
+def test_unknown_job_ids(tmp_path):
+    jobs = Jobs(str(tmp_path))
+    assert jobs.get("0" * 32) is None
+    assert jobs.get("../" + "0" * 29) is None
@@ -0,0 +1,47 @@
+from emulator import EmulatedSpreadsheet, answerFor
+from judge import Judge
+from solves import SharedSolves
+from submissions import Submissions
+from writer import Writer
+
+
+def _judge(tmp_path) -> tuple[Judge, EmulatedSpreadsheet]:
+    spreadsheet = EmulatedSpreadsheet(path=str(tmp_path / "contest.db"))
+    problems = [spreadsheet.worksheet_by_title(f"p{p}") for p in range(1, 6)]
+    submissions = Submissions(spreadsheet.worksheet_by_title("submissions"), Writer())
+    judge = Judge(problems, submissions, SharedSolves(str(tmp_path / "solves")))
+    spreadsheet.resetCalls()
+    return judge, spreadsheet
+
+
+def _answerKeyReads(spreadsheet: EmulatedSpreadsheet) -> int:
+    return sum(
+        n for (title, op), n in spreadsheet.getCalls().items() if title[0] == "p" and op == "get_all_values"
+    )
+
+
+def test_answers_come_from_the_preloaded_keys(tmp_path):
+    judge, spreadsheet = _judge(tmp_path)
+
+    for i in range(20):
+        assert judge.getJudgement("2b", i, answerFor(2, "b", i), "teama") is True
+        assert judge.getJudgement("3a", i, "wrong", "teamb") is False
+    assert _answerKeyReads(spreadsheet) == 5  # each key once
+
+    assert judge.submissions.hasSolved("teama", "2b")
+    assert not judge.submissions.hasSolved("teamb", "3a")
+
+
+def test_unknown_problems_are_not_judged(tmp_path):
+    judge, spreadsheet = _judge(tmp_path)
+    assert judge.hasProblem("1a")
+
+    for _ in range(20):
+        assert judge.getJudgement("9a", 0, "out", "teama") is None
+        assert judge.getJudgement("1a", 5000, "out", "teama") is None
+        assert judge.getJudgement("nope", 0, "out", "teama") is None
+    assert not judge.hasProblem("9a")
+    # the first miss may reload the keys in case they changed, not every one
+    assert _answerKeyReads(spreadsheet) == 10
+    assert not judge.submissions.hasSubmitted("teama", "9a")
+    assert not judge.submissions.hasSubmitted("teama", "1a")
@@ -0,0 +1,67 @@
+import numpy as np
+
+from events import ScoreEvents, ScoreHistory
+from leaderboard import Leaderboard
+from snapshot import ScoreboardSnapshot
+
+
+def _snapshot(seq: int, teams: list[str], scores: list[list[int]]) -> ScoreboardSnapshot:
+    events = [f"woc{i}" for i in range(len(scores))]
+    return ScoreboardSnapshot(
+        seq=seq,
+        fetched_at=0.0,
+        modified_at=0.0,
+        teams=teams,
+        events=events,
+        scores=np.array(scores, dtype=np.int64),
+        team_idx={team: idx for idx, team in enumerate(teams)},
+        event_idx={event: idx for idx, event in enumerate(events)},
+    )
+
+
+def _score(events: ScoreEvents, version: int, team: str, total: int):
+    events.append(
+        {
+            "type": "score",
+            "version": version,
+            "time": 0,
+            "team": team,
+            "event": "woc0",
+            "score": total,
+            "total": total,
+        }
+    )
+
+
+def test_ranks_follow_score_changes(tmp_path):
+    events = ScoreEvents(str(tmp_path / "events"))
+    leaderboard = Leaderboard(ScoreHistory(ScoreEvents(events.path)))
+    teams = ["teama", "teamb", "teamc"]
+    leaderboard.sync(_snapshot(1, teams, [[10, 5, 5]]))
+    assert [leaderboard.getRank(team) for team in teams] == [1, 2, 2]  # ties share
+    assert leaderboard.getTop(2) == [
+        {"rank": 1, "team": "teama", "total": 10},
+        {"rank": 2, "team": "teamb", "total": 5},
+    ]
+
+    _score(events, 2, "teamc", 20)
+    _score(events, 3, "teamb", 7)
+    # totals come from the changes, not from re-summing the scoreboard
+    leaderboard.sync(_snapshot(3, teams, [[10, 5, 5]]))
+    assert leaderboard.getVersion() == 3
+    assert [leaderboard.getRank(team) for team in teams] == [2, 3, 1]
+    assert leaderboard.getTotal("teamc") == 20
+    assert leaderboard.getRank("teamd") is None
+
+
+def test_rebuilds_when_the_history_has_a_gap(tmp_path):
+    events = ScoreEvents(str(tmp_path / "events"))
+    leaderboard = Leaderboard(ScoreHistory(ScoreEvents(events.path)))
+    teams = ["teama", "teamb"]
+    leaderboard.sync(_snapshot(1, teams, [[10, 5]]))
+
+    _score(events, 3, "teamb", 50)  # version 2 never made it to the feed
+    leaderboard.sync(_snapshot(3, teams, [[10, 30], [0, 1]]))
+    assert leaderboard.getVersion() == 3
+    assert leaderboard.getTotal("teamb") == 31
+    assert leaderboard.getTop(1)[0]["team"] == "teamb"
@@ -0,0 +1,51 @@
+import os
+import time
+
+from emulator import EmulatedSpreadsheet
+from logger import Logger
+from snapshot import SharedLock
+
+
+class LogClient:
+    """The part of Client the Logger uses"""
+
+    def __init__(self, path: str):
+        spreadsheet = EmulatedSpreadsheet(path=path)
+        self.scoreboard = spreadsheet.sheet1
+        self.log = spreadsheet.worksheet_by_title("log")
+
+
+def _logged(path: str) -> list[str]:
+    values = EmulatedSpreadsheet(path=path).worksheet_by_title("log").get_all_values(
+        include_tailing_empty=False, include_tailing_empty_rows=False
+    )
+    return [row[7] for row in values[1:]]
+
+
+def test_journal_is_emptied_once_exported(contest, monkeypatch):
+    monkeypatch.setattr(Logger, "kTRUNCATE_BYTES", 1000)
+    logger = Logger(LogClient(contest))
+    for i in range(20):
+        logger.log("adjustScore", team="teama", detail=str(i))
+    assert logger.flush()
+    assert os.path.getsize(Logger.kJOURNAL_PATH) == 0
+
+    for i in range(20, 25):
+        logger.log("adjustScore", team="teama", detail=str(i))
+    logger.close()
+    assert _logged(contest) == [str(i) for i in range(25)]
+    assert os.path.getsize(Logger.kJOURNAL_PATH) > 0  # too small to bother
+
+
+def test_close_gives_up_on_a_stuck_exporter(contest):
+    logger = Logger(LogClient(contest))
+    logger.log("adjustScore", team="teama", detail="0")
+    stuck = SharedLock(Logger.kJOURNAL_PATH + ".lock")  # another worker, mid-export
+    stuck.acquire()
+    try:
+        start = time.time()
+        logger.close(timeout=0.5)
+        assert time.time() - start < 5
+    finally:
+        stuck.release()
+    assert _logged(contest) == []
@@ -0,0 +1,41 @@
+import os
+
+from metrics import Registry
+
+
+def _registry(directory: str) -> tuple:
+    registry = Registry(directory)
+    calls = registry.counter("calls_total", "Calls", ("worksheet", "outcome"))
+    backlog = registry.gauge("backlog", "Rows waiting")
+    latency = registry.histogram("call_seconds", "Latency", buckets=(0.1, 1.0))
+    return registry, calls, backlog, latency
+
+
+def test_render_adds_up_every_worker(tmp_path):
+    other, calls, backlog, latency = _registry(str(tmp_path))
+    calls.inc("log", "ok", amount=2)
+    backlog.set(3)
+    latency.observe(0.5)
+    other.dump(force=True)
+    # as if it came from another process
+    os.replace(tmp_path / f"{os.getpid()}.json", tmp_path / "1.json")
+
+    registry, calls, backlog, latency = _registry(str(tmp_path))
+    calls.inc("log", "ok")
+    calls.inc('sheet "1"', "error")
+    backlog.set(4)
+    latency.observe(0.05)
+    latency.observe(5)
+    (tmp_path / "2.json").write_text("{not json")  # a worker mid-write
+
+    lines = registry.render().splitlines()
+    assert 'calls_total{worksheet="log",outcome="ok"} 3' in lines
+    assert 'calls_total{worksheet="sheet \\"1\\"",outcome="error"} 1' in lines
+    assert "backlog 7" in lines
+    assert [line for line in lines if line.startswith("call_seconds")] == [
+        'call_seconds_bucket{le="0.1"} 1',
+        'call_seconds_bucket{le="1"} 2',
+        'call_seconds_bucket{le="+Inf"} 3',
+        "call_seconds_sum 5.55",
+        "call_seconds_count 3",
+    ]
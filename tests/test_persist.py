@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+
+from persist import CacheFile
+
+
+def _newSheet():
+    from sheet import Sheet
+
+    return Sheet()
+
+
+def test_restart_serves_from_the_cache_file(contest):
+    sheet = _newSheet()
+    assert sheet.waitCaughtUp(60)
+    sheet.adjustScore("woc1", "teamb", 7)
+    token = sheet.getTokenFromTeam("teamb")
+    sheet.saveCaches()
+    os.unlink(os.environ["SCOREBOARD_SNAPSHOT"])  # the machine rebooted
+
+    restarted = _newSheet()
+    assert restarted.isReady()  # before it has heard from the sheet
+    assert restarted.getScore("teamb", "woc1") == 7
+    assert restarted.getTokenFromTeam("teamb") == token
+    assert restarted.waitCaughtUp(60)
+    assert restarted.getScore("teamb", "woc1") == 7
+
+
+def test_restored_scoreboard_is_never_written_back(contest):
+    sheet = _newSheet()
+    assert sheet.waitCaughtUp(60)
+    snapshot = sheet._snapshot.read()
+    sheet._snapshot.lock()
+    try:  # a day-old scoreboard from the cache file
+        sheet._snapshot.publish(
+            snapshot.teams,
+            snapshot.events,
+            np.full_like(snapshot.scores, 999),
+            snapshot.fetched_at,
+            restored=True,
+        )
+    finally:
+        sheet._snapshot.unlock()
+
+    sheet.adjustScore("woc0", "teama", 5)
+    assert sheet._client.scoreboard.get_value((2, 2)) == "5"
+    assert not sheet._snapshot.read().restored
+
+
+def test_cache_file_ignores_other_formats(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    cache = CacheFile(path)
+    cache.save({"tokens": {"loaded_at": 1.0, "tokens": []}, "graph": None})
+    assert cache.load() == {"tokens": {"loaded_at": 1.0, "tokens": []}}
+
+    with open(path, "wb") as f:
+        f.write(b"ACMC1\n" + b"old")
+    assert cache.load() == {}
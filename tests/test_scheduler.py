@@ -0,0 +1,59 @@
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+import pytest
+
+from scheduler import Priority, QuotaExhausted, Scheduler, currentPriority, priority
+
+
+@pytest.fixture
+def quota(tmp_path, monkeypatch):
+    """Buckets of their own, and deadlines short enough to run out in a test"""
+    monkeypatch.setenv("SHEETS_QUOTA_FILE", str(tmp_path / "quota"))
+    monkeypatch.setattr(
+        Scheduler, "kDEADLINE", {Priority.HIGH: 5.0, Priority.NORMAL: 0.5, Priority.LOW: 0.5}
+    )
+
+
+def test_low_priority_leaves_a_reserve(quota):
+    scheduler = Scheduler(reads_per_minute=10, writes_per_minute=10)
+    with priority(Priority.LOW):
+        for _ in range(5):
+            assert scheduler.call("write", lambda: "ok") == "ok"
+        with pytest.raises(QuotaExhausted):
+            scheduler.call("write", lambda: "ok")
+        assert scheduler.call("read", lambda: "ok") == "ok"  # a bucket of its own
+
+    with priority(Priority.HIGH):
+        for _ in range(5):
+            assert scheduler.call("write", lambda: "ok") == "ok"
+
+
+def test_priority_only_escalates_unless_overridden():
+    with priority(Priority.HIGH):
+        with priority(Priority.LOW):
+            assert currentPriority() == Priority.HIGH
+        with priority(Priority.LOW, override=True):
+            assert currentPriority() == Priority.LOW
+        assert currentPriority() == Priority.HIGH
+    assert currentPriority() == Priority.NORMAL
+
+
+def test_throttled_calls_are_retried(quota, monkeypatch):
+    scheduler = Scheduler(reads_per_minute=600, writes_per_minute=600)
+    monkeypatch.setattr(Scheduler, "kMAX_BACKOFF", 0.01)
+    calls = []
+
+    def throttledOnce():
+        calls.append(1)
+        if len(calls) == 1:
+            raise HttpError(Response({"status": 429}), b"")
+        return "ok"
+
+    def broken():
+        raise HttpError(Response({"status": 400}), b"")
+
+    with priority(Priority.HIGH):
+        assert scheduler.call("read", throttledOnce) == "ok"
+        assert len(calls) == 2
+        with pytest.raises(HttpError):  # only 429s are retried
+            scheduler.call("read", broken)
@@ -0,0 +1,146 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from emulator import answerFor, flagFor
+from storage import SqliteSpreadsheet
+
+kTIMEOUT = 60
+
+
+def _openSheet():
+    from sheet import Sheet
+
+    sheet = Sheet()
+    assert sheet.waitCaughtUp(kTIMEOUT)
+    sheet.getScoreboardState()
+    return sheet
+
+
+def _inWorkers(target, workers: int = 2) -> dict:
+    """Run target(barrier, results, idx) in `workers` fresh processes, returns {idx: result}"""
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=target, args=(barrier, results, idx)) for idx in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    out = dict(results.get(timeout=kTIMEOUT) for _ in processes)
+    for process in processes:
+        process.join(kTIMEOUT)
+        assert process.exitcode == 0
+    return out
+
+
+def _values(db: str, title: str) -> list[list[str]]:
+    return SqliteSpreadsheet(db).worksheet_by_title(title).get_all_values(
+        include_tailing_empty=False, include_tailing_empty_rows=False
+    )
+
+
+def _scores(db: str) -> dict[tuple[str, str], int]:
+    """(event, team) -> score, as on the scoreboard worksheet"""
+    header, *rows = _values(db, "Sheet1")
+    return {(row[0], team): int(score) for row in rows for team, score in zip(header[1:], row[1:])}
+
+
+def _createTeams(barrier, results, idx):
+    sheet = _openSheet()
+    barrier.wait()
+    created = sheet.createTeams([("alpha", "captain"), ("beta" + "ab"[idx], "captain")])
+    results.put((idx, [team["status"] for team in created]))
+
+
+def test_create_team_race_between_workers(contest):
+    statuses = _inWorkers(_createTeams)
+
+    assert sorted(s[0] for s in statuses.values()) == [200, 304]  # alpha
+    assert [s[1] for s in statuses.values()] == [200, 200]
+    header = _values(contest, "Sheet1")[0]
+    assert header.count("alpha") == 1
+    assert {"betaa", "betab"} <= set(header)
+    tokens = _values(contest, "tokens")[1:]
+    assert [row[0] for row in tokens] == header[1:]
+    assert len({row[1] for row in tokens}) == len(tokens)
+
+    # a worker started afterwards sees the same layout
+    snapshot = _openSheet()._snapshot.read()
+    assert ["-", *snapshot.teams] == header
+
+
+def _judge(barrier, results, idx):
+    sheet = _openSheet()
+    barrier.wait()
+    results.put((idx, sheet.getJudgement("1a", idx, answerFor(1, "a", idx), "teama")))
+
+
+def test_prior_solve_dedupe_between_workers(contest):
+    judgements = _inWorkers(_judge)
+
+    assert judgements == {0: True, 1: True}
+    assert _scores(contest)[("woc0", "teama")] == 100
+
+    sheet = _openSheet()
+    assert sheet.getJudgement("1a", 2, answerFor(1, "a", 2), "teama") is True
+    assert sheet.getJudgement("1b", 0, answerFor(1, "b", 0), "teama") is True
+    assert _scores(contest)[("woc0", "teama")] == 300
+
+
+def test_concurrent_score_changes_all_land(contest):
+    sheets = [_openSheet(), _openSheet()]
+
+    def adjust(sheet):
+        for i in range(20):
+            sheet.adjustScore("woc" + str(i % 2), "teama" if i % 3 else "teamb", 1)
+
+    threads = [threading.Thread(target=adjust, args=(sheet,)) for sheet in sheets * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    scores = _scores(contest)
+    assert sum(scores.values()) == 80
+    snapshot = sheets[0]._snapshot.read()
+    for (event, team), score in scores.items():
+        assert snapshot.scores[snapshot.event_idx[event], snapshot.team_idx[team]] == score
+
+
+def test_team_names_are_letters_only_even_with_woc(contest):
+    sheet = _openSheet()
+
+    assert sheet.createTeam("the woc crew", "Bob")["team_name"] == "thewoccrew"
+    assert sheet.createTeam("The WOC Crew!", "Bob")["status"] == 304
+    assert _values(contest, "Sheet1")[0].count("thewoccrew") == 1
+
+    assert sheet.isFlagCorrect("web", 0, flagFor("web", 0), "the woc crew") is True
+    assert sheet.getTotal("thewoccrew") == 100
+
+
+def test_solve_is_released_when_its_points_cant_be_awarded(contest, monkeypatch):
+    sheet = _openSheet()
+    adjust_score = sheet.adjustScore
+    failing = [True]
+
+    def adjustScore(*args):
+        if failing[0]:
+            raise ConnectionError("quota exhausted")
+        return adjust_score(*args)
+
+    monkeypatch.setattr(sheet, "adjustScore", adjustScore)
+    assert sheet.getJudgement("1a", 0, answerFor(1, "a", 0), "teama") is False
+    with pytest.raises(ConnectionError):
+        sheet.isFlagCorrect("web", 0, flagFor("web", 0), "teama")
+    assert _scores(contest)[("woc0", "teama")] == 0
+
+    failing[0] = False
+    assert sheet.getJudgement("1a", 1, answerFor(1, "a", 1), "teama") is True
+    assert sheet.isFlagCorrect("web", 0, flagFor("web", 0), "teama") is True
+    assert _scores(contest)[("woc0", "teama")] == 100
+    assert _scores(contest)[("ctf", "teama")] == 100
+    # and only once
+    assert sheet.getJudgement("1a", 2, answerFor(1, "a", 2), "teama") is True
+    assert _scores(contest)[("woc0", "teama")] == 100
@@ -0,0 +1,51 @@
+import numpy as np
+
+from snapshot import SharedLocks, SharedSnapshot
+
+
+def test_workers_see_each_others_snapshots_and_scores(tmp_path):
+    path = str(tmp_path / "scoreboard")
+    writer, reader = SharedSnapshot(path), SharedSnapshot(path)
+    assert reader.read() is None
+
+    scores = np.array([[1, 2, 3], [4, 5, 6]])
+    writer.lock()
+    try:
+        seq = writer.publish(["teama", "teamb", "teama"], ["woc0", "woc1"], scores, 100.0)
+    finally:
+        writer.unlock()
+    snapshot = reader.read()
+    assert snapshot.seq == seq
+    assert snapshot.team_idx == {"teama": 0, "teamb": 1}  # a name's first column
+    assert snapshot.event_idx == {"woc0": 0, "woc1": 1}
+    assert (snapshot.scores == scores).all()
+    assert reader.read() is snapshot  # nothing changed, nothing re-parsed
+
+    writer.lock()
+    try:
+        assert writer.setScore(1, 1, 50) == seq + 1
+    finally:
+        writer.unlock()
+    updated = reader.read()
+    assert updated.seq == seq + 1 and updated.scores[1, 1] == 50
+    assert updated.modified_at > updated.fetched_at == 100.0
+
+
+def test_shared_snapshot_lock_excludes_other_workers(tmp_path):
+    path = str(tmp_path / "scoreboard")
+    first, second = SharedSnapshot(path), SharedSnapshot(path)
+    assert first.lock(blocking=False)
+    assert not second.lock(blocking=False)
+    first.unlock()
+    assert second.lock(blocking=False)
+    second.unlock()
+
+
+def test_cell_locks_are_seen_by_other_workers(tmp_path):
+    path = str(tmp_path / "cells")
+    mine, theirs = SharedLocks(path), SharedLocks(path)
+    keys = ["woc0\tteama", "woc0\tteamb"]
+    with mine.hold(keys[0]):
+        assert mine.held(keys) == set()  # not to the thread holding it
+        assert theirs.held(keys) == {keys[0]}
+    assert theirs.held(keys) == set()
@@ -0,0 +1,37 @@
+import atexit
+
+import metrics
+from storage import Forwarder
+
+
+def test_forwarder_retries_until_the_write_goes_through(monkeypatch):
+    monkeypatch.setattr(Forwarder, "kMAX_BACKOFF", 0.01)
+    forwarder = Forwarder()
+    replayed = []
+
+    def flaky(value):
+        replayed.append(value)
+        if len(replayed) <= 5:  # Google down for a while
+            raise ConnectionError("unavailable")
+
+    forwarder.submit(flaky, "first")
+    forwarder.submit(replayed.append, "second")
+
+    assert forwarder.close(timeout=10)
+    assert replayed == ["first"] * 6 + ["second"]
+    assert "mirror_backlog 0" in metrics.registry.render()
+
+
+def test_forwarder_close_reports_what_is_left(monkeypatch):
+    monkeypatch.setattr(Forwarder, "kMAX_BACKOFF", 0.01)
+    forwarder = Forwarder()
+
+    def down():
+        raise ConnectionError("unavailable")
+
+    forwarder.submit(down)
+    forwarder.submit(down)
+
+    assert not forwarder.close(timeout=0.2)
+    assert forwarder.qsize() == 2
+    atexit.unregister(forwarder.close)  # still down at exit, don't wait on it
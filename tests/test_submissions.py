@@ -0,0 +1,75 @@
+import time
+
+from emulator import EmulatedSpreadsheet
+from submissions import Submissions
+from writer import Writer
+
+
+class FlakyWorksheet:
+    """`worksheet` whose appends fail until `up` is set"""
+
+    def __init__(self, worksheet):
+        self._worksheet = worksheet
+        self.title = worksheet.title
+        self.up = False
+        self.failures = 0
+
+    def append_table(self, *args, **kwargs):
+        if not self.up:
+            self.failures += 1
+            raise ConnectionError("unavailable")
+        return self._worksheet.append_table(*args, **kwargs)
+
+
+def _submission(team: str, result: bool = True) -> list[str]:
+    return ["0", team, "1a", str(result), "0", "out"]
+
+
+def test_writer_keeps_rows_until_the_append_goes_through(tmp_path, monkeypatch):
+    monkeypatch.setattr(Writer, "kFLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(Writer, "kMAX_BACKOFF", 0.02)
+    submissions = EmulatedSpreadsheet(path=str(tmp_path / "contest.db")).worksheet_by_title(
+        "submissions"
+    )
+    flaky = FlakyWorksheet(submissions)
+    writer = Writer()
+    writer.append(flaky, _submission("teama"))
+    writer.append(flaky, _submission("teamb"))
+
+    deadline = time.time() + 10
+    while flaky.failures < 30 and time.time() < deadline:  # used to drop them after 20
+        writer.flush()
+    flaky.up = True
+    time.sleep(Writer.kMAX_BACKOFF)
+    assert writer.flush()
+    writer.close()
+
+    values = submissions.get_all_values(include_tailing_empty=False, include_tailing_empty_rows=False)
+    assert [row[1] for row in values[1:]] == ["teama", "teamb"]
+
+
+def test_saved_state_leaves_out_rows_not_written_yet(tmp_path, monkeypatch):
+    monkeypatch.setattr(Writer, "kFLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(Writer, "kMAX_BACKOFF", 0.02)
+    path = str(tmp_path / "contest.db")
+    submissions = EmulatedSpreadsheet(path=path).worksheet_by_title("submissions")
+    flaky = FlakyWorksheet(submissions)
+    writer = Writer()
+    store = Submissions(flaky, writer)
+    store.submissions = submissions  # reads work, appends don't
+    store.append(_submission("teama"))
+    assert store.hasSolved("teama", "1a")
+
+    state = store.dumpState()
+    assert state["rows"] == []
+
+    # restarted while the row was still queued, and it got written after all
+    flaky.up = True
+    time.sleep(Writer.kMAX_BACKOFF)
+    assert writer.flush()
+    writer.close()
+    restarted = Submissions(EmulatedSpreadsheet(path=path).worksheet_by_title("submissions"), writer)
+    restarted.loadState(state)
+    assert restarted.getRecords("teama", "1a") == []
+    restarted.sync(force=True)
+    assert len(restarted.getRecords("teama", "1a")) == 1
@@ -0,0 +1,44 @@
+from googleapiclient.errors import HttpError
+import pytest
+
+from emulator import EmulatedSpreadsheet
+from tail import readNewRows
+
+
+def _submission(i: int) -> list[str]:
+    return ["0", "teama", "1a", "TRUE", str(i), "out"]
+
+
+def test_reads_rows_another_writer_appended(tmp_path):
+    path = str(tmp_path / "contest.db")
+    reader = EmulatedSpreadsheet(path=path).worksheet_by_title("submissions")
+    writer = EmulatedSpreadsheet(path=path).worksheet_by_title("submissions")
+    rows, next_row = readNewRows(reader, 2, 6)
+    assert rows == [] and next_row == 2
+
+    # past the grid the reader last saw
+    appended = [_submission(i) for i in range(250)]
+    writer.append_table(appended)
+    assert reader.rows < len(appended)
+
+    rows, next_row = readNewRows(reader, next_row, 6)
+    assert rows == appended
+    assert next_row == 2 + len(appended)
+
+    writer.append_table([_submission(250)])
+    rows, next_row = readNewRows(reader, next_row, 6)
+    assert rows == [_submission(250)]
+    assert readNewRows(reader, next_row, 6) == ([], next_row)
+
+
+def test_never_reads_past_the_grid(tmp_path):
+    submissions = EmulatedSpreadsheet(path=str(tmp_path / "contest.db")).worksheet_by_title(
+        "submissions"
+    )
+    submissions.append_table([_submission(i) for i in range(3)])
+    with pytest.raises(HttpError):
+        submissions.get_values((2, 1), (submissions.rows + 1, 6))
+
+    rows, next_row = readNewRows(submissions, 2, 6)
+    assert len(rows) == 3
+    assert readNewRows(submissions, next_row, 6) == ([], next_row)
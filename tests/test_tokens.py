@@ -0,0 +1,45 @@
+from emulator import EmulatedSpreadsheet, tokenFor
+from scheduler import Priority, currentPriority, priority
+from tokens import Tokens
+
+
+class RecordingWorksheet:
+    """`worksheet`, noting the priority every read runs at"""
+
+    def __init__(self, worksheet):
+        self._worksheet = worksheet
+        self.reads: list[Priority] = []
+
+    def get_all_values(self, *args, **kwargs):
+        self.reads.append(currentPriority())
+        return self._worksheet.get_all_values(*args, **kwargs)
+
+
+def test_misses_reload_at_low_priority_and_are_remembered(tmp_path, monkeypatch):
+    monkeypatch.setattr(Tokens, "kMISS_DELAY", 0)
+    path = str(tmp_path / "contest.db")
+    worksheet = RecordingWorksheet(EmulatedSpreadsheet(path=path).worksheet_by_title("tokens"))
+    tokens = Tokens(worksheet)
+    assert tokens.getTeam(tokenFor(0)) == "teama"
+    assert len(worksheet.reads) == 1
+
+    with priority(Priority.NORMAL):
+        for _ in range(100):
+            assert tokens.getTeam("junk") is None
+            assert tokens.getToken("junk") is None
+    assert worksheet.reads[1:] == [Priority.LOW, Priority.LOW]
+
+    # another worker's new team is still found on the first miss
+    EmulatedSpreadsheet(path=path).worksheet_by_title("tokens").append_table([["newteam", "newtoken"]])
+    assert tokens.getTeam("newtoken") == "newteam"
+    assert tokens.getToken("newteam") == "newtoken"
+    assert len(worksheet.reads) == 4
+
+
+def test_miss_reload_keeps_teams_added_meanwhile(tmp_path, monkeypatch):
+    monkeypatch.setattr(Tokens, "kMISS_DELAY", 0)
+    worksheet = EmulatedSpreadsheet(path=str(tmp_path / "contest.db")).worksheet_by_title("tokens")
+    tokens = Tokens(worksheet)
+    tokens.add("local", "localtoken")  # written to our sheet object only later
+    assert tokens.getTeam("junk") is None
+    assert tokens.getTeam("localtoken") == "local"